@@ -4,10 +4,10 @@
 # huge thank you!  Also many thanks to eterniti for sharing code with me to reference.
 #
 # This code includes functions to convert bones from local space to model space in bind pose, which will
-# be needed for modifying 4D meshes.  As such, it requires both numpy and pyquaternion.
+# be needed for modifying 4D meshes.  As such, it requires numpy (quaternion math is in lib_quaternion.py).
 #
-# These can be installed by:
-# /path/to/python3 -m pip install pyquaternion
+# This can be installed by:
+# /path/to/python3 -m pip install numpy
 #
 # Steps:
 # 1. Use Gust Tools to extract G1M from the .elixir.gz or gmpk file.
@@ -19,9 +19,9 @@
 # GitHub eArmada8/gust_stuff
 
 try:
-    import glob, os, io, sys, struct, copy, json, numpy
-    from pyquaternion import Quaternion
+    import glob, os, io, sys, struct, copy, json, time, traceback, collections, contextlib, multiprocessing, numpy
     from lib_fmtibvb import *
+    from lib_quaternion import *
 except ModuleNotFoundError as e:
     print("Python module missing! {}".format(e.msg))
     input("Press Enter to abort.")
@@ -30,6 +30,9 @@ except ModuleNotFoundError as e:
 # This script transforms cloth meshes (aka 4D meshes) by default, change the following line to False to disable
 transform_cloth_mesh_default = True
 
+# Decoded vertex buffers are cached during an export (see VertexBufferCache), up to this many bytes
+vb_cache_budget = 512 * 1024 * 1024
+
 # From GitHub/uyjulian's ED9 MDL parser, thank you
 def read_pascal_string(f):
     sz = int.from_bytes(f.read(1), byteorder="little")
@@ -62,6 +65,86 @@ def binary_oid_to_dict(oid_file):
                     bone_id += 1
     return({'oid_file': oid_file, 'headers': headers, 'bones': bones})
 
+# Memory-mapped G1M file.  The chunk table (magic, version, offset, size) is read once when the file is opened,
+# and chunks are served on demand as read-only memoryviews into the mapping instead of being copied out.
+# While a container is open in a with block, G1MContainer.open() on the same file returns that container,
+# so nested calls (e.g. build_g1m -> build_g1mg -> parseG1MforG1MG) share a single mapping and chunk index.
+# Chunk views keep the file mapped until they are freed, so data that outlives the with block must be copied out.
+class G1MContainer:
+    open_containers = {}
+
+    def __init__(self, g1m_filename):
+        self.filename = os.path.abspath(g1m_filename)
+        with open(self.filename, 'rb') as f: # Checked before mapping, so an exit here leaves nothing mapped
+            file_magic, = struct.unpack(">I", f.read(4))
+        if file_magic == 0x5F4D3147:
+            self.e = '<' # Little Endian
+        elif file_magic == 0x47314D5F:
+            self.e = '>' # Big Endian
+        else:
+            print("not G1M!") # Figure this out later
+            sys.exit()
+        self.data = map_file(self.filename)
+        self.view = memoryview(self.data)
+        self.users = 0
+        self.file_version, self.file_size = struct.unpack(self.e+"2I", self.view[4:12])
+        self.starting_offset, self.reserved, self.count = struct.unpack(self.e+"3I", self.view[12:24])
+        self.chunks = []
+        offset = self.starting_offset
+        for i in range(self.count):
+            chunk = {}
+            chunk["start_offset"] = offset
+            chunk["magic"] = bytes(self.view[offset:offset+4]).decode("utf-8")
+            chunk["version"] = self.view[offset+4:offset+8].hex()
+            chunk["size"], = struct.unpack(self.e+"I", self.view[offset+8:offset+12])
+            self.chunks.append(chunk)
+            offset += chunk["size"]
+
+    @classmethod
+    def open(cls, g1m_filename):
+        if os.path.abspath(g1m_filename) in cls.open_containers:
+            return(cls.open_containers[os.path.abspath(g1m_filename)])
+        return(cls(g1m_filename))
+
+    def __enter__(self):
+        if self.users == 0:
+            G1MContainer.open_containers[self.filename] = self
+        self.users += 1
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.users -= 1
+        if self.users == 0:
+            self.close()
+        return
+
+    def close(self):
+        if G1MContainer.open_containers.get(self.filename) is self:
+            del(G1MContainer.open_containers[self.filename])
+        try:
+            self.view.release()
+            if not isinstance(self.data, bytes):
+                self.data.close()
+        except BufferError:
+            pass # Chunk views are still in use, the file is unmapped once they are freed
+        return
+
+    # First chunk with a magic in magics (e.g. ['G1MG', 'GM1G']), or None
+    def find_chunk(self, magics):
+        for chunk in self.chunks:
+            if chunk["magic"] in magics:
+                return(chunk)
+        return(None)
+
+    def get_chunk(self, chunk):
+        return(self.view[chunk["start_offset"]:chunk["start_offset"]+chunk["size"]])
+
+    def get(self, magics):
+        chunk = self.find_chunk(magics)
+        if chunk == None:
+            return(None)
+        return(self.get_chunk(chunk))
+
 def parseG1MS(g1ms_chunk,e):
     g1ms_section = {}
     with io.BytesIO(g1ms_chunk) as f:
@@ -91,15 +174,15 @@ def parseG1MS(g1ms_chunk,e):
             bone['parentID'], = struct.unpack(e+"i", f.read(4))
             bone['rotation_q'] = list(struct.unpack(e+"4f",f.read(16))) # x,y,z,w
             bone['q_wxyz'] = bone['rotation_q'][-1:]+bone['rotation_q'][:-1] # w,x,y,z
-            quat = Quaternion(bone['q_wxyz']) # w,x,y,z
             bone['position'] = list(struct.unpack(e+"4f",f.read(16))) # x,y,z,w
             bone['pos_xyz'] = bone['position'][0:3]
-            bone['boneMatrixTransform'] = quat.transformation_matrix
-            bone['boneMatrixTransform'][3] = bone['position']
-            bone['boneMatrixTransform'] = numpy.delete(bone['boneMatrixTransform'], -1, 1)
-            bone['boneMatrixTransform'] = bone['boneMatrixTransform'].tolist()
-            localBoneMatrices.append(bone['boneMatrixTransform'])
             boneList.append(bone)
+        # Rotation matrix rows, with the position as the 4th row
+        if len(boneList) > 0:
+            localBoneMatrices = numpy.concatenate([quat_to_matrix([x['q_wxyz'] for x in boneList]),\
+                numpy.array([x['pos_xyz'] for x in boneList])[:,None,:]], axis = 1).tolist()
+        for i in range(len(boneList)):
+            boneList[i]['boneMatrixTransform'] = localBoneMatrices[i]
         g1ms_section["localBoneMatrices"] = localBoneMatrices
         g1ms_section["boneList"] = boneList
     return(g1ms_section)
@@ -107,26 +190,71 @@ def parseG1MS(g1ms_chunk,e):
 # Takes quat/pos relative to parent, and reorients / moves to be relative to the origin.
 # Parent bone must already be transformed.
 def calc_abs_rotation_position(bone, parent_bone):
-    q1 = Quaternion(bone['q_wxyz'])
-    qp = Quaternion(parent_bone['abs_q'])
-    bone["abs_q"] = list((qp * q1).unit)
-    bone["abs_p"] = (numpy.array(qp.rotate(bone['pos_xyz'])) + parent_bone['abs_p']).tolist()
-    bone["abs_tm"] = Quaternion(bone["abs_q"]).transformation_matrix.tolist()
-    bone["abs_tm"] = numpy.delete(bone["abs_tm"], -1, 1)
-    bone["abs_tm"][3] = bone["abs_p"]
-    bone["abs_tm"] = bone["abs_tm"].tolist()
+    bone["abs_q"] = quat_normalise(quat_multiply(parent_bone['abs_q'], bone['q_wxyz'])).tolist()
+    bone["abs_p"] = (quat_rotate(parent_bone['abs_q'], bone['pos_xyz']) + parent_bone['abs_p']).tolist()
+    bone["abs_tm"] = numpy.vstack([quat_to_matrix(bone["abs_q"]), bone["abs_p"]]).tolist()
     return(bone)
 
+# Structure-of-arrays view of a boneList: parent rows, local / absolute rotations (w,x,y,z), positions and scales
+# as (N,4) / (N,3) arrays, with bones found by 'i' in O(1).  calc_abs() fills in the absolute transform of every
+# bone below a bone that already has one, one tree level at a time in a single batched operation per level (the
+# same math as calc_abs_rotation_position()).  update_bone_list() writes the results back into the bone dicts.
+# known is a mask of the bones to start from, by default those that already have abs_q.
+class Skeleton:
+    def __init__(self, bone_list, known = None):
+        self.bone_list = bone_list
+        self.index = {}
+        for row in range(len(bone_list)):
+            if not bone_list[row]['i'] in self.index: # First match, as the list searches did
+                self.index[bone_list[row]['i']] = row
+        self.parents = numpy.array([self.index.get(x['parentID'], -1) for x in bone_list], dtype = numpy.int64)
+        self.local_q = numpy.array([x['q_wxyz'] for x in bone_list], dtype = numpy.float64).reshape(-1,4)
+        self.local_p = numpy.array([x['pos_xyz'] for x in bone_list], dtype = numpy.float64).reshape(-1,3)
+        self.scales = numpy.array([x.get('scale', [1.0,1.0,1.0]) for x in bone_list], dtype = numpy.float64).reshape(-1,3)
+        if known is None:
+            known = ['abs_q' in x for x in bone_list]
+        self.has_abs = numpy.array(known, dtype = bool).reshape(-1)
+        self.abs_q = numpy.zeros((len(bone_list), 4))
+        self.abs_p = numpy.zeros((len(bone_list), 3))
+        for row in numpy.flatnonzero(self.has_abs):
+            self.abs_q[row] = bone_list[row]['abs_q']
+            self.abs_p[row] = bone_list[row]['abs_p']
+        self.updated = numpy.zeros(len(bone_list), dtype = bool)
+
+    def bone(self, bone_id):
+        return(self.bone_list[self.index[bone_id]])
+
+    # Rows are processed in topological order, a level at a time; returns the rows that were computed
+    def calc_abs(self):
+        pending = ~self.has_abs & (self.parents > -1)
+        while True:
+            rows = numpy.flatnonzero(pending & self.has_abs[numpy.maximum(self.parents, 0)])
+            if len(rows) == 0:
+                break
+            parent_rows = self.parents[rows]
+            qp = self.abs_q[parent_rows]
+            self.abs_q[rows] = quat_normalise(quat_multiply(qp, self.local_q[rows]))
+            self.abs_p[rows] = quat_rotate(qp, self.local_p[rows]) + self.abs_p[parent_rows]
+            self.has_abs[rows] = True
+            self.updated[rows] = True
+            pending[rows] = False
+        return(numpy.flatnonzero(self.updated))
+
+    # (N,4,3) absolute transforms, rotation matrix rows with the position as the last row (as abs_tm)
+    def abs_tm(self, rows):
+        return(numpy.concatenate([quat_to_matrix(self.abs_q[rows]), self.abs_p[rows][:,None,:]], axis = 1))
+
+    def update_bone_list(self):
+        rows = numpy.flatnonzero(self.updated)
+        abs_q, abs_p, abs_tm = self.abs_q[rows].tolist(), self.abs_p[rows].tolist(), self.abs_tm(rows).tolist()
+        for i in range(len(rows)):
+            bone = self.bone_list[rows[i]]
+            bone["abs_q"], bone["abs_p"], bone["abs_tm"] = abs_q[i], abs_p[i], abs_tm[i]
+        self.updated[:] = False
+        return(self.bone_list)
+
 # In fmt_g1m, used only on primary skeleton; this function is performed in combine_skeleton() for 2nd layer
 def calc_abs_skeleton (base_skel_data):
-    def process_child_bone (base_skel_data, bone):
-        # Transform from relative rotation / position to absolute
-        current_bone = base_skel_data['boneList'][bone]
-        parent_bone = [x for x in base_skel_data['boneList'] if x['i'] == base_skel_data['boneList'][bone]['parentID']][0]
-        base_skel_data['boneList'][bone] = calc_abs_rotation_position(current_bone, parent_bone)
-        for i in range(len(base_skel_data['boneList'][bone]['children'])):
-            base_skel_data = process_child_bone (base_skel_data, base_skel_data['boneList'][bone]['children'][i])
-        return(base_skel_data)
     for bone in range(len(base_skel_data['boneList'])):
         base_skel_data['boneList'][bone]['children'] = []
     for bone in range(len(base_skel_data['boneList'])):
@@ -137,8 +265,10 @@ def calc_abs_skeleton (base_skel_data):
         base_skel_data['boneList'][bone]['abs_q'] = base_skel_data['boneList'][bone]['q_wxyz']
         base_skel_data['boneList'][bone]['abs_p'] = base_skel_data['boneList'][bone]['pos_xyz']
         base_skel_data['boneList'][bone]['abs_tm'] = base_skel_data['boneList'][bone]['boneMatrixTransform']
-        for i in range(len(base_skel_data['boneList'][bone]['children'])):
-            base_skel_data = process_child_bone (base_skel_data, base_skel_data['boneList'][bone]['children'][i])
+    # Transform every bone below the root bones from relative rotation / position to absolute
+    skeleton = Skeleton(base_skel_data['boneList'], known = [x['parentID'] == -1 for x in base_skel_data['boneList']])
+    skeleton.calc_abs()
+    skeleton.update_bone_list()
     return(base_skel_data)
 
 def name_bones(skel_data, oid):
@@ -172,11 +302,57 @@ def combine_skeleton(base_skel_data, model_skel_data):
                 bone['parentID'] = bone['parentID'] & 0xFFFF
             else:
                 bone['parentID'] = bone['parentID'] + combined_data['externalOffsetList']
-            parent_bone = [x for x in combined_data['boneList'] if x['i'] == bone['parentID']][0]
-            combined_data['boneList'].append(calc_abs_rotation_position(bone, parent_bone))
+            combined_data['boneList'].append(bone)
+        # The added bones are transformed from relative to absolute together, below their (already absolute) parents
+        skeleton = Skeleton(combined_data['boneList'])
+        skeleton.calc_abs()
+        # A bone whose parent cannot be found is an error (as the per-bone parent lookup raised IndexError)
+        if not skeleton.has_abs[combined_data['externalOffsetList']:].all():
+            row = combined_data['externalOffsetList'] + numpy.flatnonzero(~skeleton.has_abs[combined_data['externalOffsetList']:])[0]
+            raise IndexError("Parent {0} of bone {1} not found in the combined skeleton".format(\
+                combined_data['boneList'][row]['parentID'], combined_data['boneList'][row]['i']))
+        skeleton.update_bone_list()
         return(combined_data)
 
-def parseNUNO1(chunkVersion, f, e):
+# Array-backed replacement for the list of {'P1', 'P2', ...} influence dictionaries of a NUN block, one structured
+# array record per control point.  influences[i] builds the dictionary of one control point on request,
+# influences['P3'] is the whole P3 column, and slices are NUNInfluences again.  tolist() gives the plain list back.
+class NUNInfluences:
+    __slots__ = ('array',)
+
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return(len(self.array))
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return(self.array[index])
+        elif isinstance(index, slice):
+            return(NUNInfluences(self.array[index]))
+        return(dict(zip(self.array.dtype.names, self.array[index].tolist())))
+
+    def __iter__(self):
+        return(iter(self.tolist()))
+
+    def tolist(self):
+        return([dict(zip(self.array.dtype.names, x)) for x in self.array.tolist()])
+
+# Structured dtype for influences, types is one character (struct style i / f) per field P1, P2, ...
+def nun_influence_dtype(e, types = 'iiiiff'):
+    return(numpy.dtype([('P{0}'.format(i+1), e+types[i]+'4') for i in range(len(types))]))
+
+# Reads count records of dtype in one go (struct.unpack would raise on a short read, and so does this)
+def read_nun_array(f, dtype, count):
+    dtype = numpy.dtype(dtype)
+    return(numpy.frombuffer(f.read(dtype.itemsize * count), dtype = dtype, count = count).copy())
+
+# Control points are (N,4) float arrays; they are read in native byte order, as the original struct formats had no prefix
+def read_nun_control_points(f, controlPointCount):
+    return(read_nun_array(f, ('=f4', 4), controlPointCount).reshape(-1,4))
+
+def parseNUNO1(chunkVersion, f, e, read_tables = True):
     nuno1_block = {}
     nuno1_block['name'] = "nuno1"
     nuno1_block['parentBoneID'] = None
@@ -194,15 +370,11 @@ def parseNUNO1(chunkVersion, f, e):
         f.read(0x10)
     if chunkVersion >= 0x30303235:
         f.read(0x10)
-    nuno1_block['controlPoints'] = []
-    for i in range(controlPointCount):
-        nuno1_block['controlPoints'].append(struct.unpack("ffff", f.read(16)))
-    nuno1_block['influences'] = []
-    for i in range(controlPointCount):
-        influence = {}
-        influence['P1'], influence['P2'], influence['P3'], influence['P4'], influence['P5'],\
-            influence['P6'] = struct.unpack("iiiiff", f.read(24))
-        nuno1_block['influences'].append(influence)
+    if read_tables == True:
+        nuno1_block['controlPoints'] = read_nun_control_points(f, controlPointCount)
+        nuno1_block['influences'] = NUNInfluences(read_nun_array(f, nun_influence_dtype('='), controlPointCount))
+    else:
+        f.seek(40 * controlPointCount,1)
     # reading the unknown sections data
     f.seek(48 * unknownSectionCount,1)
     f.seek(4 * skip1,1)
@@ -210,7 +382,7 @@ def parseNUNO1(chunkVersion, f, e):
     f.seek(4 * skip3,1)
     return(nuno1_block)
 
-def parseNUNO2(chunkVersion, f, e):
+def parseNUNO2(chunkVersion, f, e, read_tables = True):
     nuno2_block = {}
     nuno2_block['name'] = "nuno2"
     nuno2_block['parentBoneID'] = None
@@ -223,7 +395,7 @@ def parseNUNO2(chunkVersion, f, e):
     f.read(0x08)
     return(nuno2_block)
 
-def parseNUNO3(chunkVersion, f, e):
+def parseNUNO3(chunkVersion, f, e, read_tables = True):
     nuno3_block = {}
     nuno3_block['name'] = "nuno3"
     nuno3_block['parentBoneID'] = None
@@ -247,15 +419,11 @@ def parseNUNO3(chunkVersion, f, e):
         current_offset = f.tell()
         temp, = struct.unpack(e+"I", f.read(4))
         f.seek(current_offset+temp,0)
-    nuno3_block['controlPoints'] = []
-    for i in range(controlPointCount):
-        nuno3_block['controlPoints'].append(struct.unpack("ffff", f.read(16)))
-    nuno3_block['influences'] = []
-    for i in range(controlPointCount):
-        influence = {}
-        influence['P1'], influence['P2'], influence['P3'], influence['P4'], influence['P5'],\
-            influence['P6'] = struct.unpack(e+"iiiiff", f.read(24))
-        nuno3_block['influences'].append(influence)
+    if read_tables == True:
+        nuno3_block['controlPoints'] = read_nun_control_points(f, controlPointCount)
+        nuno3_block['influences'] = NUNInfluences(read_nun_array(f, nun_influence_dtype(e), controlPointCount))
+    else:
+        f.seek(40 * controlPointCount,1)
     # reading the unknown sections data
     f.seek(48 * unknownSectionCount,1)
     f.seek(4 * skip1,1)
@@ -264,7 +432,7 @@ def parseNUNO3(chunkVersion, f, e):
     f.seek(8 * skip4,1)
     return(nuno3_block)
 
-def parseNUNO5(chunkVersion, f, e, entryIDtoNunoID):
+def parseNUNO5(chunkVersion, f, e, entryIDtoNunoID, read_tables = True):
     nuno5_block = {}
     nuno5_block['name'] = "nuno5"
     nuno5_block['parentBoneID'] = None
@@ -292,20 +460,16 @@ def parseNUNO5(chunkVersion, f, e, entryIDtoNunoID):
         current_offset = f.tell()
         cpOffset, = struct.unpack(e+"I", f.read(4))
         f.seek(current_offset+cpOffset,0)
-        if i == 0: # We only want the first LOD, apparently?
-            nuno5_block['controlPoints'] = []
-            nuno5_block['influences'] = []
-            for i in range(controlPointCount):
-                controlpoint = list(struct.unpack(e+"3f", f.read(12)))
-                controlpoint.append(1.0)
-                nuno5_block['controlPoints'].append(controlpoint)
-                f.seek(12,1)
-                influence = {}
-                # Per Project G1M, P5 and P6 are incorrect, but we do not use them.
-                influence['P1'], influence['P2'], influence['P3'], influence['P4'], influence['P5'] = \
-                    struct.unpack(e+"iiiif", f.read(20))
-                influence['P6'] = 0.0
-                nuno5_block['influences'].append(influence)
+        if i == 0 and read_tables == True: # We only want the first LOD, apparently?
+            # Per Project G1M, P5 and P6 are incorrect, but we do not use them.
+            records = read_nun_array(f, [('controlPoint', e+'f4', (3,)), ('skip', 'V12'), ('P1', e+'i4'),\
+                ('P2', e+'i4'), ('P3', e+'i4'), ('P4', e+'i4'), ('P5', e+'f4')], controlPointCount)
+            nuno5_block['controlPoints'] = numpy.hstack([records['controlPoint'],\
+                numpy.ones((controlPointCount, 1), dtype = numpy.float32)])
+            influences = numpy.zeros(controlPointCount, dtype = nun_influence_dtype(e))
+            for field in ['P1', 'P2', 'P3', 'P4', 'P5']:
+                influences[field] = records[field]
+            nuno5_block['influences'] = NUNInfluences(influences)
         else:
             f.seek(44 * controlPointCount,1)
         #Skip physics section
@@ -325,7 +489,7 @@ def parseNUNO5(chunkVersion, f, e, entryIDtoNunoID):
         f.seek(skip10Size * skip10Count,1)
     return(nuno5_block)
 
-def parseNUNV1(chunkVersion, f, e):
+def parseNUNV1(chunkVersion, f, e, read_tables = True):
     nunv1_block = {}
     nunv1_block['name'] = "nunv1"
     nunv1_block['parentBoneID'] = None
@@ -339,21 +503,17 @@ def parseNUNV1(chunkVersion, f, e):
     f.read(0x54)
     if chunkVersion >= 0x30303131:
         f.read(0x10)
-    nunv1_block['controlPoints'] = []
-    for i in range(controlPointCount):
-        nunv1_block['controlPoints'].append(struct.unpack("ffff", f.read(16)))
-    nunv1_block['influences'] = []
-    for i in range(controlPointCount):
-        influence = {}
-        influence['P1'], influence['P2'], influence['P3'], influence['P4'], influence['P5'],\
-            influence['P6'] = struct.unpack(e+"iiiiff", f.read(24))
-        nunv1_block['influences'].append(influence)
+    if read_tables == True:
+        nunv1_block['controlPoints'] = read_nun_control_points(f, controlPointCount)
+        nunv1_block['influences'] = NUNInfluences(read_nun_array(f, nun_influence_dtype(e), controlPointCount))
+    else:
+        f.seek(40 * controlPointCount,1)
     # reading the unknown sections data
     f.seek(48 * unknownSectionCount,1)
     f.seek(4 * skip1,1)
     return(nunv1_block)
 
-def parseNUNS1(chunkVersion, f, e):
+def parseNUNS1(chunkVersion, f, e, read_tables = True):
     nuns1_block = {}
     nuns1_block['name'] = "nuns1"
     nuns1_block['parentBoneID'] = None
@@ -363,14 +523,12 @@ def parseNUNS1(chunkVersion, f, e):
     nuns1_block['parentBoneID'] = a if e == '<' else b
     controlPointCount, = struct.unpack(e+"I", f.read(4))
     f.read(0xB8)
-    for i in range(controlPointCount):
-        nuns1_block['controlPoints'].append(struct.unpack("ffff", f.read(16)))
-    nuns1_block['influences'] = []
-    for i in range(controlPointCount):
-        influence = {}
-        influence['P1'], influence['P2'], influence['P3'], influence['P4'], influence['P5'], influence['P6'],\
-            influence['P7'], influence['P8'] = struct.unpack(e+"iiiiffii", f.read(24))
-        nuns1_block['influences'].append(influence)
+    if read_tables == True:
+        nuns1_block['controlPoints'] = read_nun_control_points(f, controlPointCount)
+        # 32 bytes per influence, P1 to P8
+        nuns1_block['influences'] = NUNInfluences(read_nun_array(f, nun_influence_dtype(e, 'iiiiffii'), controlPointCount))
+    else:
+        f.seek(48 * controlPointCount,1)
     # reading the unknown sections data
     temp = -1
     while(temp != 0x424C5730):
@@ -382,7 +540,26 @@ def parseNUNS1(chunkVersion, f, e):
     f.read(0xC)
     return(nuns1_block)
 
-def parseNUNO(nuno_chunk, e):
+# Matches the control points of a NUNO5 subset to those of its parent set by the sum of their coordinates, and
+# points P1 of each matched influence to the (last) parent point with that sum
+def remap_nuno5_subset(subset_block, parent_block):
+    sums = parent_block["controlPoints"].astype(numpy.float64).sum(axis = 1)
+    parent_sums, parent_points = numpy.unique(sums[::-1], return_index = True)
+    parent_points = len(sums) - 1 - parent_points
+    sums = subset_block["controlPoints"].astype(numpy.float64).sum(axis = 1)
+    positions = numpy.searchsorted(parent_sums, sums)
+    found = positions < len(parent_sums)
+    found[found] = (parent_sums[positions[found]] == sums[found]) #should always be true?
+    subset_block["influences"]['P1'][found] = parent_points[positions[found]]
+    return(subset_block)
+
+# Whether the subset remapping applies to NUNO5 subchunk j; the first subset of each parent set is left as is
+def is_remapped_nuno5_subset(subchunks, j):
+    return(subchunks[j]["parentSetID"] >= 0 and subchunks[j]["parentSetID"] in [x["parentSetID"] for x in subchunks[0:j]])
+
+# With read_tables = False, only the headers of the blocks are read (see NUNIndex).  The offset of each block
+# in the chunk is kept in its 'offset'.
+def parseNUNO(nuno_chunk, e, read_tables = True):
     nuno_section = {}
     with io.BytesIO(nuno_chunk) as f:
         nuno_section["magic"] = f.read(4).decode("utf-8")
@@ -398,41 +575,29 @@ def parseNUNO(nuno_chunk, e):
                     if nuno_section["version"] >= 0x30303335:
                         f.seek(4,1)
                     for j in range(chunk["subchunk_count"]):
+                        offset = f.tell()
                         if chunk["Type"] == 0x00030001:
-                            chunk["subchunks"].append(parseNUNO1(nuno_section["version"],f,e))
+                            chunk["subchunks"].append(parseNUNO1(nuno_section["version"],f,e, read_tables = read_tables))
                         elif chunk["Type"] == 0x00030002:
-                            chunk["subchunks"].append(parseNUNO2(nuno_section["version"],f,e))
+                            chunk["subchunks"].append(parseNUNO2(nuno_section["version"],f,e, read_tables = read_tables))
                         elif chunk["Type"] == 0x00030003:
-                            chunk["subchunks"].append(parseNUNO3(nuno_section["version"],f,e))
+                            chunk["subchunks"].append(parseNUNO3(nuno_section["version"],f,e, read_tables = read_tables))
                         elif chunk["Type"] == 0x00030005:
-                            chunk["subchunks"].append(parseNUNO5(nuno_section["version"],f,e, entryIDtoNunoID))
+                            chunk["subchunks"].append(parseNUNO5(nuno_section["version"],f,e, entryIDtoNunoID, read_tables = read_tables))
                             if not chunk["subchunks"][-1]["entryID"] in entryIDtoNunoID.keys():
                                 entryIDtoNunoID[chunk["subchunks"][-1]["entryID"]] = j
+                        chunk["subchunks"][-1]["offset"] = offset
                 else:
                     f.seek(chunk["size"]-12,1)
-                if chunk["Type"] == 0x00030005:
+                if chunk["Type"] == 0x00030005 and read_tables == True:
                     # Untested, the model I have access to does not have subsets
-                    nunoIDToSubsetMap = {}
                     for j in range(len(chunk["subchunks"])):
-                        if chunk["subchunks"][j]["parentSetID"] >= 0:
-                            if not (chunk["subchunks"][j]["parentSetID"] in nunoIDToSubsetMap.keys()):
-                            # New Map
-                                tempMap = {}
-                                parentchunk = chunk["subchunks"][chunk["subchunks"][j]["parentSetID"]]
-                                for k in range(len(parentchunk["controlPoints"])):
-                                    tempMap[sum(parentchunk["controlPoints"][i])] = k
-                                nunoIDToSubsetMap[chunk["subchunks"][j]["parentSetID"]] = tempMap
-                            else:
-                            #Existing Map
-                                tempMap = nunoIDToSubsetMap[chunk["subchunks"][j]["parentSetID"]]
-                                for k in range(len(chunk["subchunks"][j]["controlPoints"])):
-                                    if sum(chunk["subchunks"][j]["controlPoints"][k]) in tempMap.keys(): #should always be true?
-                                        chunk["subchunks"][j]["influences"][k]['P1'] = \
-                                            tempMap[sum(chunk["subchunks"][j]["controlPoints"][k])]
+                        if is_remapped_nuno5_subset(chunk["subchunks"], j):
+                            remap_nuno5_subset(chunk["subchunks"][j], chunk["subchunks"][chunk["subchunks"][j]["parentSetID"]])
                 nuno_section["chunks"].append(chunk)
     return(nuno_section)
 
-def parseNUNV(nuno_chunk, e):
+def parseNUNV(nuno_chunk, e, read_tables = True):
     nunv_section = {}
     with io.BytesIO(nuno_chunk) as f:
         nunv_section["magic"] = f.read(4).decode("utf-8")
@@ -444,14 +609,16 @@ def parseNUNV(nuno_chunk, e):
             chunk["subchunks"] = []
             for j in range(chunk["subchunk_count"]):
                 if chunk["Type"] == 0x00050001:
-                    chunk["subchunks"].append(parseNUNV1(nunv_section["version"],f,e))
+                    offset = f.tell()
+                    chunk["subchunks"].append(parseNUNV1(nunv_section["version"],f,e, read_tables = read_tables))
+                    chunk["subchunks"][-1]["offset"] = offset
                 else:
                     chunk["subchunks"].append({'Error': 'unsupported NUNV'})
                     f.seek(chunk["size"],1)
             nunv_section["chunks"].append(chunk)
     return(nunv_section)
 
-def parseNUNS(nuno_chunk, e):
+def parseNUNS(nuno_chunk, e, read_tables = True):
     nuns_section = {}
     with io.BytesIO(nuno_chunk) as f:
         nuns_section["magic"] = f.read(4).decode("utf-8")
@@ -463,7 +630,9 @@ def parseNUNS(nuno_chunk, e):
             chunk["subchunks"] = []
             for j in range(chunk["subchunk_count"]):
                 if chunk["Type"] == 0x00050001:
-                    chunk["subchunks"].append(parseNUNS1(nuns_section["version"],f,e))
+                    offset = f.tell()
+                    chunk["subchunks"].append(parseNUNS1(nuns_section["version"],f,e, read_tables = read_tables))
+                    chunk["subchunks"][-1]["offset"] = offset
                 else:
                     chunk["subchunks"].append({'Error': 'unsupported NUNS'})
                     f.seek(chunk["size"],1)
@@ -479,6 +648,81 @@ def stack_nun(nun_data):
                 nun_stack.append(nun_data[key]['chunks'][i]['subchunks'][j])
     return nun_stack
 
+# Index into the NUN block stack (stack_nun order) of a MESH_LOD NUNID.  NUNO blocks are numbered from 0,
+# NUNV blocks from 10000 and NUNS blocks from 20000.
+def nun_stack_index(NUNID, nun_data):
+    nun_names = [x.get('name', '')[0:4] for x in nun_data]
+    if NUNID >= 20000:
+        return((NUNID % 10000) + nun_names.index('nuns'))
+    elif NUNID >= 10000:
+        return((NUNID % 10000) + nun_names.index('nunv'))
+    else:
+        return(NUNID % 10000)
+
+# NUN blocks referenced by the cloth (clothID 1) submeshes of a model
+def referenced_nun_blocks(model_mesh_metadata, nun_data):
+    mesh_index = MeshMetadataIndex(model_mesh_metadata)
+    referenced = []
+    for subindex in range(len(get_section(model_mesh_metadata, "SUBMESH")["data"])):
+        submesh_lod = mesh_index.submesh_lods.get(subindex) # Submeshes without a MESH_LOD entry are not rendered
+        if not submesh_lod == None and submesh_lod['clothID'] == 1:
+            try:
+                referenced.append(nun_stack_index(submesh_lod['NUNID'], nun_data))
+            except ValueError: # No blocks of that type, rendering the submesh will fail as usual
+                pass
+    return(sorted(set(referenced)))
+
+# The NUN blocks of a model, so that only the blocks that submeshes reference are parsed and compiled.
+# add_section() reads just the block headers (and offsets) of a NUNO / NUNV / NUNS chunk.  nun_maps() parses the
+# requested blocks and compiles them with calc_nun_maps(), which adds their NUN bones to the skeleton passed in.
+class NUNIndex:
+    def __init__(self, e = '<'):
+        self.e = e
+        self.sections = {} # 'nuno' / 'nunv' / 'nuns': (chunk, section headers), in the order they are added
+        self.headers = [] # Block headers, in stack_nun order
+        self.locations = [] # (key, chunk, subchunk) of each block
+
+    def add_section(self, key, nun_chunk):
+        parse_section = {'nuno': parseNUNO, 'nunv': parseNUNV, 'nuns': parseNUNS}[key]
+        self.sections[key] = (nun_chunk, parse_section(nun_chunk, self.e, read_tables = False))
+        self.headers = stack_nun({x:self.sections[x][1] for x in self.sections})
+        self.locations = [(x, i, j) for x in self.sections for i in range(len(self.sections[x][1]['chunks']))\
+            for j in range(len(self.sections[x][1]['chunks'][i]['subchunks']))]
+        return
+
+    # The full block, or just its header if it cannot be parsed (it then compiles to empty maps)
+    def parse_block(self, index):
+        key, i, j = self.locations[index]
+        nun_chunk, section = self.sections[key]
+        chunk = section['chunks'][i]
+        header = chunk['subchunks'][j]
+        if not 'offset' in header:
+            return(header)
+        try:
+            with io.BytesIO(nun_chunk) as f:
+                f.seek(header['offset'])
+                if key == 'nuno' and chunk["Type"] == 0x00030005:
+                    entryIDtoNunoID = {header["entryID"]: header["parentSetID"]} if header["parentSetID"] >= 0 else {}
+                    block = parseNUNO5(section["version"], f, self.e, entryIDtoNunoID)
+                else:
+                    parse_block = {'nuno': {0x00030001: parseNUNO1, 0x00030002: parseNUNO2, 0x00030003: parseNUNO3},\
+                        'nunv': {0x00050001: parseNUNV1}, 'nuns': {0x00050001: parseNUNS1}}[key][chunk["Type"]]
+                    block = parse_block(section["version"], f, self.e)
+            block["offset"] = header["offset"]
+            if key == 'nuno' and chunk["Type"] == 0x00030005 and is_remapped_nuno5_subset(chunk['subchunks'], j):
+                remap_nuno5_subset(block, self.parse_block(index - j + header["parentSetID"]))
+            return(block)
+        except:
+            return(header)
+
+    # nun_maps as from calc_nun_maps(), with the blocks in indices compiled; other blocks have empty maps
+    def nun_maps(self, skel_data, indices):
+        indices = [x for x in sorted(set(indices)) if x < len(self.headers)]
+        nun_data = [self.parse_block(i) if i in indices else self.headers[i] for i in range(len(self.headers))]
+        nun_maps = calc_nun_maps(nun_data, skel_data, indices = indices)
+        nun_maps['nun_data'] = nun_data
+        return(nun_maps)
+
 def make_drivermesh_fmt():
     return({'stride': '36', 'topology': 'trianglelist', 'format': 'DXGI_FORMAT_R16_UINT',\
     'elements': [{'id': '0', 'SemanticName': 'POSITION', 'SemanticIndex': '0', 'Format': 'R32G32B32_FLOAT',\
@@ -488,107 +732,114 @@ def make_drivermesh_fmt():
     {'id': '2', 'SemanticName': 'BLENDINDICES', 'SemanticIndex': '0', 'Format': 'R16G16B16A16_UINT',\
     'InputSlot': '0', 'AlignedByteOffset': '28', 'InputSlotClass': 'per-vertex', 'InstanceDataStepRate': '0'}]})
 
-def computeCenterOfMass(position, weights, bones, nunoMap, nun_transform_info):
-    temp = [0,0,0]
-    for bone_num in range(len(bones)):
-        bone = [x for x in nun_transform_info if x['bone_name'].split('_')[-1] == str(nunoMap[bones[bone_num]])][0]
-        temp += Quaternion(bone['abs_q']).rotate(position) + numpy.array(bone['abs_p']) * weights[bone_num]
-    return(temp)
+# Weighted sum of the NUN bone positions (N,3) for each vertex, where bones (N,m) are control point indices and
+# weights (N,m) their weights.  (The bones are rotated about the origin, so their rotations do not contribute.)
+def computeCenterOfMass(weights, bones, bone_positions):
+    bones = bones.reshape(len(bones), -1)
+    indices = bones.astype(numpy.int64)
+    if not (indices == bones).all() or (indices < 0).any() or (indices >= len(bone_positions)).any():
+        raise KeyError("Cloth vertex references a control point that is not in the NUN")
+    return(numpy.einsum('nkc,nk->nc', bone_positions[indices], weights[:,0:bones.shape[1]]))
 
-def calc_nun_maps(nun_data, skel_data):
+# With indices, only those blocks are compiled; the others get the same empty entries as blocks that fail
+def calc_nun_maps(nun_data, skel_data, indices = None):
     nunvOffset = 0
     nunsOffset = 0
     clothMap = []
     clothParentIDMap = []
     driverMeshList = []
+    bones_by_id = {} # First bone with each 'i', kept up to date as bones are added
+    for bone in skel_data['boneList']:
+        if not bone['i'] in bones_by_id:
+            bones_by_id[bone['i']] = bone
     for i in range(len(nun_data)):
         try:
+            if not indices == None and not i in indices:
+                raise KeyError("NUN block {0} is not compiled".format(i))
             boneStart = len(skel_data['boneList'])
             parentBone = skel_data['boneIDList'][nun_data[i]['parentBoneID']]
-            nunoMap = {}
-            vertices = []
-            skinWeightList = []
-            skinIndiceList = []
-            triangles = []
-            vertCount = 0
-            transform_info = []
-            is_nuno5 = (nun_data[i]['name'] == 'nuno5')
-            for pointIndex in range(len(nun_data[i]['controlPoints'])):
-                transform_point_info = {}
-                p = nun_data[i]['controlPoints'][pointIndex][0:3]
-                transform_point_info['p'] = list(p)
-                link = nun_data[i]['influences'][pointIndex]
-                nunoMap[pointIndex] = len(skel_data['boneList'])
-                q = Quaternion()
-                parentID = link['P3']
-                transform_point_info['parentID'] = parentID
-                transform_point_info['parentBone'] = parentBone
-                if (parentID == -1):
-                    parentID = parentBone
-                    parentID_bone = [x for x in skel_data['boneList'] if x['i'] == parentID][0]
-                    q_wxyz = q
-                    pos_xyz = p
-                else:
-                    parentID += boneStart
-                    parent_bone = [x for x in skel_data['boneList'] if x['i'] == parentBone][0]
-                    parentID_bone = [x for x in skel_data['boneList'] if x['i'] == parentID][0]
+            controlPoints = nun_data[i]['controlPoints']
+            links = nun_data[i]['influences'][0:len(controlPoints)]
+            pointCount = len(links)
+            P = numpy.stack([links['P1'], links['P2'], links['P3'], links['P4']], axis = 1).astype(numpy.int64).reshape(-1,4)
+            # Each control point becomes a bone, boneStart + pointIndex, whose parent (parentID) is the NUN parent
+            # bone (P3 == -1) or the bone of control point P3.  Both are looked up as bones_by_id would be when the
+            # point is reached: bones already in the skeleton first, otherwise the bones of earlier control points.
+            ids = numpy.stack([numpy.full(pointCount, parentBone), numpy.where(P[:,2] == -1, parentBone, P[:,2] + boneStart)],\
+                axis = 1).astype(numpy.int64)
+            is_existing = numpy.array([x in bones_by_id for x in ids.flat], dtype = bool).reshape(-1,2)
+            new_rows = ids - boneStart
+            valid = (is_existing | ((new_rows >= 0) & (new_rows < numpy.arange(pointCount)[:,None]))).all(axis = 1)
+            if not valid.all():
+                pointCount = int(valid.argmin()) # Bones are still added up to the first unresolvable point
+            ids, is_existing, new_rows = ids[0:pointCount], is_existing[0:pointCount], new_rows[0:pointCount]
+            # Rows 0 to pointCount - 1 are the new bones, existing bones follow
+            existing_ids = numpy.unique(ids[is_existing])
+            rows = numpy.where(is_existing, pointCount + numpy.searchsorted(existing_ids, ids), new_rows)
+            parentBone_rows, parentID_rows = rows[:,0], rows[:,1]
+            abs_q = numpy.vstack([numpy.zeros((pointCount, 4))] + [bones_by_id[x]['abs_q'] for x in existing_ids.tolist()])
+            abs_p = numpy.vstack([numpy.zeros((pointCount, 3))] + [bones_by_id[x]['abs_p'] for x in existing_ids.tolist()])
+            has_abs = numpy.arange(len(abs_q)) >= pointCount
+            p = numpy.asarray(controlPoints[0:pointCount], dtype = numpy.float64).reshape(pointCount, -1)[:,0:3]
+            P = P[0:pointCount]
+            is_root = (P[:,2] == -1)
+            q_wxyz = numpy.tile(identity_quaternion, (pointCount, 1))
+            pos_xyz = p.copy()
+            # Relative and absolute transforms are computed a level of the control point tree at a time
+            pending = numpy.ones(pointCount, dtype = bool)
+            while pending.any():
+                level = numpy.flatnonzero(pending & has_abs[parentBone_rows] & has_abs[parentID_rows])
+                if len(level) == 0:
+                    break
+                parent_q, parent_p = abs_q[parentID_rows[level]], abs_p[parentID_rows[level]]
+                linked = level[~is_root[level]]
+                if len(linked) > 0:
+                    parentID_q, parentID_p = abs_q[parentID_rows[linked]], abs_p[parentID_rows[linked]]
                     # Trying to reproduce Noesis 4x3 inversion of parentID_bone here;
                     # 4x3 inversion appears to be 4x4 inversion with xyzw in the column, not row
                     #if not is_nuno5:
-                    if True:
-                        q_wxyz = Quaternion(parent_bone['abs_q']) * Quaternion(parentID_bone['abs_q']).inverse
-                        tm_temp = Quaternion(parentID_bone['abs_q']).transformation_matrix
-                        tm_temp[0:3,3] = parentID_bone['abs_p'] # Insert into 4th column of matrix
-                        pIDinv_pos_xyz = numpy.linalg.inv(tm_temp)[0:3,3] # Read 4th column after inversion
-                        temp_p = (numpy.array(Quaternion(parentID_bone['abs_q']).inverse.rotate(parent_bone['abs_p'])) + pIDinv_pos_xyz).tolist()
+                    q_wxyz[linked] = quat_multiply(abs_q[parentBone_rows[linked]], quat_inverse(parentID_q))
+                    # Translation (4th column) of the inverted transform
+                    pIDinv_pos_xyz = transform_inverse(parentID_q, parentID_p)[:,0:3,3]
+                    temp_p = quat_rotate(quat_inverse(parentID_q), abs_p[parentBone_rows[linked]]) + pIDinv_pos_xyz
                     #else:
-                        #q_wxyz = Quaternion(parent_bone['abs_q'])
+                        #q_wxyz = numpy.array(parent_bone['abs_q'])
                         #temp_p = parent_bone['abs_p']
-                    pos_xyz = (numpy.array(q_wxyz.rotate(p)) + temp_p).tolist()
-                bone = {}
-                bone['i'] = len(skel_data['boneList'])
-                bone['bone_id'] = nun_data[0]['name'] + 'bone_p' + str(parentBone) + "_" + str(len(skel_data['boneList']))
-                bone['parentBone'] = parentBone
-                bone['parentID'] = parentID
-                bone['q_wxyz'] = list(q_wxyz)
-                bone['pos_xyz'] = pos_xyz
-                parent_bone = [x for x in skel_data['boneList'] if x['i'] == parentID][0]
-                #if is_nuno5 and link['P5'] == 0:
-                if False:
-                    bone["abs_q"] = bone['q_wxyz']
-                    bone["abs_p"] = bone['pos_xyz']
-                else:
-                    # Convert relative to absolute
-                    qp = Quaternion(parent_bone['abs_q'])
-                    bone["abs_q"] = list((qp * q_wxyz).unit)
-                    bone["abs_p"] = (numpy.array(qp.rotate(bone['pos_xyz'])) + parent_bone['abs_p']).tolist()
-                transform_point_info['bone_name'] = bone["bone_id"]
-                transform_point_info['abs_q'] = bone["abs_q"]
-                transform_point_info['abs_p'] = bone["abs_p"]
-                bone["abs_tm"] = Quaternion(bone["abs_q"]).transformation_matrix.tolist()
-                bone["abs_tm"] = numpy.delete(bone["abs_tm"], -1, 1)
-                bone["abs_tm"][3] = bone["abs_p"]
-                bone["abs_tm"] = bone["abs_tm"].tolist()
+                    pos_xyz[linked] = quat_rotate(q_wxyz[linked], p[linked]) + temp_p
+                #if is_nuno5 and link['P5'] == 0: (absolute as is)
+                # Convert relative to absolute
+                abs_q[level] = quat_normalise(quat_multiply(parent_q, q_wxyz[level]))
+                abs_p[level] = quat_rotate(parent_q, pos_xyz[level]) + parent_p
+                has_abs[level] = True
+                pending[level] = False
+            updatedPosition = (quat_rotate(abs_q[0:pointCount], numpy.zeros((pointCount, 3))) + abs_p[0:pointCount]).tolist()
+            abs_tm = numpy.concatenate([quat_to_matrix(abs_q[0:pointCount]), abs_p[0:pointCount,None,:]], axis = 1).tolist()
+            parentIDs, q_wxyz, pos_xyz, p, P3 = ids[:,1].tolist(), q_wxyz.tolist(), pos_xyz.tolist(), p.tolist(), P[:,2].tolist()
+            abs_q, abs_p = abs_q[0:pointCount].tolist(), abs_p[0:pointCount].tolist()
+            transform_info = []
+            for pointIndex in range(pointCount):
+                bone = {'i': boneStart + pointIndex, 'bone_id': nun_data[0]['name'] + 'bone_p' + str(parentBone) + "_" + str(boneStart + pointIndex),\
+                    'parentBone': parentBone, 'parentID': parentIDs[pointIndex], 'q_wxyz': q_wxyz[pointIndex],\
+                    'pos_xyz': pos_xyz[pointIndex], 'abs_q': abs_q[pointIndex], 'abs_p': abs_p[pointIndex], 'abs_tm': abs_tm[pointIndex]}
                 skel_data['boneList'].append(bone)
-                boneMatrixUpdateQ = Quaternion(skel_data['boneList'][-1]['abs_q'])
-                updatedPosition = (numpy.array(boneMatrixUpdateQ.rotate([0.0, 0.0, 0.0])) + skel_data['boneList'][-1]['abs_p']).tolist()
-                transform_point_info['NewparentID'] = parentID
-                transform_point_info['updatedPosition'] = updatedPosition
-                transform_info.append(transform_point_info)
-                vertices.append(updatedPosition)
-                vertCount += 1
-                skinWeightList.append([1.0, 0.0, 0.0, 0.0])
-                skinIndiceList.append([len(skel_data['boneList']) - 1, 0, 0, 0])
-                if (link['P1'] > 0 and link['P3'] > 0):
-                    triangles.append([int(pointIndex), link['P1'], link['P3']])
-                if (link['P2'] > 0 and link['P4'] > 0):
-                    triangles.append([int(pointIndex), link['P2'], link['P4']])
+                if not bone['i'] in bones_by_id:
+                    bones_by_id[bone['i']] = bone
+                transform_info.append({'p': p[pointIndex], 'parentID': P3[pointIndex],\
+                    'parentBone': parentBone, 'bone_name': bone['bone_id'], 'abs_q': bone['abs_q'], 'abs_p': bone['abs_p'],\
+                    'NewparentID': bone['parentID'], 'updatedPosition': updatedPosition[pointIndex]})
+            if pointCount < len(controlPoints):
+                raise KeyError("NUN control point {0} has no parent bone".format(pointCount))
+            nunoMap = {x:boneStart + x for x in range(pointCount)}
+            # Up to two triangles per point, [pointIndex, P1, P3] and [pointIndex, P2, P4], in point order
+            triangles = numpy.stack([numpy.stack([numpy.arange(pointCount), P[:,0], P[:,2]], axis = 1),\
+                numpy.stack([numpy.arange(pointCount), P[:,1], P[:,3]], axis = 1)], axis = 1)
+            has_triangle = numpy.stack([(P[:,0] > 0) & (P[:,2] > 0), (P[:,1] > 0) & (P[:,3] > 0)], axis = 1)
             driverMesh = {}
-            driverMesh["vertCount"] = vertCount
-            driverMesh["vertices"] = [{"SemanticName": 'POSITION', "SemanticIndex": 0, "Buffer": vertices},\
-                {"SemanticName": 'BLENDWEIGHT', "SemanticIndex": 0, "Buffer": skinWeightList},
-                {"SemanticName": 'BLENDINDICES', "SemanticIndex": 0, "Buffer": skinIndiceList}]
-            driverMesh["indices"] = triangles
+            driverMesh["vertCount"] = pointCount
+            driverMesh["vertices"] = [{"SemanticName": 'POSITION', "SemanticIndex": 0, "Buffer": updatedPosition},\
+                {"SemanticName": 'BLENDWEIGHT', "SemanticIndex": 0, "Buffer": [[1.0, 0.0, 0.0, 0.0] for x in range(pointCount)]},
+                {"SemanticName": 'BLENDINDICES', "SemanticIndex": 0, "Buffer": [[boneStart + x, 0, 0, 0] for x in range(pointCount)]}]
+            driverMesh["indices"] = triangles[has_triangle].tolist()
             driverMesh["transform_info"] = transform_info
             clothMap.append(nunoMap)
             clothParentIDMap.append(parentBone)
@@ -851,9 +1102,66 @@ def parseG1MG(g1mg_chunk,e):
         g1mg_section["sections"] = sections
     return(g1mg_section)
 
+# Read-only index over the G1MG metadata from parseG1MG(), so per-submesh lookups do not scan the section list.
+# Sections are found by type in constant time (the first section of each type, as the list searches did), each
+# submesh is mapped to its MESH_LOD entry once, and the fmts are generated once on first use.  The cached fmts
+# are shared and must not be modified; generate_submesh() gives each submesh its own copy.  Indexing reads
+# through to the metadata, so the index can be passed anywhere model_mesh_metadata is expected.
+class MeshMetadataIndex:
+    def __init__(self, model_mesh_metadata):
+        if isinstance(model_mesh_metadata, MeshMetadataIndex):
+            model_mesh_metadata = model_mesh_metadata.metadata
+        self.metadata = model_mesh_metadata
+        self.sections = {}
+        for section in model_mesh_metadata['sections']:
+            if not section['type'] in self.sections:
+                self.sections[section['type']] = section
+        self.submesh_lods = {}
+        if 'MESH_LOD' in self.sections:
+            for lod_block in self.sections['MESH_LOD']['data']:
+                for lod in lod_block['lod']:
+                    for subindex in lod.get('indices', []): # indices is absent when indexCount is 0
+                        if not subindex in self.submesh_lods:
+                            self.submesh_lods[subindex] = lod
+        self._fmts = None
+
+    def __getitem__(self, key):
+        return(self.metadata[key])
+
+    def __contains__(self, key):
+        return(key in self.metadata)
+
+    def section(self, section_type):
+        return(self.sections[section_type])
+
+    def get_submesh_lod(self, subindex):
+        return(self.submesh_lods[subindex])
+
+    @property
+    def fmts(self):
+        if self._fmts == None:
+            self._fmts = tuple(generate_fmts(self.metadata))
+        return(self._fmts)
+
+    # A private copy of a cached fmt, for callers that need to modify it
+    def get_fmt(self, index):
+        return(copy.deepcopy(self.fmts[index]))
+
+# First section of section_type, from either the metadata dict or a MeshMetadataIndex
+def get_section(model_mesh_metadata, section_type):
+    if isinstance(model_mesh_metadata, MeshMetadataIndex):
+        return(model_mesh_metadata.section(section_type))
+    return([x for x in model_mesh_metadata['sections'] if x['type'] == section_type][0])
+
+# The shared fmts of a MeshMetadataIndex, or new fmts for the metadata dict
+def get_fmts(model_mesh_metadata):
+    if isinstance(model_mesh_metadata, MeshMetadataIndex):
+        return(model_mesh_metadata.fmts)
+    return(generate_fmts(model_mesh_metadata))
+
 def find_submeshes(model_mesh_metadata):
     # Grab the SUBMESH section
-    subvbs = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]
+    subvbs = get_section(model_mesh_metadata, "SUBMESH")
     # Build a quick list of the meshes, each with a list of submeshes
     vbs = []
     for i in range(len(subvbs['data'])):
@@ -867,11 +1175,11 @@ def find_submeshes(model_mesh_metadata):
 
 def generate_fmts(model_mesh_metadata):
     # Grab metadata
-    vb = [x for x in model_mesh_metadata['sections'] if x['type'] == "VERTEX_BUFFERS"][0]
-    vb_attr = [x for x in model_mesh_metadata['sections'] if x['type'] == "VERTEX_ATTRIBUTES"][0]
+    vb = get_section(model_mesh_metadata, "VERTEX_BUFFERS")
+    vb_attr = get_section(model_mesh_metadata, "VERTEX_ATTRIBUTES")
     attr_list = [x['buffer_list'] for x in vb_attr['data']]
-    ib = [x for x in model_mesh_metadata['sections'] if x['type'] == "INDEX_BUFFER"][0]
-    subvbs = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]
+    ib = get_section(model_mesh_metadata, "INDEX_BUFFER")
+    subvbs = get_section(model_mesh_metadata, "SUBMESH")
     vbsubs = find_submeshes(model_mesh_metadata)
     # Generate fmt structures from metadata
     fmts = []
@@ -909,95 +1217,170 @@ def generate_fmts(model_mesh_metadata):
         fmts.append(fmt_struct)
     return(fmts)
 
-def generate_ib(index, g1mg_stream, model_mesh_metadata, fmts, e = '<'):
-    ib = [x for x in model_mesh_metadata['sections'] if x['type'] == "INDEX_BUFFER"][0]
+# With start / count, only that range of indices is read and decoded (clamped to the end of the buffer, as slicing is)
+def generate_ib(index, g1mg_stream, model_mesh_metadata, fmts, e = '<', start = 0, count = None):
+    ib = get_section(model_mesh_metadata, "INDEX_BUFFER")
     if index in range(len(fmts)):
-        with io.BytesIO(g1mg_stream) as f:
-            f.seek(ib['data'][index]['offset'])
-            return(read_ib_stream(f.read(int(ib['data'][index]['stride']*ib['data'][index]['count'])), fmts[index], e))
-
-def trianglestrip_to_list(ib_list):
-    triangles = []
-    for i in range(len(ib_list)-2):
-        if i % 2 == 0:
-            triangles.append([ib_list[i], ib_list[i+1], ib_list[i+2]])
-        else:
-            triangles.append([ib_list[i], ib_list[i+2], ib_list[i+1]]) #DirectX implementation
-            #triangles.append([ib_list[i+1], ib_list[i], ib_list[i+2]]) #OpenGL implementation
-    return(triangles)
+        start = min(int(start), ib['data'][index]['count'])
+        if count == None or start + int(count) > ib['data'][index]['count']:
+            count = ib['data'][index]['count'] - start
+        ib_offset = ib['data'][index]['offset'] + int(ib['data'][index]['stride'] * start)
+        ib_stream = g1mg_stream[ib_offset:ib_offset+int(ib['data'][index]['stride']*int(count))]
+        # Flat array of indices, falls back to a list of triangles for unusual formats
+        ib_data = decode_ib_array(ib_stream, fmts[index], e)
+        if type(ib_data) == bool:
+            ib_data = read_ib_stream(ib_stream, fmts[index], e)
+        return(ib_data)
+
+# Primitive restart (0xFFFF / 0xFFFFFFFF, taken from the array dtype unless restart_index is given) ends
+# the strip and the winding starts over.  Degenerate triangles (used to stitch strips) are dropped.
+def trianglestrip_to_list(ib_list, restart_index = None, remove_degenerate = True):
+    ib_list = numpy.asarray(ib_list).reshape(-1)
+    if restart_index == None and ib_list.dtype.kind == 'u':
+        restart_index = numpy.iinfo(ib_list.dtype).max
+    if len(ib_list) < 3:
+        return(numpy.zeros((0,3), dtype = ib_list.dtype))
+    position = numpy.arange(len(ib_list))
+    if restart_index == None:
+        restart = numpy.zeros(len(ib_list), dtype = bool)
+    else:
+        restart = (ib_list == restart_index)
+    # Position of each index within its strip, for winding
+    strip_start = numpy.maximum.accumulate(numpy.where(restart, position + 1, 0))
+    triangles = numpy.stack([ib_list[:-2], ib_list[1:-1], ib_list[2:]], axis = 1)
+    odd = ((position[:-2] - strip_start[:-2]) % 2 == 1)
+    triangles[odd] = triangles[odd][:,[0,2,1]] #DirectX implementation
+    #triangles[odd] = triangles[odd][:,[1,0,2]] #OpenGL implementation
+    keep = ~(restart[:-2] | restart[1:-1] | restart[2:])
+    if remove_degenerate == True:
+        keep &= (triangles[:,0] != triangles[:,1]) & (triangles[:,1] != triangles[:,2])\
+            & (triangles[:,0] != triangles[:,2])
+    return(triangles[keep])
+
+# Interleaves G1M vertex buffers (buffer_list order within each vertex) into a single vertex stream, with one
+# allocation and one array copy per buffer.  The vertex count is that of the first buffer.  Some meshes use small
+# repeating buffers, vertex i then reads element i % count of that buffer.  Segments of a repository (stride 1)
+# buffer need no special handling, as their offsets already point into the repository.
+def interleave_vertex_buffers(g1mg_stream, buffers):
+    num_vertex = buffers[0]['count']
+    if len(buffers) == 1: # Nothing to interleave, the buffer is used in place
+        return(g1mg_stream[buffers[0]['offset']:buffers[0]['offset']+buffers[0]['stride']*num_vertex])
+    vb_array = numpy.empty((num_vertex, sum([x['stride'] for x in buffers])), dtype = numpy.uint8)
+    column = 0
+    for buffer in buffers:
+        stride, count = buffer['stride'], buffer['count']
+        source = numpy.frombuffer(g1mg_stream, dtype = numpy.uint8, count = stride * count,\
+            offset = buffer['offset']).reshape(count, stride)
+        target = vb_array[:, column:column+stride]
+        # Whole repeats of the buffer are broadcast into place, then the partial repeat at the end
+        repeats = num_vertex // count
+        target[:repeats*count].reshape(repeats, count, stride)[...] = source
+        target[repeats*count:] = source[:num_vertex - repeats*count]
+        column += stride
+    return(memoryview(vb_array.reshape(-1)))
 
 def generate_vb(index, g1mg_stream, model_mesh_metadata, fmts, e = '<'):
-    vb = [x for x in model_mesh_metadata['sections'] if x['type'] == "VERTEX_BUFFERS"][0]
-    vb_attr = [x for x in model_mesh_metadata['sections'] if x['type'] == "VERTEX_ATTRIBUTES"][0]
+    vb = get_section(model_mesh_metadata, "VERTEX_BUFFERS")
+    vb_attr = get_section(model_mesh_metadata, "VERTEX_ATTRIBUTES")
     if index in range(len(fmts)):
-        with io.BytesIO(g1mg_stream) as f:
-            if vb['data'][vb_attr['data'][index]['buffer_list'][0]]['count'] > 1:
-                vb_stream = bytes()
-                for i in range(vb['data'][vb_attr['data'][index]['buffer_list'][0]]['count']):
-                    for j in range(len(vb_attr['data'][index]['buffer_list'])):
-                        if i < vb['data'][vb_attr['data'][index]['buffer_list'][j]]['count']:
-                            f.seek(vb['data'][vb_attr['data'][index]['buffer_list'][j]]['offset']\
-                                + (vb['data'][vb_attr['data'][index]['buffer_list'][j]]['stride'] * i))
-                        else: # Some meshes use small repeating buffers, it seems.
-                            f.seek(vb['data'][vb_attr['data'][index]['buffer_list'][j]]['offset']\
-                                + (vb['data'][vb_attr['data'][index]['buffer_list'][j]]['stride']\
-                                * (i % vb['data'][vb_attr['data'][index]['buffer_list'][j]]['count'])))
-                        vb_stream += f.read(vb['data'][vb_attr['data'][index]['buffer_list'][j]]['stride'])
-                vb_struct = read_vb_stream(vb_stream, fmts[index], e)
-            else: # 
-                f.seek(vb['data'][vb_attr['data'][index]['buffer_list'][0]]['offset'])
-                vb_struct = read_vb_stream(f.read(int(vb['data'][vb_attr['data'][index]['buffer_list'][0]]['stride']\
-                    * vb['data'][vb_attr['data'][index]['buffer_list'][0]]['count'])), fmts[index], e)
-            return(vb_struct)
+        buffers = [vb['data'][x] for x in vb_attr['data'][index]['buffer_list']]
+        if buffers[0]['count'] > 1:
+            vb_stream = interleave_vertex_buffers(g1mg_stream, buffers)
+        else: # 
+            vb_stream = g1mg_stream[buffers[0]['offset']:buffers[0]['offset']+int(buffers[0]['stride']*buffers[0]['count'])]
+        return(VertexBuffer(read_vb_stream(vb_stream, fmts[index], e, lazy = True)))
+
+# Per-export cache of decoded vertex buffers, keyed by vertex buffer index.  Submeshes that share a G1M vertex
+# buffer slice it from here instead of decoding the whole buffer again.  The least recently used buffers are
+# evicted when the decoded arrays exceed the budget (in bytes); a buffer larger than the budget is not cached.
+class VertexBufferCache:
+    def __init__(self, g1mg_stream, model_mesh_metadata, e = '<', budget = None):
+        self.g1mg_stream = g1mg_stream
+        self.model_mesh_metadata = model_mesh_metadata
+        self.fmts = get_fmts(model_mesh_metadata)
+        self.e = e
+        self.budget = vb_cache_budget if budget == None else budget
+        self.buffers = collections.OrderedDict()
+        self.sizes = {}
+        self.total_size = 0
 
+    def get(self, index):
+        if index in self.buffers:
+            self.buffers.move_to_end(index)
+            return(self.buffers[index])
+        vb = generate_vb(index, self.g1mg_stream, self.model_mesh_metadata, self.fmts, e = self.e)
+        size = sum([x['Buffer'].nbytes for x in vb if hasattr(x['Buffer'], 'nbytes')])
+        if size <= self.budget:
+            while self.total_size + size > self.budget:
+                evicted = self.buffers.popitem(last = False)[0]
+                self.total_size -= self.sizes.pop(evicted)
+            self.buffers[index] = vb
+            self.sizes[index] = size
+            self.total_size += size
+        return(vb)
+
+# Used vertices are kept in their original (ascending) order, and the indices are renumbered to match.
+# The used vertices are marked in a mask, O(vertices + indices), and one gather index is applied to every element.
 def cull_vb(submesh):
-    active_indices = list({x for l in submesh['ib'] for x in l})
-    new_vb = []
-    for i in range(len(submesh['vb'])):
-        new_vb.append({'SemanticName': submesh['vb'][i]['SemanticName'],\
-            'SemanticIndex': submesh['vb'][i]['SemanticIndex'], 'Buffer': []})
-    new_indices = {}
-    num_buffers = len(submesh['vb'])
-    current_vertex = 0
-    for i in range(len(submesh['vb'][0]['Buffer'])):
-        if i in active_indices:
-            for j in range(len(submesh['vb'])):
-                new_vb[j]['Buffer'].append(submesh['vb'][j]['Buffer'][i])
-            new_indices[i] = current_vertex
-            current_vertex += 1
-    submesh['vb'] = new_vb
-    for i in range(len(submesh['ib'])):
-        for j in range(len(submesh['ib'][i])):
-            submesh['ib'][i][j] = new_indices[submesh['ib'][i][j]]
+    submesh = Submesh.from_dict(submesh)
+    num_vertex = len(submesh['vb'][0]['Buffer']) if len(submesh['vb']) > 0 else 0
+    if isinstance(submesh['ib'], numpy.ndarray):
+        ib = submesh['ib']
+    else: # A trailing partial triangle keeps ib a list of lists
+        ib = numpy.array(flatten_ib(submesh['ib']), dtype = int)
+    used = numpy.zeros(num_vertex, dtype = bool)
+    used[ib.reshape(-1)] = True
+    if used.all(): # Every vertex is used, nothing to remove or renumber
+        return(submesh)
+    active_indices = numpy.flatnonzero(used)
+    new_indices = numpy.cumsum(used) - 1
+    for element in submesh['vb']:
+        element['Buffer'] = numpy.take(element['Buffer'], active_indices, axis = 0)
+    if isinstance(submesh['ib'], numpy.ndarray):
+        submesh['ib'] = new_indices[ib].astype(ib.dtype)
+    else:
+        new_ib = new_indices[ib].tolist()
+        ib_lengths = numpy.cumsum([0] + [len(x) for x in submesh['ib']]).tolist()
+        submesh['ib'] = [new_ib[ib_lengths[i]:ib_lengths[i+1]] for i in range(len(submesh['ib']))]
     return(submesh)
 
 def generate_vgmap(boneindex, model_mesh_metadata, skel_data):
-    bonepalettes = [x for x in model_mesh_metadata['sections'] if x['type'] == "JOINT_PALETTES"][0]
+    bonepalettes = get_section(model_mesh_metadata, "JOINT_PALETTES")
     vgmap_json = {}
     for i in range(len(bonepalettes['data'][boneindex]['joints'])):
         vgmap_json[skel_data['boneList'][bonepalettes['data'][boneindex]['joints'][i]['jointIndex']]['bone_id']] = i * 3
     return(vgmap_json)
 
+# With vb_cache (a VertexBufferCache), the vertex buffer is sliced from the cache instead of being decoded again.
+# The submesh gets its own copy of the fmt, so fmts can be the shared fmts of a MeshMetadataIndex.
 def generate_submesh(subindex, g1mg_stream, model_mesh_metadata, skel_data, fmts, e = '<', cull_vertices = True,\
-        preserve_trianglestrip = False):
-    subvbs = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]
+        preserve_trianglestrip = False, vb_cache = None):
+    subvbs = get_section(model_mesh_metadata, "SUBMESH")
     ibindex = subvbs['data'][subindex]['indexBufferIndex']
     vbindex = subvbs['data'][subindex]['vertexBufferIndex']
     boneindex = subvbs['data'][subindex]['bonePaletteIndex']
-    submesh = {}
-    submesh["fmt"] = fmts[vbindex]
-    ib_data = generate_ib(ibindex, g1mg_stream, model_mesh_metadata, fmts, e = '<')
-    # Flatten from 2D to 1D before sectioning.
-    submesh["ib"] = [x for y in ib_data for x in y][int(subvbs['data'][subindex]['indexBufferOffset']):\
-        int(subvbs['data'][subindex]['indexBufferOffset']+subvbs['data'][subindex]['indexCount'])]
-    if submesh["fmt"]["topology"] == "trianglestrip" and preserve_trianglestrip == False:
-        submesh["ib"] = trianglestrip_to_list(submesh["ib"])
-        submesh["fmt"]["topology"] = "trianglelist"
+    fmt = copy.deepcopy(fmts[vbindex])
+    # Only this submesh's section of the index buffer is decoded, flattened from 2D to 1D
+    ib = flatten_ib(generate_ib(ibindex, g1mg_stream, model_mesh_metadata, fmts, e = e,\
+        start = subvbs['data'][subindex]['indexBufferOffset'], count = subvbs['data'][subindex]['indexCount']))
+    if fmt["topology"] == "trianglestrip" and preserve_trianglestrip == False:
+        ib = trianglestrip_to_list(ib).astype(numpy.uint32)
+        fmt["topology"] = "trianglelist"
     else:
-        submesh["ib"] = [[x] for x in submesh["ib"]] # Turn back into 2D list so cull_vertices() works
-    submesh["vb"] = generate_vb(vbindex, g1mg_stream, model_mesh_metadata, fmts, e = '<')
+        ib = numpy.array(ib, dtype = numpy.uint32).reshape(-1,1) # Turn back into 2D so cull_vertices() works
+    if vb_cache == None:
+        vb = generate_vb(vbindex, g1mg_stream, model_mesh_metadata, fmts, e = e)
+    else:
+        cached_vb = vb_cache.get(vbindex)
+        vb = VertexBuffer([VertexElement(x['SemanticName'], x['SemanticIndex'], x['Buffer'], x.get('InputSlot')) for x in cached_vb])
+    submesh = Submesh(fmt, ib, vb)
     if cull_vertices == True: # Call with False to produce submeshes identical to G1M Tools
         submesh = cull_vb(submesh)
+    if not vb_cache == None:
+        # Culling gathers the used vertices into new arrays; any array still shared with the cache is copied
+        for i in range(len(submesh['vb'])):
+            if submesh['vb'][i]['Buffer'] is cached_vb[i]['Buffer']:
+                submesh['vb'][i]['Buffer'] = cached_vb[i]['Buffer'].copy()
     # Trying to detect if the external skeleton is missing
     if skel_data['jointCount'] > 1 and not skel_data['boneList'][0]['parentID'] < -200000000:
         submesh["vgmap"] = generate_vgmap(boneindex, model_mesh_metadata, skel_data)
@@ -1006,69 +1389,71 @@ def generate_submesh(subindex, g1mg_stream, model_mesh_metadata, skel_data, fmts
     return(submesh)
 
 def render_cloth_submesh(submesh, NUNID, model_skel_data, nun_maps, e = '<', remove_physics = False):
+    submesh = Submesh.from_dict(submesh)
     semantic_names = [x['SemanticName'] for x in submesh['vb']]
     is_nuno5 = (nun_maps['nun_data'][NUNID]['name'] == 'nuno5')
     # NUNO5 subset code will go here eventually
     new_fmt = copy.deepcopy(submesh['fmt'])
     new_vb = copy.deepcopy(submesh['vb'])
-    position_data = [x for x in submesh['vb'] if x['SemanticName'] == 'POSITION'][0]['Buffer']
-    normal_data = [x for x in submesh['vb'] if x['SemanticName'] == 'NORMAL'][0]['Buffer']
-    BlendIndicesList = [x for x in submesh['vb'] if x['SemanticName'] == 'BLENDINDICES'][0]['Buffer']
-    skinWeightList = [x for x in submesh['vb'] if x['SemanticName'] == 'BLENDWEIGHT'][0]['Buffer']
-    nunoMap = nun_maps['clothMap'][NUNID]
+    get_buffer = lambda semantic_filter: numpy.asarray([x for x in submesh['vb'] if semantic_filter(x)][0]['Buffer'])\
+        .reshape(len(submesh['vb'][0]['Buffer']), -1)
+    position_data = get_buffer(lambda x: x['SemanticName'] == 'POSITION').astype(numpy.float64)
+    normal_data = get_buffer(lambda x: x['SemanticName'] == 'NORMAL').astype(numpy.float64)
+    BlendIndicesList = get_buffer(lambda x: x['SemanticName'] == 'BLENDINDICES')
+    skinWeightList = get_buffer(lambda x: x['SemanticName'] == 'BLENDWEIGHT').astype(numpy.float64)
     clothParentBone = [x for x in model_skel_data['boneList'] if x['i'] == nun_maps['clothParentIDMap'][NUNID]][0]
-    clothStuff1Buffer = [x for x in submesh['vb'] if x['SemanticName'] == 'PSIZE'][0]['Buffer']
-    clothStuff2Buffer = [x for x in submesh['vb'] if x['SemanticName'] == 'TEXCOORD' and int(x['SemanticIndex']) > 2][0]['Buffer'] #Not really sure about this one
-    #clothStuff3Buffer = [x[3] for x in position_data]
-    clothStuff4Buffer = [x[3] for x in normal_data]
-    clothStuff5Buffer = [x for x in submesh['vb'] if x['SemanticName'] == 'COLOR' and int(x['SemanticIndex']) != 0][0]['Buffer']
-    #colorBuffer = [x for x in submesh['vb'] if x['SemanticName'] == 'COLOR' and int(x['SemanticIndex']) == 0][0]['Buffer']
+    clothStuff1Buffer = get_buffer(lambda x: x['SemanticName'] == 'PSIZE')
+    clothStuff2Buffer = get_buffer(lambda x: x['SemanticName'] == 'TEXCOORD' and int(x['SemanticIndex']) > 2) #Not really sure about this one
+    #clothStuff3Buffer = position_data[:,3]
+    clothStuff4Buffer = normal_data[:,3]
+    clothStuff5Buffer = get_buffer(lambda x: x['SemanticName'] == 'COLOR' and int(x['SemanticIndex']) != 0).astype(numpy.float64)
+    #colorBuffer = get_buffer(lambda x: x['SemanticName'] == 'COLOR' and int(x['SemanticIndex']) == 0)
     if 'TANGENT' in semantic_names:
-        tangent_data = [x for x in submesh['vb'] if x['SemanticName'] == 'TANGENT'][0]['Buffer']
+        tangent_data = get_buffer(lambda x: x['SemanticName'] == 'TANGENT').astype(numpy.float64)
     else:
         tangent_data = False
-    binormalBuffer = [x for x in submesh['vb'] if x['SemanticName'] == 'BINORMAL'][0]['Buffer']
-    fogBuffer = [x for x in submesh['vb'] if x['SemanticName'] == 'FOG'][0]['Buffer']
-    vertPosBuff = []
-    vertNormBuff = []
-    tangentBuffer = []
+    binormalBuffer = get_buffer(lambda x: x['SemanticName'] == 'BINORMAL').astype(numpy.float64)
+    fogBuffer = get_buffer(lambda x: x['SemanticName'] == 'FOG')
+    vertPosBuff = numpy.zeros((len(position_data), 3))
+    vertNormBuff = numpy.zeros((len(position_data), 3))
+    tangentBuffer = numpy.zeros((len(position_data), 4))
+    # Vertices with an empty binormal are rigidly attached to the cloth parent bone
+    if binormalBuffer.shape[1] == 4:
+        rigid = (binormalBuffer == 0).all(axis = 1)
+    else:
+        rigid = numpy.zeros(len(position_data), dtype = bool)
+    cloth = ~rigid
+    vertPosBuff[rigid] = quat_rotate(clothParentBone['abs_q'], position_data[rigid,0:3]) + numpy.array(clothParentBone['abs_p'])
+    vertNormBuff[rigid] = normal_data[rigid,0:3] # Only XYZ is written to the new R32G32B32_FLOAT element
+    if tangent_data is not False:
+        tangentBuffer[rigid] = tangent_data[rigid]
     nun_transform_info = nun_maps['driverMeshList'][NUNID]['transform_info'] # NUN Bones
-    for i in range(len(position_data)):
-        if binormalBuffer[i] == [0,0,0,0]:
-            vertPosBuff.append((Quaternion(clothParentBone['abs_q']).rotate(position_data[i][0:3]) + numpy.array(clothParentBone['abs_p'])).tolist())
-            vertNormBuff.append(normal_data[i])
-            if tangent_data:
-                tangentBuffer.append(tangent_data[i])
-        else:
-            clothPosition = position_data[i]
-            position = [0,0,0]
-            a = [0,0,0]
-            a += computeCenterOfMass(position, clothPosition, BlendIndicesList[i], nunoMap, nun_transform_info) * skinWeightList[i][0]
-            a += computeCenterOfMass(position, clothPosition, clothStuff1Buffer[i], nunoMap, nun_transform_info) * skinWeightList[i][1]
-            a += computeCenterOfMass(position, clothPosition, fogBuffer[i], nunoMap, nun_transform_info) * skinWeightList[i][2]
-            a += computeCenterOfMass(position, clothPosition, clothStuff2Buffer[i], nunoMap, nun_transform_info) * skinWeightList[i][3]
-            b = [0,0,0]
-            b += computeCenterOfMass(position, clothPosition, BlendIndicesList[i], nunoMap, nun_transform_info) * clothStuff5Buffer[i][0]
-            b += computeCenterOfMass(position, clothPosition, clothStuff1Buffer[i], nunoMap, nun_transform_info) * clothStuff5Buffer[i][1]
-            b += computeCenterOfMass(position, clothPosition, fogBuffer[i], nunoMap, nun_transform_info) * clothStuff5Buffer[i][2]
-            b += computeCenterOfMass(position, clothPosition, clothStuff2Buffer[i], nunoMap, nun_transform_info) * clothStuff5Buffer[i][3]
-            c = [0,0,0]
-            c += computeCenterOfMass(position, binormalBuffer[i], BlendIndicesList[i], nunoMap, nun_transform_info) * skinWeightList[i][0]
-            c += computeCenterOfMass(position, binormalBuffer[i], clothStuff1Buffer[i], nunoMap, nun_transform_info) * skinWeightList[i][1]
-            c += computeCenterOfMass(position, binormalBuffer[i], fogBuffer[i], nunoMap, nun_transform_info) * skinWeightList[i][2]
-            c += computeCenterOfMass(position, binormalBuffer[i], clothStuff2Buffer[i], nunoMap, nun_transform_info) * skinWeightList[i][3]
-            d = numpy.cross(b,c)
-            vertNormBuff.append(b * normal_data[i][1] + c * normal_data[i][0] + d * normal_data[i][2])
-            if not numpy.linalg.norm(vertNormBuff[-1]) == 0.0:
-                vertNormBuff[-1] = (vertNormBuff[-1] / numpy.linalg.norm(vertNormBuff[-1])).tolist()
-            else:
-                vertNormBuff[-1] = (vertNormBuff[-1] / 0.000001).tolist()
-            if tangent_data:
-                tangentBuffer.append(b * tangent_data[i][1] + c * tangent_data[i][0] + d * tangent_data[i][2])
-                tangentBuffer[-1] = (tangentBuffer[-1] / numpy.linalg.norm(tangentBuffer[-1])).tolist() + [tangent_data[i][3]]
-            if is_nuno5:
-                d = (d / numpy.linalg.norm(d))
-            vertPosBuff.append((d * clothStuff4Buffer[i] + a).tolist())
+    # transform_info is in control point order, so it is indexed directly by the control point indices
+    nun_positions = numpy.array([x['abs_p'] for x in nun_transform_info]).reshape(-1,3)
+    if cloth.any():
+        clothPosition = position_data[cloth]
+        skinWeights = skinWeightList[cloth]
+        clothStuff5 = clothStuff5Buffer[cloth]
+        a = numpy.zeros((len(clothPosition), 3))
+        b = numpy.zeros((len(clothPosition), 3))
+        c = numpy.zeros((len(clothPosition), 3))
+        for j, bones in enumerate([BlendIndicesList, clothStuff1Buffer, fogBuffer, clothStuff2Buffer]):
+            position_com = computeCenterOfMass(clothPosition, bones[cloth], nun_positions)
+            a += position_com * skinWeights[:,j:j+1]
+            b += position_com * clothStuff5[:,j:j+1]
+            c += computeCenterOfMass(binormalBuffer[cloth], bones[cloth], nun_positions) * skinWeights[:,j:j+1]
+        d = numpy.cross(b,c)
+        normals = b * normal_data[cloth,1:2] + c * normal_data[cloth,0:1] + d * normal_data[cloth,2:3]
+        normal_lengths = numpy.linalg.norm(normals, axis = 1)
+        normal_lengths[normal_lengths == 0.0] = 0.000001
+        vertNormBuff[cloth] = normals / normal_lengths[:,None]
+        if tangent_data is not False:
+            tangents = b * tangent_data[cloth,1:2] + c * tangent_data[cloth,0:1] + d * tangent_data[cloth,2:3]
+            tangentBuffer[cloth,0:3] = tangents / numpy.linalg.norm(tangents, axis = 1)[:,None]
+            tangentBuffer[cloth,3] = tangent_data[cloth,3]
+        if is_nuno5:
+            d = d / numpy.linalg.norm(d, axis = 1)[:,None]
+        vertPosBuff[cloth] = d * clothStuff4Buffer[cloth,None] + a
     #Position
     original_pos_fmt = int([x for x in new_fmt['elements'] if x['SemanticName'] == 'POSITION'][0]['id'])
     new_pos_fmt = len(new_fmt['elements'])
@@ -1090,7 +1475,7 @@ def render_cloth_submesh(submesh, NUNID, model_skel_data, nun_maps, e = '<', rem
     new_fmt['stride'] = str(int(new_fmt['stride']) + 12)
     new_vb.append({'SemanticName': 'NORMAL', 'SemanticIndex': '0', 'Buffer': vertNormBuff})
     #Tangent
-    if tangent_data:
+    if tangent_data is not False:
         original_tng_fmt = int([x for x in new_fmt['elements'] if x['SemanticName'] == 'TANGENT'][0]['id'])
         new_tng_fmt = len(new_fmt['elements'])
         new_fmt['elements'].append(copy.deepcopy(new_fmt['elements'][original_tng_fmt]))
@@ -1113,34 +1498,34 @@ def render_cloth_submesh(submesh, NUNID, model_skel_data, nun_maps, e = '<', rem
                 simple_fmt['elements'][-1]['AlignedByteOffset'] = str(offset)
                 offset += get_stride_from_dxgi_format(simple_fmt['elements'][-1]['Format'])
         simple_fmt['stride'] = str(offset)
-        return({'fmt': simple_fmt, 'ib': submesh['ib'], 'vb': simple_vb, 'vgmap': submesh['vgmap']})
+        return(Submesh(simple_fmt, submesh['ib'], simple_vb, submesh['vgmap']))
     else:
-        return({'fmt': new_fmt, 'ib': submesh['ib'], 'vb': new_vb, 'vgmap': submesh['vgmap']})
+        return(Submesh(new_fmt, submesh['ib'], new_vb, submesh['vgmap']))
 
 def render_cloth_submesh_2(submesh, subindex, model_mesh_metadata, model_skel_data, remove_physics = False):
+    submesh = Submesh.from_dict(submesh)
     new_fmt = copy.deepcopy(submesh['fmt'])
     new_vb = copy.deepcopy(submesh['vb'])
-    submeshinfo = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]["data"][subindex]
-    palette = [x["joints"] for x in [x for x in model_mesh_metadata['sections'] if x['type']\
-        == "JOINT_PALETTES"][0]["data"]][submeshinfo['bonePaletteIndex']]
-    physicsBoneList = [x["physicsIndex"] & 0xFFFF for x in palette]
-    position_data = [x for x in submesh['vb'] if x['SemanticName'] == 'POSITION'][0]['Buffer']
+    submeshinfo = get_section(model_mesh_metadata, "SUBMESH")["data"][subindex]
+    palette = [x["joints"] for x in get_section(model_mesh_metadata, "JOINT_PALETTES")["data"]][submeshinfo['bonePaletteIndex']]
+    physicsBoneList = numpy.array([x["physicsIndex"] & 0xFFFF for x in palette], dtype = numpy.int64)
+    position_data = numpy.asarray([x for x in submesh['vb'] if x['SemanticName'] == 'POSITION'][0]['Buffer'], dtype = numpy.float64)
     if 'BLENDINDICES' in [x['SemanticName'] for x in submesh['vb']]:
-        oldSkinIndiceList = [x for x in submesh['vb'] if x['SemanticName'] == 'BLENDINDICES'][0]['Buffer']
+        paletteIndices = numpy.asarray([x for x in submesh['vb'] if x['SemanticName'] == 'BLENDINDICES'][0]['Buffer'])\
+            .reshape(len(position_data), -1)[:,0] // 3
     else:
-        oldSkinIndiceList = [[0,0,0,0] for x in range(len(submesh['vb'][0]['Buffer']))]
-    vertPosBuff = []
-    jointIndexBuff = []
-    for i in range(len(position_data)):
-        if oldSkinIndiceList[i][0] // 3 < len(physicsBoneList):
-            index = physicsBoneList[oldSkinIndiceList[i][0] // 3]
-            if index < len(model_skel_data["boneList"]):
-                quat1 = Quaternion(model_skel_data["boneList"][index]["abs_q"])
-                quat2 = Quaternion([quat1[0], 0-quat1[1], 0-quat1[2], 0-quat1[3]]) \
-                    * Quaternion(0, position_data[i][0], position_data[i][1], position_data[i][2]) \
-                    * quat1
-                vertPosBuff.append((numpy.array(model_skel_data["boneList"][index]["abs_p"]) \
-                    + numpy.array([quat2[1], quat2[2], quat2[3]])).tolist())
+        paletteIndices = numpy.zeros(len(position_data), dtype = numpy.int64)
+    # Vertices whose palette entry or physics bone does not exist are left out of the new buffer
+    boneIndices = numpy.full(len(position_data), len(model_skel_data["boneList"]))
+    in_palette = paletteIndices < len(physicsBoneList)
+    boneIndices[in_palette] = physicsBoneList[paletteIndices[in_palette]]
+    valid = boneIndices < len(model_skel_data["boneList"])
+    # Each physics bone is looked up once
+    boneIndices, inverse = numpy.unique(boneIndices[valid], return_inverse = True)
+    abs_q = numpy.array([model_skel_data["boneList"][x]["abs_q"] for x in boneIndices]).reshape(-1,4)[inverse]
+    abs_p = numpy.array([model_skel_data["boneList"][x]["abs_p"] for x in boneIndices]).reshape(-1,3)[inverse]
+    positions = numpy.hstack([numpy.zeros((len(abs_q), 1)), position_data[valid,0:3]])
+    vertPosBuff = abs_p + quat_multiply(quat_multiply(quat_conjugate(abs_q), positions), abs_q)[:,1:]
     original_pos_fmt = int([x for x in new_fmt['elements'] if x['SemanticName'] == 'POSITION'][0]['id'])
     new_pos_fmt = len(new_fmt['elements'])
     new_fmt['elements'].append(copy.deepcopy(new_fmt['elements'][original_pos_fmt]))
@@ -1163,108 +1548,158 @@ def render_cloth_submesh_2(submesh, subindex, model_mesh_metadata, model_skel_da
                 simple_fmt['elements'][-1]['AlignedByteOffset'] = str(offset)
                 offset += get_stride_from_dxgi_format(simple_fmt['elements'][-1]['Format'])
         simple_fmt['stride'] = str(offset)
-        return({'fmt': simple_fmt, 'ib': submesh['ib'], 'vb': simple_vb, 'vgmap': submesh['vgmap']})
+        return(Submesh(simple_fmt, submesh['ib'], simple_vb, submesh['vgmap']))
+    else:
+        return(Submesh(new_fmt, submesh['ib'], new_vb, submesh['vgmap']))
+
+# Generates one submesh and writes its fmt / ib / vb / vgmap files
+def write_submesh(subindex, g1mg_stream, model_mesh_metadata, skel_data, path = '', e = '<', cull_vertices = True,\
+        write_empty_buffers = False, preserve_trianglestrip = False, vb_cache = None):
+    print("Processing submesh {0}...".format(subindex))
+    submesh = generate_submesh(subindex, g1mg_stream, model_mesh_metadata,\
+        skel_data, fmts = get_fmts(model_mesh_metadata), e=e, cull_vertices = cull_vertices,\
+        preserve_trianglestrip = preserve_trianglestrip, vb_cache = vb_cache)
+    write_fmt(submesh['fmt'],'{0}{1}.fmt'.format(path, subindex))
+    if len(submesh['ib']) > 0 or write_empty_buffers == True:
+        write_ib(submesh['ib'],'{0}{1}.ib'.format(path, subindex), submesh['fmt'])
+        write_vb(submesh['vb'],'{0}{1}.vb'.format(path, subindex), submesh['fmt'])
+    if not submesh["vgmap"] == False:
+        with open('{0}{1}.vgmap'.format(path, subindex), 'wb') as f:
+            f.write(json.dumps(submesh['vgmap'], indent=4).encode("utf-8"))
+    return(submesh)
+
+# Cloth (4D) transformation of a submesh with a clothID of 1 or 2.  Returns the transformed submesh, and the
+# driver mesh for clothID 1 (None otherwise).  Errors are raised, the caller skips cloth for the rest of the model.
+def render_submesh_cloth(submesh, subindex, submesh_lod, model_mesh_metadata, skel_data, nun_maps, e = '<'):
+    print("Performing cloth mesh (4D) transformation...".format(subindex))
+    if submesh_lod['clothID'] == 1:
+        NUNID = nun_stack_index(submesh_lod['NUNID'], nun_maps['nun_data'])
+        transformed_submesh = render_cloth_submesh(submesh, NUNID, skel_data, nun_maps, e=e)
+        return(transformed_submesh, nun_maps['driverMeshList'][NUNID])
     else:
-        return({'fmt': new_fmt, 'ib': submesh['ib'], 'vb': new_vb, 'vgmap': submesh['vgmap']})
+        return(render_cloth_submesh_2(submesh, subindex, model_mesh_metadata, skel_data), None)
+
+def write_cloth_submesh(subindex, transformed_submesh, drivermesh, path = '', write_empty_buffers = False):
+    write_fmt(transformed_submesh['fmt'],'{0}{1}_transformed.fmt'.format(path, subindex))
+    if len(transformed_submesh['ib']) > 0 or write_empty_buffers == True:
+        write_ib(transformed_submesh['ib'],'{0}{1}_transformed.ib'.format(path, subindex), transformed_submesh['fmt'])
+        write_vb(transformed_submesh['vb'],'{0}{1}_transformed.vb'.format(path, subindex), transformed_submesh['fmt'])
+    if not drivermesh == None:
+        if not transformed_submesh["vgmap"] == False:
+            with open('{0}{1}_transformed.vgmap'.format(path, subindex), 'wb') as f:
+                f.write(json.dumps(transformed_submesh['vgmap'], indent=4).encode("utf-8"))
+        driverMesh_fmt = make_drivermesh_fmt()
+        write_fmt(driverMesh_fmt,'{0}{1}_drivermesh.fmt'.format(path, subindex))
+        if len(transformed_submesh['ib']) > 0 or write_empty_buffers == True:
+            write_ib(drivermesh['indices'],'{0}{1}_drivermesh.ib'.format(path, subindex), driverMesh_fmt)
+            write_vb(drivermesh['vertices'],'{0}{1}_drivermesh.vb'.format(path, subindex), driverMesh_fmt)
+    return
 
+# State of each write_submeshes() worker process, set once by init_submesh_worker()
+submesh_worker = {}
+
+# Workers map the G1M file themselves (g1m_chunk is the file name and the G1MG chunk), so the G1MG bytes are
+# shared through the page cache instead of being pickled.  The metadata, skeleton and NUN maps are sent once.
+def init_submesh_worker(g1m_chunk, model_mesh_metadata, skel_data, nun_maps, options):
+    g1m = G1MContainer.open(g1m_chunk[0]).__enter__() # Kept open for the life of the worker
+    submesh_worker['g1mg_stream'] = g1m.get_chunk(g1m_chunk[1])
+    submesh_worker['mesh_index'] = MeshMetadataIndex(model_mesh_metadata)
+    submesh_worker['skel_data'] = skel_data
+    submesh_worker['nun_maps'] = nun_maps
+    submesh_worker['options'] = options
+    submesh_worker['vb_cache'] = VertexBufferCache(submesh_worker['g1mg_stream'], submesh_worker['mesh_index'],\
+        options['e'], budget = vb_cache_budget // options['jobs'])
+    return
+
+# Runs in a worker.  Console output is captured and returned, for the parent to print in submesh order.  Cloth
+# is always attempted (cloth is False if it failed); the parent discards it if an earlier submesh failed.
+def submesh_worker_task(subindex):
+    mesh_index, options = submesh_worker['mesh_index'], submesh_worker['options']
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        submesh = write_submesh(subindex, submesh_worker['g1mg_stream'], mesh_index, submesh_worker['skel_data'],\
+            path = options['path'], e = options['e'], cull_vertices = options['cull_vertices'],\
+            write_empty_buffers = options['write_empty_buffers'],\
+            preserve_trianglestrip = options['preserve_trianglestrip'], vb_cache = submesh_worker['vb_cache'])
+    submesh_lod = mesh_index.get_submesh_lod(subindex)
+    cloth, cloth_log = None, ''
+    if not submesh_worker['nun_maps'] == False and options['transform_cloth'] == True and submesh_lod['clothID'] in [1,2]:
+        with contextlib.redirect_stdout(io.StringIO()) as f:
+            try:
+                cloth = render_submesh_cloth(submesh, subindex, submesh_lod, mesh_index, submesh_worker['skel_data'],\
+                    submesh_worker['nun_maps'], e = options['e'])
+            except:
+                cloth = False
+        cloth_log = f.getvalue()
+    return(log.getvalue(), cloth_log, cloth)
+
+# With jobs > 1 (and g1m_chunk, the G1M file name and its G1MG chunk, so workers can map the file), submeshes are
+# spread over a process pool.  Files and console output are identical to a serial run.
 def write_submeshes(g1mg_stream, model_mesh_metadata, skel_data, nun_maps, path = '', e = '<', cull_vertices = True,\
-        transform_cloth = True, write_empty_buffers = False, preserve_trianglestrip = False):
-    if not nun_maps == False:
-        nun_indices = [x['name'][0:4] for x in nun_maps['nun_data']]
-        if 'nunv' in nun_indices:
-            nunv_offset = [x['name'][0:4] for x in nun_maps['nun_data']].index('nunv')
-        if 'nuns' in nun_indices:
-            nuns_offset = [x['name'][0:4] for x in nun_maps['nun_data']].index('nuns')
+        transform_cloth = True, write_empty_buffers = False, preserve_trianglestrip = False, jobs = 1, g1m_chunk = None):
     cloth_render_fail = False
-    driverMesh_fmt = make_drivermesh_fmt()
-    subvbs = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]
-    lod_data = [x for x in model_mesh_metadata["sections"] if x['type'] == 'MESH_LOD'][0]
+    mesh_index = MeshMetadataIndex(model_mesh_metadata)
+    subvbs = mesh_index.section("SUBMESH")
+    if jobs > 1 and not g1m_chunk == None and len(subvbs['data']) > 1:
+        options = {'path': path, 'e': e, 'cull_vertices': cull_vertices, 'transform_cloth': transform_cloth,\
+            'write_empty_buffers': write_empty_buffers, 'preserve_trianglestrip': preserve_trianglestrip, 'jobs': jobs}
+        # Contiguous runs of submeshes per task, as neighbouring submeshes usually share a vertex buffer
+        chunksize = max(1, len(subvbs['data']) // (jobs * 4))
+        with multiprocessing.Pool(jobs, init_submesh_worker,\
+                (g1m_chunk, mesh_index.metadata, skel_data, nun_maps, options)) as pool:
+            for subindex, (log, cloth_log, cloth) in\
+                    enumerate(pool.imap(submesh_worker_task, range(len(subvbs['data'])), chunksize)):
+                print(log, end='')
+                if cloth_render_fail == False and not cloth == None:
+                    print(cloth_log, end='')
+                    if not cloth == False:
+                        try:
+                            write_cloth_submesh(subindex, cloth[0], cloth[1], path = path,\
+                                write_empty_buffers = write_empty_buffers)
+                        except:
+                            cloth = False
+                    if cloth == False:
+                        cloth_render_fail = True
+                        print("Rendering cloth mesh failed!  Cloth mesh rendering will be skipped.")
+        return
+    vb_cache = VertexBufferCache(g1mg_stream, mesh_index, e)
     for subindex in range(len(subvbs['data'])):
-        print("Processing submesh {0}...".format(subindex))
-        submesh = generate_submesh(subindex, g1mg_stream, model_mesh_metadata,\
-            skel_data, fmts = generate_fmts(model_mesh_metadata), e=e, cull_vertices = cull_vertices,\
-            preserve_trianglestrip = preserve_trianglestrip)
-        write_fmt(submesh['fmt'],'{0}{1}.fmt'.format(path, subindex))
-        if len(submesh['ib']) > 0 or write_empty_buffers == True:
-            write_ib(submesh['ib'],'{0}{1}.ib'.format(path, subindex), submesh['fmt'])
-            write_vb(submesh['vb'],'{0}{1}.vb'.format(path, subindex), submesh['fmt'])
-        if not submesh["vgmap"] == False:
-            with open('{0}{1}.vgmap'.format(path, subindex), 'wb') as f:
-                f.write(json.dumps(submesh['vgmap'], indent=4).encode("utf-8"))
-        lod_blocks_combined = [x for y in lod_data['data'] for x in y['lod']]
-        submesh_lod = [x for x in lod_blocks_combined if subindex in x['indices']][0]
+        submesh = write_submesh(subindex, g1mg_stream, mesh_index, skel_data, path = path, e = e,\
+            cull_vertices = cull_vertices, write_empty_buffers = write_empty_buffers,\
+            preserve_trianglestrip = preserve_trianglestrip, vb_cache = vb_cache)
+        submesh_lod = mesh_index.get_submesh_lod(subindex)
         if cloth_render_fail == False and not nun_maps == False:
             try:
-                if submesh_lod['clothID'] == 1 and not nun_maps == False and transform_cloth == True:
-                    print("Performing cloth mesh (4D) transformation...".format(subindex))
-                    if (submesh_lod['NUNID']) >= 10000 and (submesh_lod['NUNID'] < 20000):
-                        NUNID = (submesh_lod['NUNID'] % 10000) + nunv_offset
-                    else:
-                        NUNID = submesh_lod['NUNID'] % 10000
-                    transformed_submesh = render_cloth_submesh(submesh, NUNID, skel_data, nun_maps, e=e)
-                    write_fmt(transformed_submesh['fmt'],'{0}{1}_transformed.fmt'.format(path, subindex))
-                    if len(transformed_submesh['ib']) > 0 or write_empty_buffers == True:
-                        write_ib(transformed_submesh['ib'],'{0}{1}_transformed.ib'.format(path, subindex), transformed_submesh['fmt'])
-                        write_vb(transformed_submesh['vb'],'{0}{1}_transformed.vb'.format(path, subindex), transformed_submesh['fmt'])
-                    if not transformed_submesh["vgmap"] == False:
-                        with open('{0}{1}_transformed.vgmap'.format(path, subindex), 'wb') as f:
-                            f.write(json.dumps(transformed_submesh['vgmap'], indent=4).encode("utf-8"))
-                    drivermesh = nun_maps['driverMeshList'][NUNID]
-                    write_fmt(driverMesh_fmt,'{0}{1}_drivermesh.fmt'.format(path, subindex))
-                    if len(transformed_submesh['ib']) > 0 or write_empty_buffers == True:
-                        write_ib(drivermesh['indices'],'{0}{1}_drivermesh.ib'.format(path, subindex), driverMesh_fmt)
-                        write_vb(drivermesh['vertices'],'{0}{1}_drivermesh.vb'.format(path, subindex), driverMesh_fmt)
-                if submesh_lod['clothID'] == 2 and transform_cloth == True:
-                    print("Performing cloth mesh (4D) transformation...".format(subindex))
-                    transformed_submesh = render_cloth_submesh_2(submesh, subindex, model_mesh_metadata, skel_data)
-                    write_fmt(transformed_submesh['fmt'],'{0}{1}_transformed.fmt'.format(path, subindex))
-                    if len(transformed_submesh['ib']) > 0 or write_empty_buffers == True:
-                        write_ib(transformed_submesh['ib'],'{0}{1}_transformed.ib'.format(path, subindex), transformed_submesh['fmt'])
-                        write_vb(transformed_submesh['vb'],'{0}{1}_transformed.vb'.format(path, subindex), transformed_submesh['fmt'])
+                if submesh_lod['clothID'] in [1,2] and transform_cloth == True:
+                    transformed_submesh, drivermesh = render_submesh_cloth(submesh, subindex, submesh_lod,\
+                        mesh_index, skel_data, nun_maps, e=e)
+                    write_cloth_submesh(subindex, transformed_submesh, drivermesh, path = path,\
+                        write_empty_buffers = write_empty_buffers)
             except:
                 cloth_render_fail = True
                 print("Rendering cloth mesh failed!  Cloth mesh rendering will be skipped.")
+    return
 
 # The argument passed (g1m_name) is actually the folder name
 def parseSkelG1M(g1m_name):
-    with open(g1m_name + '.g1m', "rb") as f:
-        file = {}
-        file["file_magic"], = struct.unpack(">I", f.read(4))
-        if file["file_magic"] == 0x5F4D3147:
-            e = '<' # Little Endian
-        elif file["file_magic"] == 0x47314D5F:
-            e = '>' # Big Endian
-        else:
-            print("not G1M!") # Figure this out later
-            sys.exit()
-        file["file_version"] = f.read(4).hex()
-        file["file_size"], = struct.unpack(e+"I", f.read(4))
-        chunks = {}
-        chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
-        chunks["chunks"] = []
-        f.seek(chunks["starting_offset"])
+    with G1MContainer.open(g1m_name + '.g1m') as g1m:
         have_skeleton = False
-        for i in range(chunks["count"]):
-            chunk = {}
-            chunk["start_offset"] = f.tell()
-            chunk["magic"] = f.read(4).decode("utf-8")
-            chunk["version"] = f.read(4).hex()
-            chunk["size"], = struct.unpack(e+"I", f.read(4))
-            chunks["chunks"].append(chunk)
+        for chunk in g1m.chunks:
             if chunk["magic"] in ['G1MS', 'SM1G'] and have_skeleton == False:
-                f.seek(chunk["start_offset"],0)
-                g1ms_data = parseG1MS(f.read(chunk["size"]),e)
+                g1ms_data = parseG1MS(g1m.get_chunk(chunk),g1m.e)
                 ext_skel_data = calc_abs_skeleton(g1ms_data)
                 if os.path.exists(g1m_name+'Oid.bin'):
                     ext_skel_oid = binary_oid_to_dict(g1m_name+'Oid.bin')
                     ext_skel_data = name_bones(ext_skel_data, ext_skel_oid)
                 have_skeleton == True # I guess some games duplicate this section?
-            else:
-                f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next chunk
-            file["chunks"] = chunks
     return(ext_skel_data)
 
-def get_ext_skeleton(g1m_name):
+# External skeletons that are already parsed, keyed by the absolute path of the skeleton g1m (without .g1m).
+# Filled by batch_process() so each skeleton is parsed once; get_ext_skeleton() returns copies.
+ext_skeletons = {}
+
+# Name of the g1m (without .g1m) with the external skeleton for g1m_name, or False.  If it cannot be determined
+# from elixir.json / gmpk.json / the model name, the user is asked unless interactive is False.
+def find_ext_skeleton(g1m_name, interactive = True):
     if os.path.exists('elixir.json'): # Assuming first g1m is the skeleton
         with open('elixir.json','r') as f:
             elixir = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
@@ -1276,7 +1711,7 @@ def get_ext_skeleton(g1m_name):
     else:
         ext_skel_model = g1m_name.split("_MODEL_")[0]+'_MODEL' # Assuming single external skeleton
     if os.path.exists(ext_skel_model+'.g1m'):
-        return(parseSkelG1M(ext_skel_model))
+        return(ext_skel_model)
     else:
         g1m_files = glob.glob('*.g1m')
         g1m = {}
@@ -1284,6 +1719,8 @@ def get_ext_skeleton(g1m_name):
             return False
         elif len(g1m_files) == 1 and g1m_files[0] == g1m_name+'.g1m':
             return False
+        elif interactive == False:
+            return False
         else:
             print('For processing g1m ' + g1m_name + '.g1m, which g1m file has your skeleton?\n')
             for i in range(len(g1m_files)):
@@ -1296,42 +1733,32 @@ def get_ext_skeleton(g1m_name):
                 except ValueError:
                     pass
             if g1m_file_choice in range(len(g1m_files)):
-                return(parseSkelG1M(g1m_files[g1m_file_choice][:-4]))
+                return(g1m_files[g1m_file_choice][:-4])
             else:
                 return False
 
+def get_ext_skeleton(g1m_name, interactive = True):
+    ext_skel_model = find_ext_skeleton(g1m_name, interactive = interactive)
+    if ext_skel_model == False:
+        return False
+    if os.path.abspath(ext_skel_model) in ext_skeletons:
+        # combine_skeleton() modifies the skeleton it is given
+        return(copy.deepcopy(ext_skeletons[os.path.abspath(ext_skel_model)]))
+    return(parseSkelG1M(ext_skel_model))
+
 # The argument passed (g1m_name) is actually the folder name
-def parseG1M(g1m_name, overwrite = False, write_buffers = True, cull_vertices = True, transform_cloth = transform_cloth_mesh_default, write_empty_buffers = False, preserve_trianglestrip = False):
-    with open(g1m_name + '.g1m', "rb") as f:
-        print("Processing {0}...".format(g1m_name + '.g1m'))
-        file = {}
-        nun_struct = {}
-        file["file_magic"], = struct.unpack(">I", f.read(4))
-        if file["file_magic"] == 0x5F4D3147:
-            e = '<' # Little Endian
-        elif file["file_magic"] == 0x47314D5F:
-            e = '>' # Big Endian
-        else:
-            print("not G1M!") # Figure this out later
-            sys.exit()
-        file["file_version"], = struct.unpack(e+"I", f.read(4))
-        file["file_size"], = struct.unpack(e+"I", f.read(4))
-        chunks = {}
-        chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
-        chunks["chunks"] = []
-        f.seek(chunks["starting_offset"])
+# With interactive set to False, the user is never asked anything: an existing folder is skipped (returns False)
+# unless overwrite is True, and an external skeleton that cannot be found automatically is treated as missing.
+def parseG1M(g1m_name, overwrite = False, write_buffers = True, cull_vertices = True, transform_cloth = transform_cloth_mesh_default, write_empty_buffers = False, preserve_trianglestrip = False, jobs = 1, interactive = True):
+    print("Processing {0}...".format(g1m_name + '.g1m'))
+    with G1MContainer.open(g1m_name + '.g1m') as g1m:
+        e = g1m.e
+        nun_index = NUNIndex(e)
         have_skeleton = False
         nun_parse_fail = False
-        for i in range(chunks["count"]):
-            chunk = {}
-            chunk["start_offset"] = f.tell()
-            chunk["magic"] = f.read(4).decode("utf-8")
-            chunk["version"] = f.read(4).hex()
-            chunk["size"], = struct.unpack(e+"I", f.read(4))
-            chunks["chunks"].append(chunk)
+        for chunk in g1m.chunks:
             if chunk["magic"] in ['G1MS', 'SM1G'] and have_skeleton == False:
-                f.seek(chunk["start_offset"],0)
-                model_skel_data = parseG1MS(f.read(chunk["size"]),e)
+                model_skel_data = parseG1MS(g1m.get_chunk(chunk),e)
                 if os.path.exists(g1m_name+'Oid.bin'):
                     model_skel_oid = binary_oid_to_dict(g1m_name+'Oid.bin')
                     model_skel_data = name_bones(model_skel_data, model_skel_oid)
@@ -1339,40 +1766,37 @@ def parseG1M(g1m_name, overwrite = False, write_buffers = True, cull_vertices =
                     #Internal Skeleton
                     model_skel_data = calc_abs_skeleton(model_skel_data)
                 else:
-                    ext_skel = get_ext_skeleton(g1m_name)
+                    ext_skel = get_ext_skeleton(g1m_name, interactive = interactive)
                     if not ext_skel == False:
                         model_skel_data = combine_skeleton(ext_skel, model_skel_data)
                 have_skeleton = True # I guess some games duplicate this section?
             elif chunk["magic"] in ['NUNO', 'ONUN', 'NUNV', 'VNUN', 'NUNS', 'SNUN'] and transform_cloth == True:
                 try:
-                    f.seek(chunk["start_offset"],0)
                     if chunk["magic"] in ['NUNO', 'ONUN']: # NUNO
-                        nun_struct["nuno"] = parseNUNO(f.read(chunk["size"]),e)
+                        nun_index.add_section('nuno', g1m.get_chunk(chunk))
                     elif chunk["magic"] in ['NUNV', 'VNUN']: # NUNV
-                        nun_struct["nunv"] = parseNUNV(f.read(chunk["size"]),e)
+                        nun_index.add_section('nunv', g1m.get_chunk(chunk))
                     elif chunk["magic"] in ['NUNS', 'SNUN']: # NUNS
-                        nun_struct["nuns"] = parseNUNS(f.read(chunk["size"]),e)
+                        nun_index.add_section('nuns', g1m.get_chunk(chunk))
                 except:
                     nun_parse_fail = True
                     print("Parsing cloth mesh NUN data failed!  Cloth mesh rendering will be skipped.")
-                    f.seek(chunk["start_offset"] + chunk["size"],0)
             elif chunk["magic"] in ['G1MG', 'GM1G']:
-                f.seek(chunk["start_offset"],0)
-                g1mg_stream = f.read(chunk["size"])
+                # A view into the mapped file; buffers are sliced out of it as each submesh is generated
+                g1mg_stream = g1m.get_chunk(chunk)
+                g1mg_chunk = chunk
                 model_mesh_metadata = parseG1MG(g1mg_stream,e)
-            else:
-                f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next chunk
-            file["chunks"] = chunks
         nun_maps = False
-        if len(nun_struct) > 0 and model_skel_data['jointCount'] > 1 and transform_cloth == True:
+        if len(nun_index.sections) > 0 and model_skel_data['jointCount'] > 1 and transform_cloth == True:
             try:
-                nun_data = stack_nun(nun_struct)
-                nun_maps = calc_nun_maps(nun_data, model_skel_data)
-                if not nun_maps == False:
-                    nun_maps['nun_data'] = nun_data
+                # Only the NUN blocks that cloth submeshes use are parsed and compiled
+                nun_maps = nun_index.nun_maps(model_skel_data, referenced_nun_blocks(model_mesh_metadata, nun_index.headers))
             except:
                 print("Compiling cloth mesh NUN data failed!  Cloth mesh rendering will be skipped.")
         if os.path.exists(g1m_name) and (os.path.isdir(g1m_name)) and (overwrite == False):
+            if interactive == False:
+                print(g1m_name + " folder exists, skipping.")
+                return(False)
             if str(input(g1m_name + " folder exists! Overwrite? (y/N) ")).lower()[0:1] == 'y':
                 overwrite = True
         if (overwrite == True) or not os.path.exists(g1m_name):
@@ -1380,16 +1804,134 @@ def parseG1M(g1m_name, overwrite = False, write_buffers = True, cull_vertices =
                 os.mkdir(g1m_name)
             with open(g1m_name+"/mesh_metadata.json", "wb") as f:
                 f.write(json.dumps(model_mesh_metadata, indent=4).encode("utf-8"))
+            # Binary copy for fast loading, rebuilt automatically by read_metadata() if the JSON is edited
+            write_metadata_sidecar(g1m_name+"/mesh_metadata.json")
             #with open(g1m_name+"/skel_data.json", "wb") as f:
                 #f.write(json.dumps(model_skel_data, indent=4).encode("utf-8"))
             if write_buffers == True:
                 write_submeshes(g1mg_stream, model_mesh_metadata, model_skel_data,\
                     nun_maps, path = g1m_name+'/', e=e, cull_vertices = cull_vertices,\
                     transform_cloth = transform_cloth, write_empty_buffers = write_empty_buffers,\
-                    preserve_trianglestrip = preserve_trianglestrip)
+                    preserve_trianglestrip = preserve_trianglestrip, jobs = jobs, g1m_chunk = (g1m.filename, g1mg_chunk))
     return(True)
 
+# Models in directory, chosen as when the scripts are run without arguments: the g1m files in elixir.json or
+# gmpk.json (except the first, which is the skeleton), else *_MODEL_*.g1m, else every g1m file (unless
+# all_files is False, then the caller can ask which one to use).
+def find_models(directory = '.', all_files = True):
+    g1m_files = sorted([os.path.basename(x) for x in glob.glob(os.path.join(glob.escape(directory), '*.g1m'))])
+    models = []
+    if os.path.exists(os.path.join(directory, 'elixir.json')):
+        try:
+            with open(os.path.join(directory, 'elixir.json'),'r') as f:
+                elixir = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
+            models = [x for x in elixir['files'] if x[-4:] == '.g1m' and x in g1m_files][1:]
+        except:
+            pass
+    elif os.path.exists(os.path.join(directory, 'gmpk.json')):
+        try:
+            with open(os.path.join(directory, 'gmpk.json'),'r') as f:
+                gmpk = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
+            models = [x['name']+'.g1m' for x in gmpk['SDP']['NID']['names'] if x['name']+'.g1m' in g1m_files][1:]
+        except:
+            pass
+    if len(models) == 0:
+        models = [x for x in g1m_files if '_MODEL_' in x[:-4]]
+    if len(models) == 0 and all_files == True:
+        models = g1m_files
+    return([x[:-4] for x in models])
+
+# Runs process_model (parseG1M, G1M2glTF...) non-interactively on one model, from the model's folder.  Console
+# output is captured and returned with the result, so the output of models processed in parallel is not mixed.
+def batch_process_model(process_model, directory, g1m_name, options = {}):
+    result = {'directory': directory, 'model': g1m_name, 'status': 'ok', 'error': None}
+    start = time.perf_counter()
+    current_dir = os.getcwd()
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        try:
+            os.chdir(directory)
+            if process_model(g1m_name, interactive = False, **options) == False:
+                result['status'] = 'skipped'
+        except (Exception, SystemExit) as err:
+            result['status'] = 'failed'
+            result['error'] = traceback.format_exception_only(type(err), err)[-1].strip()
+            print(traceback.format_exc(), end='')
+        finally:
+            os.chdir(current_dir)
+    result['seconds'] = time.perf_counter() - start
+    result['log'] = log.getvalue()
+    return(result)
+
+def init_batch_worker(skeletons):
+    ext_skeletons.update(skeletons)
+    return
+
+def batch_worker_task(task):
+    return(batch_process_model(*task))
+
+# Processes every model under directory (see find_models()) without asking anything, with up to jobs models at
+# a time.  Each external skeleton is parsed once, before any model, and shared read-only with the workers.
+# A summary of the results and timings is printed and written to batch_summary.json in directory.
+def batch_process(directory, process_model = None, jobs = 1, options = {}):
+    if process_model == None:
+        process_model = parseG1M
+    directory = os.path.abspath(directory)
+    start = time.perf_counter()
+    tasks = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for g1m_name in find_models(root):
+            tasks.append((process_model, root, g1m_name, options))
+    skeletons = {}
+    failed_skeletons = []
+    current_dir = os.getcwd()
+    for task in tasks:
+        ext_skel_model = False
+        try:
+            os.chdir(task[1])
+            ext_skel_model = find_ext_skeleton(task[2], interactive = False)
+            if not ext_skel_model == False and not os.path.abspath(ext_skel_model) in skeletons\
+                    and not os.path.abspath(ext_skel_model) in failed_skeletons:
+                print("Reading skeleton {0}...".format(os.path.abspath(ext_skel_model) + '.g1m'))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    skeletons[os.path.abspath(ext_skel_model)] = parseSkelG1M(ext_skel_model)
+        except (Exception, SystemExit):
+            if not ext_skel_model == False: # Reported by the models that need it
+                failed_skeletons.append(os.path.abspath(ext_skel_model))
+        finally:
+            os.chdir(current_dir)
+    results = []
+    if jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(jobs, len(tasks)), init_batch_worker, (skeletons,)) as pool:
+            for result in pool.imap_unordered(batch_worker_task, tasks):
+                print(result['log'], end='')
+                results.append(result)
+    else:
+        ext_skeletons.update(skeletons)
+        for task in tasks:
+            results.append(batch_process_model(*task))
+            print(results[-1]['log'], end='')
+    task_order = {(tasks[i][1], tasks[i][2]):i for i in range(len(tasks))}
+    results.sort(key = lambda x: task_order[(x['directory'], x['model'])])
+    summary = {'directory': directory, 'jobs': jobs, 'seconds': time.perf_counter() - start,\
+        'skeletons': len(skeletons)}
+    for status in ['ok', 'failed', 'skipped']:
+        summary[status] = len([x for x in results if x['status'] == status])
+    summary['models'] = [{k:v for k,v in x.items() if not k == 'log'} for x in results]
+    print("\n{0:<8} {1:>9}  {2}".format('status', 'seconds', 'model'))
+    for result in summary['models']:
+        print("{0:<8} {1:>9.2f}  {2}".format(result['status'], result['seconds'],\
+            os.path.relpath(os.path.join(result['directory'], result['model'] + '.g1m'), directory)))
+        if result['status'] == 'failed':
+            print("         {0}".format(result['error']))
+    print("{0} models: {1} ok, {2} failed, {3} skipped, {4:.2f} seconds.".format(len(results), summary['ok'],\
+        summary['failed'], summary['skipped'], summary['seconds']))
+    with open(os.path.join(directory, 'batch_summary.json'), 'wb') as f:
+        f.write(json.dumps(summary, indent=4).encode("utf-8"))
+    return(summary)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Pool workers in frozen (pyinstaller) builds
     # Set current directory
     if getattr(sys, 'frozen', False):
         os.chdir(os.path.dirname(sys.executable))
@@ -1407,55 +1949,41 @@ if __name__ == "__main__":
         else:
             parser.add_argument('-t', '--transform', help="Transform cloth meshes (4D->3D)", action="store_true")
         parser.add_argument('-e', '--write_empty_buffers', help="Write ib/vb files even if 0 bytes", action="store_true")
-        parser.add_argument('g1m_filename', help="Name of g1m file to extract meshes / G1MG metadata (required).")
+        parser.add_argument('-j', '--jobs', help="Number of processes for writing submeshes, or for models with --batch (default 1)", type=int, default=1)
+        parser.add_argument('-b', '--batch', help="Process every model in this folder and its subfolders without prompts, then write batch_summary.json", metavar='FOLDER')
+        parser.add_argument('g1m_filename', help="Name of g1m file to extract meshes / G1MG metadata (required, unless using --batch).", nargs='?')
         args = parser.parse_args()
         if transform_cloth_mesh_default == True:
             transform_cloth = args.skip_transform
         else:
             transform_cloth = args.transform
-        if os.path.exists(args.g1m_filename) and args.g1m_filename[-4:].lower() == '.g1m':
+        if not args.batch == None:
+            batch_process(args.batch, parseG1M, jobs = args.jobs, options = {'overwrite': args.overwrite,\
+                'write_buffers': args.no_buffers, 'cull_vertices': args.full_vertices,\
+                'transform_cloth': transform_cloth, 'write_empty_buffers': args.write_empty_buffers})
+        elif not args.g1m_filename == None and os.path.exists(args.g1m_filename) and args.g1m_filename[-4:].lower() == '.g1m':
             parseG1M(args.g1m_filename[:-4], overwrite = args.overwrite,\
                 write_buffers = args.no_buffers, cull_vertices = args.full_vertices,\
-                transform_cloth = transform_cloth, write_empty_buffers = args.write_empty_buffers)
+                transform_cloth = transform_cloth, write_empty_buffers = args.write_empty_buffers, jobs = args.jobs)
     else:
         # When run without command line arguments, it will attempt to obtain data from all models
-        current_dir_g1m_files = glob.glob('*.g1m')
-        models = []
-        if os.path.exists('elixir.json'):
-            try:
-                with open('elixir.json','r') as f:
-                    elixir = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
-                models = [x for x in elixir['files'] if x[-4:] == '.g1m' and x in current_dir_g1m_files][1:]
-            except:
-                pass
-        elif os.path.exists('gmpk.json'):
-            try:
-                with open('gmpk.json','r') as f:
-                    gmpk = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
-                models = [x['name']+'.g1m' for x in gmpk['SDP']['NID']['names'] if x['name']+'.g1m' in current_dir_g1m_files][1:]
-            except:
-                pass
+        models = find_models('.', all_files = False)
         if len(models) > 0:
             for i in range(len(models)):
-                parseG1M(models[i][:-4])
+                parseG1M(models[i])
         else:
-            models = glob.glob('*_MODEL_*.g1m')
-            if len(models) > 0:
-                for i in range(len(models)):
-                    parseG1M(models[i][:-4])
-            else:
-                g1m_files = glob.glob('*.g1m')
-                if len(g1m_files) == 1:
-                    parseG1M(g1m_files[0][:-4])
-                elif len(g1m_files) > 1:
-                    print('Which g1m file do you want to unpack?\n')
-                    for i in range(len(g1m_files)):
-                        print(str(i+1) + '. ' + g1m_files[i])
-                    g1m_file_choice = -1
-                    while (g1m_file_choice < 0) or (g1m_file_choice >= len(g1m_files)):
-                        try:
-                            g1m_file_choice = int(input("\nPlease enter which g1m file to use:  ")) - 1
-                        except ValueError:
-                            pass
-                    if g1m_file_choice in range(len(g1m_files)):
-                        parseG1M(g1m_files[g1m_file_choice][:-4])
+            g1m_files = glob.glob('*.g1m')
+            if len(g1m_files) == 1:
+                parseG1M(g1m_files[0][:-4])
+            elif len(g1m_files) > 1:
+                print('Which g1m file do you want to unpack?\n')
+                for i in range(len(g1m_files)):
+                    print(str(i+1) + '. ' + g1m_files[i])
+                g1m_file_choice = -1
+                while (g1m_file_choice < 0) or (g1m_file_choice >= len(g1m_files)):
+                    try:
+                        g1m_file_choice = int(input("\nPlease enter which g1m file to use:  ")) - 1
+                    except ValueError:
+                        pass
+                if g1m_file_choice in range(len(g1m_files)):
+                    parseG1M(g1m_files[g1m_file_choice][:-4])
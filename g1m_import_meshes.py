@@ -16,7 +16,7 @@
 # GitHub eArmada8/gust_stuff
 
 try:
-    import glob, os, io, sys, re, copy, struct, shutil, json
+    import glob, os, io, sys, re, copy, struct, shutil, json, numpy
     from lib_fmtibvb import *
     from g1m_export_meshes import *
 except ModuleNotFoundError as e:
@@ -24,38 +24,11 @@ except ModuleNotFoundError as e:
     input("Press Enter to abort.")
     raise
 
+# Chunks are copied out of the mapping, so that the G1M is not kept mapped (and locked on Windows) by the caller
 def parseG1MforG1MF(g1m_name):
-    with open(g1m_name + '.g1m', "rb") as f:
-        file = {}
-        file["file_magic"], = struct.unpack(">I", f.read(4))
-        if file["file_magic"] == 0x5F4D3147:
-            e = '<' # Little Endian
-        elif file["file_magic"] == 0x47314D5F:
-            e = '>' # Big Endian
-        else:
-            print("not G1M!") # Figure this out later
-            sys.exit()
-        file["file_version"] = f.read(4).hex()
-        file["file_size"], = struct.unpack(e+"I", f.read(4))
-        chunks = {}
-        chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
-        chunks["chunks"] = []
-        f.seek(chunks["starting_offset"])
-        have_skeleton = False
-        for i in range(chunks["count"]):
-            chunk = {}
-            chunk["start_offset"] = f.tell()
-            chunk["magic"] = f.read(4).decode("utf-8")
-            chunk["version"] = f.read(4).hex()
-            chunk["size"], = struct.unpack(e+"I", f.read(4))
-            chunks["chunks"].append(chunk)
-            if chunk["magic"] in ['G1MF', 'FM1G']:
-                f.seek(chunk["start_offset"],0)
-                g1mf_stream = f.read(chunk["size"])
-            else:
-                f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next chunk
-            file["chunks"] = chunks
-        return(g1mf_stream)
+    with G1MContainer.open(g1m_name + '.g1m') as g1m:
+        g1mf_chunk = g1m.get(['G1MF', 'FM1G'])
+        return(None if g1mf_chunk == None else bytes(g1mf_chunk))
 
 def parseG1MF(g1mf_stream,e):
     g1mf_section = {}
@@ -125,37 +98,9 @@ def build_g1mf(new_g1mg_stream, g1m_name, e = '<'):
     return(new_g1mf)
 
 def parseG1MforG1MG(g1m_name):
-    with open(g1m_name + '.g1m', "rb") as f:
-        file = {}
-        file["file_magic"], = struct.unpack(">I", f.read(4))
-        if file["file_magic"] == 0x5F4D3147:
-            e = '<' # Little Endian
-        elif file["file_magic"] == 0x47314D5F:
-            e = '>' # Big Endian
-        else:
-            print("not G1M!") # Figure this out later
-            sys.exit()
-        file["file_version"] = f.read(4).hex()
-        file["file_size"], = struct.unpack(e+"I", f.read(4))
-        chunks = {}
-        chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
-        chunks["chunks"] = []
-        f.seek(chunks["starting_offset"])
-        have_skeleton = False
-        for i in range(chunks["count"]):
-            chunk = {}
-            chunk["start_offset"] = f.tell()
-            chunk["magic"] = f.read(4).decode("utf-8")
-            chunk["version"] = f.read(4).hex()
-            chunk["size"], = struct.unpack(e+"I", f.read(4))
-            chunks["chunks"].append(chunk)
-            if chunk["magic"] in ['G1MG', 'GM1G']:
-                f.seek(chunk["start_offset"],0)
-                g1mg_stream = f.read(chunk["size"])
-            else:
-                f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next chunk
-            file["chunks"] = chunks
-        return(g1mg_stream)
+    with G1MContainer.open(g1m_name + '.g1m') as g1m:
+        g1mg_chunk = g1m.get(['G1MG', 'GM1G'])
+        return(None if g1mg_chunk == None else bytes(g1mg_chunk))
 
 def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_data, e = '<'):
     subvbs = [x for x in model_mesh_metadata['sections'] if x['type'] == "SUBMESH"][0]
@@ -181,14 +126,17 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
             try:
                 mesh_fmt = read_fmt("{0}/{1}.fmt".format(g1m_name, existing_submeshes[0]))
                 mesh_stride = mesh_fmt['vb0 stride'] if 'vb0 stride' in mesh_fmt else mesh_fmt['stride']
-                composite_vb = []
-                composite_ib = []
+                # Submesh buffers are memory-mapped and only decoded when the mesh is concatenated at the end
+                submesh_vbs = []
+                submesh_ibs = []
+                vertex_count = 0
+                index_count = 0
                 vbsub_info = {}
                 for j in range(len(existing_submeshes)):
                     print("Processing submesh {0}...".format(existing_submeshes[j]))
                     fmt = read_fmt("{0}/{1}.fmt".format(g1m_name, existing_submeshes[j]))
-                    vb = read_vb("{0}/{1}.vb".format(g1m_name, existing_submeshes[j]), fmt)
-                    ib = read_ib("{0}/{1}.ib".format(g1m_name, existing_submeshes[j]), fmt)
+                    vb = VertexBuffer(read_vb("{0}/{1}.vb".format(g1m_name, existing_submeshes[j]), fmt, use_mmap = True), decode = False)
+                    ib = read_ib("{0}/{1}.ib".format(g1m_name, existing_submeshes[j]), fmt, use_mmap = True)
                     stride = fmt['vb0 stride'] if 'vb0 stride' in fmt else fmt['stride']
                     # Do not process submesh if it does not match the existing format (set by the first submesh)
                     compatible_fmt = False
@@ -199,7 +147,7 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                         fmt_contents = ['{0}_{1}'.format(x['SemanticName'], x['SemanticIndex']) for x in fmt['elements']]
                         mesh_fmt_contents = ['{0}_{1}'.format(x['SemanticName'], x['SemanticIndex']) for x in mesh_fmt['elements']]
                         if all([x in fmt_contents for x in mesh_fmt_contents]):
-                            vb = [vb[fmt_contents.index(x)] for x in mesh_fmt_contents]
+                            vb = VertexBuffer([vb[fmt_contents.index(x)] for x in mesh_fmt_contents], decode = False)
                             #Some G1M games omit the final weight, so we need to strip it out
                             num_weights = len([x for x in fmt['elements'] if x['SemanticName'] == 'BLENDINDICES'])
                             for k in range(num_weights):
@@ -207,7 +155,7 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                                 current_wt_len = len(re.findall('[0-9]+', fmt['elements'][fmt_contents.index('BLENDWEIGHT_{}'.format(k))]['Format'].split('_')[0]))
                                 if current_wt_len > correct_wt_len:
                                     current_wt_index = mesh_fmt_contents.index('BLENDWEIGHT_{}'.format(k)) # The buffer has already been re-ordered
-                                    vb[current_wt_index]['Buffer'] = [x[:correct_wt_len] for x in vb[current_wt_index]['Buffer']]
+                                    vb[current_wt_index]['Buffer'] = numpy.asarray(vb[current_wt_index]['Buffer'])[:,:correct_wt_len]
                             fmt = mesh_fmt
                             compatible_fmt = True
                     if compatible_fmt == True:
@@ -226,20 +174,18 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                                     if len(vg_indices) > len(wt_indices): # Do not evaluate excess BLENDINDICES
                                         blidx_layers = dict(sorted({int(vb[i]['SemanticIndex']):i for i in vg_indices}.items()))
                                         vg_indices = [blidx_layers[layer] for layer in blidx_layers if layer < len(wt_indices)]
-                                    bl_indices = [vb[x]['Buffer'] for x in vg_indices]
-                                    used_bones = [sorted(list(set([x for y in z for x in y]))) for z in bl_indices]
+                                    bl_indices = [numpy.asarray(vb[x]['Buffer']) for x in vg_indices]
+                                    used_bones = [numpy.unique(z).tolist() for z in bl_indices]
                                     rev_vgmaps = [{vgmap[x]:x for x in vgmap if vgmap[x] in z} for z in used_bones]
                                     missing_bones = [[x for x in z.values() if x not in correct_vgmap] for z in rev_vgmaps]
                                     for k in range(len(rev_vgmaps)):
                                         do_map_check = True
-                                        indices = [x for y in bl_indices[k] for x in y]
                                         wt_index = [m for m in wt_indices if semantic_indices[m] == semantic_indices[vg_indices[k]]][0]
-                                        weights_copy = copy.deepcopy(vb[wt_index]['Buffer'])
+                                        weights = numpy.asarray(vb[wt_index]['Buffer'])
                                         # Some games use a longer index buffer than weights buffer (4 bytes for index, VEC3 float for weights)
-                                        while len(bl_indices[k][0]) > len(weights_copy[0]):
-                                            weights_copy = [x+[0.0] for x in weights_copy]
-                                        weights = [x for y in weights_copy for x in y]
-                                        true_indices = sorted(list(set([indices[m] for m in range(len(indices)) if weights[m] > 0.0])))
+                                        if bl_indices[k].shape[1] > weights.shape[1]:
+                                            weights = numpy.pad(weights, ((0,0),(0,bl_indices[k].shape[1] - weights.shape[1])))
+                                        true_indices = numpy.unique(bl_indices[k][weights[:,:bl_indices[k].shape[1]] > 0.0]).tolist()
                                         true_missing_bones = [x for x in missing_bones[k] if vgmap[x] in true_indices]
                                         if len(missing_bones[k]) > 0:
                                             if len(true_missing_bones) > 0:
@@ -254,11 +200,11 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                                                 used_vg = [rev_vgmaps[k][z] for z in true_indices]
                                                 if all([x in correct_vgmap.keys() for x in used_vg]):
                                                     print("VGMap appears compatible, attempting automatic remap and repair...")
-                                                    new_buffer = []
-                                                    for m in range(len(bl_indices[k])):
-                                                        new_buffer.append([correct_vgmap[y] if y in correct_vgmap else 0 for y \
-                                                            in [rev_vgmaps[k][z] for z in bl_indices[k][m]]])
-                                                    vb[vg_indices[k]]['Buffer'] = new_buffer
+                                                    new_indices = {z:(correct_vgmap[rev_vgmaps[k][z]] if rev_vgmaps[k][z] in correct_vgmap \
+                                                        else 0) for z in used_bones[k]}
+                                                    unique_indices, inverse = numpy.unique(bl_indices[k], return_inverse = True)
+                                                    vb[vg_indices[k]]['Buffer'] = numpy.array([new_indices[z] for z in unique_indices.tolist()],\
+                                                        dtype = numpy.int64)[inverse].reshape(bl_indices[k].shape)
                                                     if max(correct_vgmap.values()) > 255 and fmt['elements'][vg_indices[k]]['Format'] == 'R8G8B8A8_UINT':
                                                         fmt['elements'][vg_indices[k]]['Format'] = 'R16G16B16A16_UINT'
                                                         for m in range(vg_indices[k]+1, len(fmt['elements'])):
@@ -273,18 +219,12 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                                                 print("Incorrect Mappings: {}".format(", ".join(incorrect_mappings)))
                                                 print("VGMap is incompatible for automatic remap and repair.")
                                                 input("Press Enter to continue.")
-                        if len(composite_vb) == 0:
-                            composite_vb = vb
-                            composite_ib = ib
-                        else:
-                            # Append the submesh to the mesh; indices need to be updated as vertices have moved in the buffer
-                            ib_offset = len(composite_vb[0]['Buffer'])
-                            for k in range(len(composite_vb)):
-                                composite_vb[k]['Buffer'].extend(vb[k]['Buffer'])
-                            for k in range(len(ib)):
-                                for l in range(len(ib[k])):
-                                    ib[k][l] += ib_offset
-                            composite_ib.extend(ib)
+                        # Append the submesh to the mesh; indices need to be updated as vertices have moved in the buffer
+                        ib = numpy.asarray(flatten_ib(ib), dtype = numpy.int64) + vertex_count
+                        submesh_vbs.append(vb)
+                        submesh_ibs.append(ib)
+                        vertex_count += len(vb[0]['Buffer'])
+                        index_count += len(ib)
                         # Determine indexBufferPrimType, which is set in submesh section instead of vertex attribute section
                         if fmt["topology"] == "trianglelist":
                             indexBufferPrimType = 3
@@ -303,13 +243,19 @@ def build_composite_buffers(g1m_name, model_mesh_metadata, g1mg_stream, skel_dat
                             "indexBufferIndex": i,\
                             "unknown2": subvbs['data'][existing_submeshes[j]]['unknown2'],\
                             "indexBufferPrimType": indexBufferPrimType,\
-                            "vertexBufferOffset": len(composite_vb[0]['Buffer']) - len(vb[0]['Buffer']),\
+                            "vertexBufferOffset": vertex_count - len(vb[0]['Buffer']),\
                             "vertexCount": len(vb[0]['Buffer']),\
-                            "indexBufferOffset": int((len(composite_ib) - len(ib)) * 3),\
-                            "indexCount": int(len(ib) * 3)}
+                            "indexBufferOffset": index_count - len(ib),\
+                            "indexCount": len(ib)}
                     else:
                         print("Skipping submesh {0}, buffer format does not match...".format(existing_submeshes[j]))
                         pass # skip if fmt does not match the first
+                composite_vb = VertexBuffer()
+                if len(submesh_vbs) > 0:
+                    for k in range(len(submesh_vbs[0])):
+                        composite_vb.append(VertexElement(submesh_vbs[0][k]['SemanticName'], submesh_vbs[0][k]['SemanticIndex'],\
+                            numpy.concatenate([numpy.asarray(x[k]['Buffer']) for x in submesh_vbs]), submesh_vbs[0][k].get('InputSlot')))
+                composite_ib = numpy.concatenate(submesh_ibs) if len(submesh_ibs) > 0 else []
             except KeyError as e:
                 print("KeyError: Missing value \"{0}\" detected in metadata while processing mesh {1} submesh {2}!".format(e.args[0], \
                     i, existing_submeshes[j]))
@@ -352,22 +298,22 @@ def define_bounding_box(composite_vbs):
     # Check every position coordinate and spread out
     for i in range(len(composite_vbs)):
         element = int([x['id'] for x in composite_vbs[i]['fmt']['elements'] if x['SemanticName'] == 'POSITION'][0])
-        #if len(composite_vbs[i]['vb'][element]['Buffer']) > 0:
-        for j in range(len(composite_vbs[i]['vb'][element]['Buffer'])):
-            box['min_x'] = min(box['min_x'], composite_vbs[i]['vb'][element]['Buffer'][j][0])
-            box['min_y'] = min(box['min_y'], composite_vbs[i]['vb'][element]['Buffer'][j][1])
-            box['min_z'] = min(box['min_z'], composite_vbs[i]['vb'][element]['Buffer'][j][2])
-            box['max_x'] = max(box['max_x'], composite_vbs[i]['vb'][element]['Buffer'][j][0])
-            box['max_y'] = max(box['max_y'], composite_vbs[i]['vb'][element]['Buffer'][j][1])
-            box['max_z'] = max(box['max_z'], composite_vbs[i]['vb'][element]['Buffer'][j][2])
+        position = numpy.asarray(composite_vbs[i]['vb'][element]['Buffer'])
+        if len(position) > 0:
+            box['min_x'] = min(box['min_x'], float(position[:,0].min()))
+            box['min_y'] = min(box['min_y'], float(position[:,1].min()))
+            box['min_z'] = min(box['min_z'], float(position[:,2].min()))
+            box['max_x'] = max(box['max_x'], float(position[:,0].max()))
+            box['max_y'] = max(box['max_y'], float(position[:,1].max()))
+            box['max_z'] = max(box['max_z'], float(position[:,2].max()))
     return(box)
 
 def build_g1mg(g1m_name, skel_data, e = '<'):
     # Retrieve G1MG section from the current G1M file, as there will be sections we do not rebuild
     g1mg_stream = parseG1MforG1MG(g1m_name)
-    # Load the metadata - if it does not exist in JSON format, load from G1M instead
+    # Load the metadata (through its binary sidecar) - if it does not exist in JSON format, load from G1M instead
     try:
-        model_mesh_metadata = read_struct_from_json(g1m_name + "/mesh_metadata.json")
+        model_mesh_metadata = read_metadata(g1m_name + "/mesh_metadata.json")
     except:
         print("{0}/mesh_metadata.json missing or unreadable, reading data from {0}.g1m instead...".format(g1m_name))
         model_mesh_metadata = parseG1MG(g1mg_stream,e)
@@ -448,12 +394,13 @@ def build_g1mg(g1m_name, skel_data, e = '<'):
                             len(composite_vbs[j]['vb'][0]['Buffer'])))
                         if model_mesh_metadata["version"] > 0x30303430:
                             vertex_stream.write(struct.pack(e+"I", model_mesh_metadata['sections'][i]['data'][composite_vbs[j]['original_vb_num']]["unknown2"]))
-                        write_vb_stream(composite_vbs[j]['vb'], vertex_stream, composite_vbs[j]['fmt'], e)
-                    vertex_stream.seek(0,0)
-                    vertex_section = vertex_stream.read()
+                        # Encoded in batches, straight into the stream, instead of encoding each whole buffer first
+                        write_vb_stream_batches(iter_vb_batches(composite_vbs[j]['vb']), vertex_stream, composite_vbs[j]['fmt'], e)
+                    # Appended from the stream's own buffer, without reading a copy of the section out of it first
+                    with vertex_stream.getbuffer() as vertex_section:
+                        new_g1mg += struct.pack(e+"3I", model_mesh_metadata['sections'][i]['magic'], len(vertex_section)+12,\
+                            len(composite_vbs)) + vertex_section
                     vertex_stream.close()
-                    new_g1mg += struct.pack(e+"3I", model_mesh_metadata['sections'][i]['magic'], len(vertex_section)+12,\
-                        len(composite_vbs)) + vertex_section
                 elif model_mesh_metadata['sections'][i]['type'] == 'VERTEX_ATTRIBUTES':
                     vbattr_section = bytes()
                     semantic_list = {'POSITION': 0, 'BLENDWEIGHT': 1, 'BLENDINDICES': 2, 'NORMAL': 3, 'PSIZE': 4, 'TEXCOORD': 5,\
@@ -492,11 +439,11 @@ def build_g1mg(g1m_name, skel_data, e = '<'):
                     index_stream = io.BytesIO()
                     for j in range(len(composite_vbs)):
                         # This assumes I am reversing my own code, no exotic formats!
-                        index_stream.write(struct.pack(e+"2I", len([x for y in composite_vbs[j]['ib'] for x in y]), \
+                        index_stream.write(struct.pack(e+"2I", len(flatten_ib(composite_vbs[j]['ib'])), \
                             int(composite_vbs[j]['fmt']['format'].split('_FORMAT_R')[1].split('_UINT')[0])))
                         if model_mesh_metadata["version"] > 0x30303430:
                             index_stream.write(struct.pack(e+"I", model_mesh_metadata['sections'][i]['data'][composite_vbs[j]['original_vb_num']]["unknown1"]))
-                        write_ib_stream([x for y in composite_vbs[j]['ib'] for x in y], index_stream, composite_vbs[j]['fmt'], e)
+                        write_ib_stream(flatten_ib(composite_vbs[j]['ib']), index_stream, composite_vbs[j]['fmt'], e)
                         while (index_stream.tell() % 4) > 0:
                             index_stream.write(b'\x00')
                     index_stream.seek(0,0)
@@ -577,34 +524,16 @@ def build_g1mg(g1m_name, skel_data, e = '<'):
 
 def build_g1m(g1m_name):
     if os.path.exists(g1m_name) and (os.path.isdir(g1m_name)):
-        with open(g1m_name + '.g1m', "rb") as f:
+        # The G1M stays mapped until the rebuild is complete, parseG1MforG1MF / G1MG below reuse this mapping
+        with G1MContainer.open(g1m_name + '.g1m') as g1m:
             print("Processing {0}...".format(g1m_name))
-            file = {}
-            file["file_magic"], = struct.unpack(">I", f.read(4))
-            if file["file_magic"] == 0x5F4D3147:
-                e = '<' # Little Endian
-            elif file["file_magic"] == 0x47314D5F:
-                e = '>' # Big Endian
-            else:
-                print("not G1M!") # Figure this out later
-                sys.exit()
+            e = g1m.e
             # Pack G1MG and G1MF here, to insert into G1M. (Endianness is needed)
-            file["file_version"] = f.read(4).hex()
-            file["file_size"], = struct.unpack(e+"I", f.read(4))
-            chunks = {}
-            chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
             # Grab the skeleton for the vgmap sanity check
-            f.seek(chunks["starting_offset"])
             have_skeleton = False
-            for i in range(chunks["count"]):
-                chunk = {}
-                chunk["start_offset"] = f.tell()
-                chunk["magic"] = f.read(4).decode("utf-8")
-                chunk["version"] = f.read(4).hex()
-                chunk["size"], = struct.unpack(e+"I", f.read(4))
+            for chunk in g1m.chunks:
                 if chunk["magic"] in ['G1MS', 'SM1G'] and have_skeleton == False:
-                    f.seek(chunk["start_offset"],0)
-                    model_skel_data = parseG1MS(f.read(chunk["size"]),e)
+                    model_skel_data = parseG1MS(g1m.get_chunk(chunk),e)
                     if os.path.exists(g1m_name+'Oid.bin'):
                         model_skel_oid = binary_oid_to_dict(g1m_name+'Oid.bin')
                         model_skel_data = name_bones(model_skel_data, model_skel_oid)
@@ -616,34 +545,21 @@ def build_g1m(g1m_name):
                         if not ext_skel == False:
                             model_skel_data = combine_skeleton(ext_skel, model_skel_data)
                     have_skeleton == True # I guess some games duplicate this section?
-                else:
-                    f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next section
             new_g1mg_data = build_g1mg(g1m_name, model_skel_data, e)
             new_g1mf_data = build_g1mf(new_g1mg_data, g1m_name, e)
-            # Move back to beginning to start rebuild
-            f.seek(chunks["starting_offset"])
-            new_g1m_data = bytes()
-            for i in range(chunks["count"]):
-                chunk = {}
-                chunk["start_offset"] = f.tell()
-                chunk["magic"] = f.read(4).decode("utf-8")
-                chunk["version"] = f.read(4).hex()
-                chunk["size"], = struct.unpack(e+"I", f.read(4))
+            # Rebuild, copying every other chunk straight out of the mapped file
+            new_g1m_data = bytearray()
+            for chunk in g1m.chunks:
                 if chunk["magic"] in ['G1MF', 'FM1G']:
                     new_g1m_data += new_g1mf_data # Replace section
-                    f.seek(chunk["start_offset"]+chunk["size"],0)
                 elif chunk["magic"] in ['G1MG', 'GM1G']:
                     new_g1m_data += new_g1mg_data # Replace section
-                    f.seek(chunk["start_offset"]+chunk["size"],0)
                 else:
-                    f.seek(chunk["start_offset"],0) # Move to beginning
-                    new_g1m_data += f.read(chunk["size"]) # Read section
-            f.seek(0)
-            new_g1m_header = f.read(8)
+                    new_g1m_data += g1m.get_chunk(chunk) # Copy section
+            new_g1m_header = bytes(g1m.view[0:8])
             new_g1m_header += struct.pack(e+"I", len(new_g1m_data) + 24)
-            f.seek(4,1)
-            new_g1m_header += f.read(12)
-        return(new_g1m_header + new_g1m_data)
+            new_g1m_header += bytes(g1m.view[12:24])
+        return(new_g1m_header + bytes(new_g1m_data))
     else:
         return(False)
 
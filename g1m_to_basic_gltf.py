@@ -7,12 +7,12 @@
 #
 # This code depends on g1m_export_meshes.py, g1m_import_meshes.py and lib_fmtibvb.py being in the same folder.
 #
-# This code requires both numpy and pyquaternion for skeletal manipulation.
+# This code requires numpy for skeletal manipulation.
 #
 # For materials, it will read g1t.json if present in the same directory.
 #
-# These can be installed by:
-# /path/to/python3 -m pip install pyquaternion
+# This can be installed by:
+# /path/to/python3 -m pip install numpy
 #
 # Steps:
 # 1. Use Gust Tools to extract G1M from the .elixir.gz file (and to extract textures from the .g1t file).
@@ -30,8 +30,7 @@ translate_meshes = True
 preserve_vertex_color_as_default = False
 
 try:
-    import glob, os, io, sys, copy, json, numpy
-    from pyquaternion import Quaternion
+    import glob, os, io, sys, copy, json, multiprocessing, numpy
     from g1m_export_meshes import *
 except ModuleNotFoundError as e:
     print("Python module missing! {}".format(e.msg))
@@ -100,11 +99,9 @@ def convert_bones_to_single_file(submesh):
     if len(bone_element_indices) > 0:
         for i in range(len(bone_element_indices)):
             bone_element_index = int(bone_element_indices[i]['id'])
-            for j in range(len(submesh['vb'][bone_element_index]['Buffer'])):
-                for k in range(len(submesh['vb'][bone_element_index]['Buffer'][j])):
-                    # Dunno why G1M indices count by 3, I think it's for NUN?
-                    submesh['vb'][bone_element_index]['Buffer'][j][k] = \
-                        int(submesh['vb'][bone_element_index]['Buffer'][j][k] // 3) 
+            # Dunno why G1M indices count by 3, I think it's for NUN?
+            submesh['vb'][bone_element_index]['Buffer'] = \
+                (numpy.asarray(submesh['vb'][bone_element_index]['Buffer']) // 3).astype(int)
     return(submesh)
 
 def list_of_utilized_bones(submesh, model_skel_data):
@@ -137,8 +134,8 @@ def fix_weight_groups(submesh):
         # If the final weight group is missing, re-insert it
         if len(new_submesh['vb'][bone_element_index]['Buffer'][0]) - len(new_submesh['vb'][weight_element_index]['Buffer'][0]) > 0:
             for i in range(len(new_submesh['vb'][bone_element_index]['Buffer'][0]) - len(new_submesh['vb'][weight_element_index]['Buffer'][0])):
-                for j in range(len(new_submesh['vb'][weight_element_index]['Buffer'])):
-                    new_submesh['vb'][weight_element_index]['Buffer'][j].append(1-sum(new_submesh['vb'][weight_element_index]['Buffer'][j]))
+                weights = numpy.asarray(new_submesh['vb'][weight_element_index]['Buffer'], dtype = numpy.float64)
+                new_submesh['vb'][weight_element_index]['Buffer'] = numpy.hstack([weights, 1-weights.sum(axis = 1, keepdims = True)])
                 prefices = ['R','G','B','A','D']
                 weightformat = new_submesh['fmt']['elements'][weight_element_index]['Format']
                 dxgi_format_split = weightformat.split('_')
@@ -155,32 +152,34 @@ def fix_weight_groups(submesh):
                 for j in range(weight_element_index+1, len(new_submesh['fmt']['elements'])):
                     new_submesh['fmt']['elements'][j]['AlignedByteOffset'] =\
                         str(int(int(new_submesh['fmt']['elements'][j]['AlignedByteOffset']) + vec_bits / 8))
+        weights = numpy.array(new_submesh['vb'][weight_element_index]['Buffer'], dtype = numpy.float64)
+        indices = numpy.array(new_submesh['vb'][bone_element_index]['Buffer'])
         # Remove invalid weight numbers (<0.00001 and negative numbers)
-        for i in range(len(new_submesh['vb'][weight_element_index]['Buffer'])):
-            for j in range(len(new_submesh['vb'][weight_element_index]['Buffer'][i])):
-                if (new_submesh['vb'][weight_element_index]['Buffer'][i][j] < 0.00001):
-                    new_submesh['vb'][weight_element_index]['Buffer'][i][j] = 0
+        weights[weights < 0.00001] = 0
         # Remove cloth weights from 4D meshes
-        for i in range(len(new_submesh['vb'][weight_element_index]['Buffer'])):
+        if len(weights) > 0:
             # Hopefully this correctly detects 4D weight groups
-            if not new_submesh['vb'][weight_element_index]['Buffer'][i][0] == max(new_submesh['vb'][weight_element_index]['Buffer'][i]):
-                new_submesh['vb'][weight_element_index]['Buffer'][i] = [1]+[0 for x in new_submesh['vb'][weight_element_index]['Buffer'][i][1:]]
-                new_submesh['vb'][bone_element_index]['Buffer'][i] = [0 for x in new_submesh['vb'][bone_element_index]['Buffer'][i]]
+            cloth_weights = weights[:,0] != weights.max(axis = 1)
+            weights[cloth_weights] = 0
+            weights[cloth_weights,0] = 1
+            indices[cloth_weights] = 0
+        new_submesh['vb'][weight_element_index]['Buffer'] = weights
+        new_submesh['vb'][bone_element_index]['Buffer'] = indices
     return(new_submesh)
 
 def fix_normal_type(submesh):
     normal_element_index = int([x for x in submesh['fmt']['elements'] if x['SemanticName'] == 'NORMAL'][0]['id'])
     if not submesh['fmt']['elements'][normal_element_index]['Format'] == 'R32G32B32_FLOAT':
         submesh['fmt']['elements'][normal_element_index]['Format'] = 'R32G32B32_FLOAT' #This is the only option in glTF
-        submesh['vb'][normal_element_index]['Buffer'] = [submesh['vb'][normal_element_index]['Buffer'][i][0:3]\
-            for i in range(len(submesh['vb'][normal_element_index]['Buffer']))]
+        submesh['vb'][normal_element_index]['Buffer'] = numpy.asarray(submesh['vb'][normal_element_index]['Buffer'])[:,0:3]
     return(submesh)
 
 def fix_tangent_length(submesh):
     tangent_element_index = int([x for x in submesh['fmt']['elements'] if x['SemanticName'] == 'TANGENT'][0]['id'])
-    for i in range(len(submesh['vb'][tangent_element_index]['Buffer'])):
-        submesh['vb'][tangent_element_index]['Buffer'][i][0:3] =\
-            (submesh['vb'][tangent_element_index]['Buffer'][i][0:3] / numpy.linalg.norm(submesh['vb'][tangent_element_index]['Buffer'][i][0:3])).tolist()
+    tangents = numpy.array(submesh['vb'][tangent_element_index]['Buffer'], dtype = numpy.float64)
+    if len(tangents) > 0:
+        tangents[:,0:3] = tangents[:,0:3] / numpy.linalg.norm(tangents[:,0:3], axis = 1, keepdims = True)
+    submesh['vb'][tangent_element_index]['Buffer'] = tangents
     return(submesh)
 
 def generate_materials(gltf_data, model_mesh_metadata, metadata_sections):
@@ -218,14 +217,8 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
     metadata_sections = {model_mesh_metadata['sections'][i]['type']:i for i in range(len(model_mesh_metadata['sections']))}
     skel_present = model_skel_data['jointCount'] > 1 and not model_skel_data['boneList'][0]['parentID'] == -2147483648
     subvbs = model_mesh_metadata['sections'][metadata_sections['SUBMESH']]
-    if not nun_maps == False:
-        nun_indices = [x['name'][0:4] for x in nun_maps['nun_data']]
-        if 'nunv' in nun_indices:
-            nunv_offset = [x['name'][0:4] for x in nun_maps['nun_data']].index('nunv')
-        if 'nuns' in nun_indices:
-            nuns_offset = [x['name'][0:4] for x in nun_maps['nun_data']].index('nuns')
-    lod_data = [x for x in model_mesh_metadata["sections"] if x['type'] == 'MESH_LOD'][0]
-    fmts = generate_fmts(model_mesh_metadata)
+    mesh_index = MeshMetadataIndex(model_mesh_metadata)
+    fmts = mesh_index.fmts
     gltf_data = {}
     gltf_data['asset'] = { 'version': '2.0' }
     gltf_data['accessors'] = []
@@ -264,28 +257,25 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
     for i in range(len(gltf_data['nodes'])):
         if len(gltf_data['nodes'][i]['children']) == 0:
             del(gltf_data['nodes'][i]['children'])
+    vb_cache = VertexBufferCache(g1mg_stream, mesh_index, e)
     for subindex in range(len(subvbs['data'])):
         print("Processing submesh {0}...".format(subindex))
         # Skip submesh if 4D, unless NUN data is available
         if (len(re.findall('[0-9]+', [x for x in fmts[subvbs['data'][subindex]['vertexBufferIndex']]['elements'] if x['SemanticName'] == 'POSITION'][0]['Format'])) == 3) \
             or not nun_maps == False:
-            lod_blocks_combined = [x for y in lod_data['data'] for x in y['lod']]
-            submesh_lod = [x for x in lod_blocks_combined if subindex in x['indices']][0]
+            submesh_lod = mesh_index.get_submesh_lod(subindex)
             primitive = {"attributes":{}}
-            fmts = generate_fmts(model_mesh_metadata) # Refresh FMT every time, to dereference
-            submesh = generate_submesh(subindex, g1mg_stream, model_mesh_metadata, model_skel_data, fmts, e=e, cull_vertices = True, preserve_trianglestrip = True)
+            # generate_submesh() copies the fmt, so the shared fmts are not changed by the fixes below
+            submesh = generate_submesh(subindex, g1mg_stream, mesh_index, model_skel_data, fmts, e=e, cull_vertices = True, preserve_trianglestrip = True, vb_cache = vb_cache)
             if cloth_render_fail == False:
                 try:
                     if submesh_lod['clothID'] == 1 and not nun_maps == False:
                         print("Performing cloth mesh (4D) transformation...".format(subindex))
-                        if (submesh_lod['NUNID']) >= 10000 and (submesh_lod['NUNID'] < 20000):
-                            NUNID = (submesh_lod['NUNID'] % 10000) + nunv_offset
-                        else:
-                            NUNID = submesh_lod['NUNID'] % 10000
+                        NUNID = nun_stack_index(submesh_lod['NUNID'], nun_maps['nun_data'])
                         submesh = render_cloth_submesh(submesh, NUNID, model_skel_data, nun_maps, e=e, remove_physics = True)
                     if submesh_lod['clothID'] == 2:
                         print("Performing cloth mesh (4D) transformation...".format(subindex))
-                        submesh = render_cloth_submesh_2(submesh, subindex, model_mesh_metadata, model_skel_data, remove_physics = True)
+                        submesh = render_cloth_submesh_2(submesh, subindex, mesh_index, model_skel_data, remove_physics = True)
                 except:
                     cloth_render_fail = True
                     print("Rendering cloth mesh failed!  Cloth mesh rendering will be skipped.")
@@ -305,8 +295,8 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
                     position_index = [x['SemanticName'] for x in submesh['fmt']['elements']].index('POSITION')
                     position_veclength = len(submesh['vb'][position_index]['Buffer'][0])
                     shift = numpy.array(gltf_data['nodes'][0]['translation']+([0]*(position_veclength-3)))
-                    submesh['vb'][position_index]['Buffer'] = [(x+shift).tolist() for x\
-                        in submesh['vb'][position_index]['Buffer']]
+                    submesh['vb'][position_index]['Buffer'] = numpy.asarray(submesh['vb'][position_index]['Buffer'],\
+                        dtype = numpy.float64) + shift
                 gltf_fmt = convert_fmt_for_gltf(submesh['fmt'])
                 vb_stream = io.BytesIO()
                 write_vb_stream(submesh['vb'], vb_stream, gltf_fmt, e=e, interleave = False)
@@ -320,14 +310,9 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
                             "count": len(submesh['vb'][element]['Buffer']),\
                             "type": gltf_fmt['elements'][element]['accessor_type']})
                         if gltf_fmt['elements'][element]['SemanticName'] == 'POSITION':
-                            gltf_data['accessors'][-1]['max'] =\
-                                [max([x[0] for x in submesh['vb'][element]['Buffer']]),\
-                                 max([x[1] for x in submesh['vb'][element]['Buffer']]),\
-                                 max([x[2] for x in submesh['vb'][element]['Buffer']])]
-                            gltf_data['accessors'][-1]['min'] =\
-                                [min([x[0] for x in submesh['vb'][element]['Buffer']]),\
-                                 min([x[1] for x in submesh['vb'][element]['Buffer']]),\
-                                 min([x[2] for x in submesh['vb'][element]['Buffer']])]
+                            position = numpy.asarray(submesh['vb'][element]['Buffer'])[:,0:3]
+                            gltf_data['accessors'][-1]['max'] = position.max(axis = 0).tolist()
+                            gltf_data['accessors'][-1]['min'] = position.min(axis = 0).tolist()
                         gltf_data['bufferViews'].append({"buffer": 0,\
                             "byteOffset": block_offset,\
                             "byteLength": len(submesh['vb'][element]['Buffer']) *\
@@ -348,7 +333,7 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
                 primitive["indices"] = len(gltf_data['accessors'])
                 gltf_data['accessors'].append({"bufferView" : buffer_view,\
                     "componentType": gltf_fmt['componentType'],\
-                    "count": len([index for triangle in submesh['ib'] for index in triangle]),\
+                    "count": len(flatten_ib(submesh['ib'])),\
                     "type": gltf_fmt['accessor_type']})
                 gltf_data['bufferViews'].append({"buffer": 0,\
                     "byteOffset": len(giant_buffer),\
@@ -376,13 +361,11 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
                 if skel_present and not skip_weights and not submesh_lod['clothID'] == 2:
                     gltf_data['nodes'][-1]['skin'] = len(gltf_data['skins'])
                     skin_bones = list_of_utilized_bones(submesh, model_skel_data)
-                    inv_mtx_buffer = bytes()
-                    for i in range(len(skin_bones)):
-                        mtx = Quaternion(model_skel_data['boneList'][skin_bones[i]]['abs_q']).transformation_matrix
-                        [mtx[0,3],mtx[1,3],mtx[2,3]] = model_skel_data['boneList'][skin_bones[i]]['abs_p']
-                        inv_bind_mtx = numpy.linalg.inv(mtx)
-                        inv_bind_mtx = numpy.ndarray.transpose(inv_bind_mtx)
-                        inv_mtx_buffer += struct.pack(e+"16f", *[num for row in inv_bind_mtx for num in row])
+                    # Inverse bind matrices of all the joints at once, transposed to column-major order
+                    inv_bind_mtx = transform_inverse(\
+                        numpy.array([model_skel_data['boneList'][x]['abs_q'] for x in skin_bones]).reshape(-1,4),\
+                        numpy.array([model_skel_data['boneList'][x]['abs_p'] for x in skin_bones]).reshape(-1,3))
+                    inv_mtx_buffer = numpy.swapaxes(inv_bind_mtx, 1, 2).astype(e+'f4').tobytes()
                     gltf_data['skins'].append({"inverseBindMatrices": len(gltf_data['accessors']), "joints": skin_bones})
                     gltf_data['accessors'].append({"bufferView" : buffer_view,\
                         "componentType": 5126,\
@@ -402,38 +385,18 @@ def write_glTF(g1m_name, g1mg_stream, model_mesh_metadata, model_skel_data, nun_
         f.write(json.dumps(gltf_data, indent=4).encode("utf-8"))
 
 # The argument passed (g1m_name) is actually the folder name
-def G1M2glTF(g1m_name, overwrite = False, keep_color = preserve_vertex_color_as_default):
-    with open(g1m_name + '.g1m', "rb") as f:
-        print("Processing {0}...".format(g1m_name + '.g1m'))
-        file = {}
-        nun_struct = {}
-        file["file_magic"], = struct.unpack(">I", f.read(4))
-        if file["file_magic"] == 0x5F4D3147:
-            e = '<' # Little Endian
-        elif file["file_magic"] == 0x47314D5F:
-            e = '>' # Big Endian
-        else:
-            print("not G1M!") # Figure this out later
-            sys.exit()
+# With interactive set to False, the user is never asked anything (see parseG1M), an existing glTF is skipped
+def G1M2glTF(g1m_name, overwrite = False, keep_color = preserve_vertex_color_as_default, interactive = True):
+    print("Processing {0}...".format(g1m_name + '.g1m'))
+    with G1MContainer.open(g1m_name + '.g1m') as g1m:
+        e = g1m.e
+        nun_index = NUNIndex(e)
         transform_cloth = True
-        file["file_version"], = struct.unpack(e+"I", f.read(4))
-        file["file_size"], = struct.unpack(e+"I", f.read(4))
-        chunks = {}
-        chunks["starting_offset"], chunks["reserved"], chunks["count"] = struct.unpack(e+"III", f.read(12))
-        chunks["chunks"] = []
-        f.seek(chunks["starting_offset"])
         have_skeleton = False
         nun_parse_fail = False
-        for i in range(chunks["count"]):
-            chunk = {}
-            chunk["start_offset"] = f.tell()
-            chunk["magic"] = f.read(4).decode("utf-8")
-            chunk["version"] = f.read(4).hex()
-            chunk["size"], = struct.unpack(e+"I", f.read(4))
-            chunks["chunks"].append(chunk)
+        for chunk in g1m.chunks:
             if chunk["magic"] in ['G1MS', 'SM1G'] and have_skeleton == False:
-                f.seek(chunk["start_offset"],0)
-                model_skel_data = parseG1MS(f.read(chunk["size"]),e)
+                model_skel_data = parseG1MS(g1m.get_chunk(chunk),e)
                 if os.path.exists(g1m_name+'Oid.bin'):
                     model_skel_oid = binary_oid_to_dict(g1m_name+'Oid.bin')
                     model_skel_data = name_bones(model_skel_data, model_skel_oid)
@@ -441,40 +404,35 @@ def G1M2glTF(g1m_name, overwrite = False, keep_color = preserve_vertex_color_as_
                     #Internal Skeleton
                     model_skel_data = calc_abs_skeleton(model_skel_data)
                 else:
-                    ext_skel = get_ext_skeleton(g1m_name)
+                    ext_skel = get_ext_skeleton(g1m_name, interactive = interactive)
                     if not ext_skel == False:
                         model_skel_data = combine_skeleton(ext_skel, model_skel_data)
                 have_skeleton = True # I guess some games duplicate this section?
             elif chunk["magic"] in ['NUNO', 'ONUN', 'NUNV', 'VNUN', 'NUNS', 'SNUN'] and transform_cloth == True:
                 try:
-                    f.seek(chunk["start_offset"],0)
                     if chunk["magic"] in ['NUNO', 'ONUN']: # NUNO
-                        nun_struct["nuno"] = parseNUNO(f.read(chunk["size"]),e)
+                        nun_index.add_section('nuno', g1m.get_chunk(chunk))
                     elif chunk["magic"] in ['NUNV', 'VNUN']: # NUNV
-                        nun_struct["nunv"] = parseNUNV(f.read(chunk["size"]),e)
+                        nun_index.add_section('nunv', g1m.get_chunk(chunk))
                     elif chunk["magic"] in ['NUNS', 'SNUN']: # NUNS
-                        nun_struct["nuns"] = parseNUNS(f.read(chunk["size"]),e)
+                        nun_index.add_section('nuns', g1m.get_chunk(chunk))
                 except:
                     nun_parse_fail = True
                     print("Parsing cloth mesh NUN data failed!  Cloth mesh rendering will be skipped.")
-                    f.seek(chunk["start_offset"] + chunk["size"],0)
             elif chunk["magic"] in ['G1MG', 'GM1G']:
-                f.seek(chunk["start_offset"],0)
-                g1mg_stream = f.read(chunk["size"])
+                g1mg_stream = g1m.get_chunk(chunk)
                 model_mesh_metadata = parseG1MG(g1mg_stream,e)
-            else:
-                f.seek(chunk["start_offset"] + chunk["size"],0) # Move to next chunk
-            file["chunks"] = chunks
         nun_maps = False
-        if len(nun_struct) > 0 and model_skel_data['jointCount'] > 1 and transform_cloth == True:
+        if len(nun_index.sections) > 0 and model_skel_data['jointCount'] > 1 and transform_cloth == True:
             try:
-                nun_data = stack_nun(nun_struct)
-                nun_maps = calc_nun_maps(nun_data, model_skel_data)
-                if not nun_maps == False:
-                    nun_maps['nun_data'] = nun_data
+                # Only the NUN blocks that cloth submeshes use are parsed and compiled
+                nun_maps = nun_index.nun_maps(model_skel_data, referenced_nun_blocks(model_mesh_metadata, nun_index.headers))
             except:
                 print("Compiling cloth mesh NUN data failed!  Cloth mesh rendering will be skipped.")
         if os.path.exists(g1m_name + '.gltf') and (overwrite == False):
+            if interactive == False:
+                print(g1m_name + ".gltf exists, skipping.")
+                return(False)
             if str(input(g1m_name + ".gltf exists! Overwrite? (y/N) ")).lower()[0:1] == 'y':
                 overwrite = True
         if (overwrite == True) or not os.path.exists(g1m_name + '.gltf'):
@@ -482,6 +440,7 @@ def G1M2glTF(g1m_name, overwrite = False, keep_color = preserve_vertex_color_as_
     return(True)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Pool workers in frozen (pyinstaller) builds
     # Set current directory
     if getattr(sys, 'frozen', False):
         os.chdir(os.path.dirname(sys.executable))
@@ -495,51 +454,37 @@ if __name__ == "__main__":
             parser.add_argument('-r', '--remove_color', help="Remove vertex color attribute", action="store_false")
         else:
             parser.add_argument('-k', '--keep_color', help="Preserve vertex color attribute", action="store_true")
-        parser.add_argument('g1m_filename', help="Name of g1m file to build glTF (required).")
+        parser.add_argument('-b', '--batch', help="Build glTF for every model in this folder and its subfolders without prompts, then write batch_summary.json", metavar='FOLDER')
+        parser.add_argument('-j', '--jobs', help="Number of models to process at once with --batch (default 1)", type=int, default=1)
+        parser.add_argument('g1m_filename', help="Name of g1m file to build glTF (required, unless using --batch).", nargs='?')
         args = parser.parse_args()
         if preserve_vertex_color_as_default == True:
             color_option = args.remove_color
         else:
             color_option = args.keep_color
-        if os.path.exists(args.g1m_filename) and args.g1m_filename[-4:].lower() == '.g1m':
+        if not args.batch == None:
+            batch_process(args.batch, G1M2glTF, jobs = args.jobs, options = {'overwrite': args.overwrite, 'keep_color': color_option})
+        elif not args.g1m_filename == None and os.path.exists(args.g1m_filename) and args.g1m_filename[-4:].lower() == '.g1m':
             G1M2glTF(args.g1m_filename[:-4], overwrite = args.overwrite, keep_color = color_option)
     else:
         # When run without command line arguments, it will attempt to obtain data from all models
-        current_dir_g1m_files = glob.glob('*.g1m')
-        models = []
-        if os.path.exists('elixir.json'):
-            try:
-                with open('elixir.json','r') as f:
-                    elixir = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
-                models = [x for x in elixir['files'] if x[-4:] == '.g1m' and x in current_dir_g1m_files][1:]
-            except:
-                pass
-        elif os.path.exists('gmpk.json'):
-            if 1:
-                with open('gmpk.json','r') as f:
-                    gmpk = json.loads(re.sub('0x[0-9a-zA-Z]+','0',f.read()))
-                models = [x['name']+'.g1m' for x in gmpk['SDP']['NID']['names'] if x['name']+'.g1m' in current_dir_g1m_files][1:]
+        models = find_models('.', all_files = False)
         if len(models) > 0:
             for i in range(len(models)):
-                G1M2glTF(models[i][:-4])
+                G1M2glTF(models[i])
         else:
-            models = glob.glob('*_MODEL_*.g1m')
-            if len(models) > 0:
-                for i in range(len(models)):
-                    G1M2glTF(models[i][:-4])
-            else:
-                g1m_files = glob.glob('*.g1m')
-                if len(g1m_files) == 1:
-                    G1M2glTF(g1m_files[0][:-4])
-                elif len(g1m_files) > 1:
-                    print('Which g1m file do you want to unpack?\n')
-                    for i in range(len(g1m_files)):
-                        print(str(i+1) + '. ' + g1m_files[i])
-                    g1m_file_choice = -1
-                    while (g1m_file_choice < 0) or (g1m_file_choice >= len(g1m_files)):
-                        try:
-                            g1m_file_choice = int(input("\nPlease enter which g1m file to use:  ")) - 1 
-                        except ValueError:
-                            pass
-                    if g1m_file_choice in range(len(g1m_files)):
-                        G1M2glTF(g1m_files[g1m_file_choice][:-4])
+            g1m_files = glob.glob('*.g1m')
+            if len(g1m_files) == 1:
+                G1M2glTF(g1m_files[0][:-4])
+            elif len(g1m_files) > 1:
+                print('Which g1m file do you want to unpack?\n')
+                for i in range(len(g1m_files)):
+                    print(str(i+1) + '. ' + g1m_files[i])
+                g1m_file_choice = -1
+                while (g1m_file_choice < 0) or (g1m_file_choice >= len(g1m_files)):
+                    try:
+                        g1m_file_choice = int(input("\nPlease enter which g1m file to use:  ")) - 1 
+                    except ValueError:
+                        pass
+                if g1m_file_choice in range(len(g1m_files)):
+                    G1M2glTF(g1m_files[g1m_file_choice][:-4])
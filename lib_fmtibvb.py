@@ -3,149 +3,350 @@
 #
 # GitHub eArmada8/gust_stuff
 
-import io, re, struct, json
+import io, re, struct, json, mmap, os, math, hashlib, marshal, functools
+from concurrent.futures import ThreadPoolExecutor
 
-# Currently only simple formats (8-, 16-, and 32-bit) are supported.  Floats must be 32-bit.
-# Attempting to read an unsupported format will return a raw bytes object.
-def unpack_dxgi_vector(f, stride, dxgi_format, e = '<'):
-    dxgi_format = dxgi_format.split('DXGI_FORMAT_')[-1]
-    dxgi_format_split = dxgi_format.split('_')
-    if len(dxgi_format_split) == 2:
-        numtype = dxgi_format_split[1]
-        vec_format = re.findall("[0-9]+",dxgi_format_split[0])
-        if len(vec_format) > 0:
-            vec_bits = int(vec_format[0])
-            vec_elements = len(vec_format)
+# NumPy is optional; when it is available, whole vertex buffers are decoded and encoded in bulk.
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# Set to False to use the pure-Python (struct) codec even when NumPy is installed
+prefer_numpy = True
+
+# Vertices encoded at a time by the streaming vertex buffer writer (see write_vb_stream_batches)
+vb_batch_size = 65536
+
+# Threads used to read / write the slot files of multi-slot (vb0, vb1, ...) buffers.  Set to 1 to disable.
+vb_slot_threads = 4
+
+# Parsed DXGI format.  Specs are cached per format string (see get_format_spec), so format strings are
+# only split and searched once instead of once per vertex.
+class FormatSpec:
+    __slots__ = ('numtype', 'vec_bits', 'vec_elements', 'stride', 'struct_char', 'numpy_char', 'float_max',\
+        'packed_bits', 'struct_count', 'structs')
+    struct_chars = {'FLOAT': {32: 'f', 16: 'e'}, 'UINT': {32: 'I', 16: 'H', 8: 'B'}, 'SINT': {32: 'i', 16: 'h', 8: 'b'},\
+        'UNORM': {32: 'I', 16: 'H', 8: 'B'}, 'SNORM': {32: 'i', 16: 'h', 8: 'b'}}
+    numpy_chars = {'f': 'f4', 'e': 'f2', 'I': 'u4', 'H': 'u2', 'B': 'u1', 'i': 'i4', 'h': 'i2', 'b': 'i1'}
+
+    def __init__(self, dxgi_format):
+        dxgi_format = dxgi_format.split('DXGI_FORMAT_')[-1]
+        dxgi_format_split = dxgi_format.split('_')
+        self.numtype, self.vec_bits, self.vec_elements, self.stride = 'UNSUPPORTED', 0, 0, False
+        self.packed_bits = False
+        if len(dxgi_format_split) == 2:
+            self.numtype = dxgi_format_split[1]
+            vec_format = [int(x) for x in re.findall("[0-9]+",dxgi_format_split[0])]
+            if len(vec_format) > 0:
+                self.vec_bits = vec_format[0]
+                self.vec_elements = len(vec_format)
+                self.stride = int(self.vec_elements * self.vec_bits / 8)
+                # Packed formats (R10G10B10A2_UNORM, R11G11B10_FLOAT, etc) share one 32-bit word, with the
+                # first component in the lowest bits
+                if len(set(vec_format)) > 1 and sum(vec_format) == 32 and (self.numtype in ['UNORM', 'UINT']\
+                        or (self.numtype == 'FLOAT' and all([x in [10, 11] for x in vec_format]))):
+                    self.packed_bits = vec_format
+                    self.stride = 4
+        if self.packed_bits == False:
+            self.struct_char = self.struct_chars.get(self.numtype, {}).get(self.vec_bits, False)
+            self.struct_count = self.vec_elements
         else:
-            vec_bits = 0
-            vec_elements = 0
-    else:
-        numtype = 'UNSUPPORTED'
-
-    if numtype == 'FLOAT' and (vec_elements * vec_bits / 8 == stride):
-        if vec_bits == 32:
-            read = list(struct.unpack(e+str(vec_elements)+"f", f.read(stride)))
-        elif vec_bits == 16:
-            read = list(struct.unpack(e+str(vec_elements)+"e", f.read(stride)))
-    elif numtype == 'UINT' and (vec_elements * vec_bits / 8 == stride):
-        if vec_bits == 32:
-            read = list(struct.unpack(e+str(vec_elements)+"I", f.read(stride)))
-        elif vec_bits == 16:
-            read = list(struct.unpack(e+str(vec_elements)+"H", f.read(stride)))
-        elif vec_bits == 8:
-            read = list(struct.unpack(e+str(vec_elements)+"B", f.read(stride)))
-    elif numtype == "SINT" and (vec_elements * vec_bits / 8 == stride):
-        if vec_bits == 32:
-            read = list(struct.unpack(e+str(vec_elements)+"i", f.read(stride)))
-        elif vec_bits == 16:
-            read = list(struct.unpack(e+str(vec_elements)+"h", f.read(stride)))
-        elif vec_bits == 8:
-            read = list(struct.unpack(e+str(vec_elements)+"b", f.read(stride)))
-    elif numtype == "UNORM" and (vec_elements * vec_bits / 8 == stride):
-        # First read as integers
-        if vec_bits == 32:
-            read = list(struct.unpack(e+str(vec_elements)+"I", f.read(stride)))
-        elif vec_bits == 16:
-            read = list(struct.unpack(e+str(vec_elements)+"H", f.read(stride)))
-        elif vec_bits == 8:
-            read = list(struct.unpack(e+str(vec_elements)+"B", f.read(stride)))
-        # Convert to normalized floats
-        float_max = ((2**vec_bits)-1)
-        for i in range(len(read)):
-            read[i] = read[i] / float_max
-    elif numtype == "SNORM" and (vec_elements * vec_bits / 8 == stride):
-        # First read as integers
-        if vec_bits == 32:
-            read = list(struct.unpack(e+str(vec_elements)+"i", f.read(stride)))
-        elif vec_bits == 16:
-            read = list(struct.unpack(e+str(vec_elements)+"h", f.read(stride)))
-        elif vec_bits == 8:
-            read = list(struct.unpack(e+str(vec_elements)+"b", f.read(stride)))
-        # Convert to normalized floats
-        float_max = ((2**(vec_bits-1))-1)
-        for i in range(len(read)):
-            read[i] = read[i] / float_max
+            self.struct_char = 'I'
+            self.struct_count = 1
+        self.numpy_char = self.numpy_chars[self.struct_char] if self.struct_char else False
+        if self.numtype == 'UNORM':
+            if self.packed_bits == False:
+                self.float_max = ((2**self.vec_bits)-1)
+            else:
+                self.float_max = [((2**x)-1) for x in self.packed_bits]
+        elif self.numtype == 'SNORM':
+            self.float_max = ((2**(self.vec_bits-1))-1)
+        else:
+            self.float_max = False
+        self.structs = {}
+
+    # True if the format can be decoded from an element of this stride; otherwise it is read as raw bytes
+    def matches(self, stride):
+        return(not self.struct_char == False and self.stride == stride)
+
+    def get_struct(self, e = '<'):
+        if not e in self.structs:
+            self.structs[e] = struct.Struct(e+str(self.struct_count)+self.struct_char)
+        return(self.structs[e])
+
+    # Unpacked struct values to the vector, UNORM / SNORM are converted to normalized floats
+    def decode_values(self, values):
+        if not self.packed_bits == False:
+            return(self.unpack_word(values[0]))
+        elif not self.float_max == False:
+            return([x / self.float_max for x in values])
+        return(list(values))
+
+    # Same clamping and rounding as the original per-component packing code
+    def to_packable(self, data):
+        if not self.packed_bits == False:
+            return([self.pack_word(data)])
+        elif self.numtype == 'UNORM':
+            return([int(round(min(max(data[i],0), 1) * self.float_max)) for i in range(self.vec_elements)])
+        elif self.numtype == 'SNORM':
+            return([int(round(min(max(data[i],-1), 1) * self.float_max)) for i in range(self.vec_elements)])
+        else:
+            return([data[i] for i in range(self.vec_elements)])
+
+    def unpack_word(self, word):
+        vector = []
+        shift = 0
+        for i in range(len(self.packed_bits)):
+            value = (word >> shift) & ((1 << self.packed_bits[i]) - 1)
+            if self.numtype == 'UNORM':
+                value = value / self.float_max[i]
+            elif self.numtype == 'FLOAT':
+                value = small_float_to_float(value, self.packed_bits[i] - 5)
+            vector.append(value)
+            shift += self.packed_bits[i]
+        return(vector)
+
+    def pack_word(self, data):
+        word = 0
+        shift = 0
+        for i in range(len(self.packed_bits)):
+            if self.numtype == 'UNORM':
+                value = int(round(min(max(data[i],0), 1) * self.float_max[i]))
+            elif self.numtype == 'FLOAT':
+                value = float_to_small_float(data[i], self.packed_bits[i] - 5)
+            else:
+                value = data[i]
+                if not 0 <= value < (1 << self.packed_bits[i]):
+                    raise struct.error("{0}-bit component out of range".format(self.packed_bits[i]))
+            word |= value << shift
+            shift += self.packed_bits[i]
+        return(word)
+
+    # NumPy kernels: (..., struct_count) arrays of struct values to (..., vec_elements) vectors and back, with the
+    # same conversion, clamping and rounding as decode_values() / to_packable()
+    def decode_array(self, field):
+        if not self.packed_bits == False:
+            word = field[...,0].astype(numpy.uint32)
+            vectors = []
+            shift = 0
+            for i in range(len(self.packed_bits)):
+                value = (word >> shift) & ((1 << self.packed_bits[i]) - 1)
+                if self.numtype == 'UNORM':
+                    value = value.astype(numpy.float64) / self.float_max[i]
+                elif self.numtype == 'FLOAT':
+                    value = small_float_to_float_array(value, self.packed_bits[i] - 5)
+                vectors.append(value)
+                shift += self.packed_bits[i]
+            return(numpy.stack(vectors, axis = -1))
+        elif not self.float_max == False:
+            return(field.astype(numpy.float64) / self.float_max)
+        return(field)
+
+    def encode_array(self, data, e = '<'):
+        data = data[:,:self.vec_elements]
+        if not self.packed_bits == False:
+            word = numpy.zeros(len(data), dtype = numpy.uint32)
+            shift = 0
+            for i in range(len(self.packed_bits)):
+                if self.numtype == 'UNORM':
+                    value = numpy.round(numpy.clip(data[:,i], 0, 1) * self.float_max[i])
+                elif self.numtype == 'FLOAT':
+                    value = float_to_small_float_array(data[:,i], self.packed_bits[i] - 5)
+                else:
+                    value = data[:,i]
+                    check_integer_array(value, 0, (1 << self.packed_bits[i]) - 1)
+                word |= value.astype(numpy.uint32) << shift
+                shift += self.packed_bits[i]
+            return(word.reshape(-1, 1).astype(e + self.numpy_char))
+        elif self.numtype == 'UNORM':
+            data = numpy.round(numpy.clip(data, 0, 1) * self.float_max)
+        elif self.numtype == 'SNORM':
+            data = numpy.round(numpy.clip(data, -1, 1) * self.float_max)
+        elif self.numtype in ['UINT', 'SINT']:
+            integer_info = numpy.iinfo(self.numpy_char)
+            check_integer_array(data, integer_info.min, integer_info.max)
+        elif self.numtype == 'FLOAT':
+            # Values too large for the format would silently become infinity, where struct raises
+            with numpy.errstate(over = 'ignore'):
+                encoded = data.astype(e + self.numpy_char)
+            if not numpy.array_equal(numpy.isfinite(encoded), numpy.isfinite(data)):
+                raise ValueError("Float component out of range")
+            return(encoded)
+        return(data.astype(e + self.numpy_char))
+
+# Integer components are checked as the struct codec would: whole numbers only, within the range of the format.
+# Raises ValueError, so that the caller falls back to the struct codec, which raises the original error.
+def check_integer_array(data, min_value, max_value):
+    if len(data) == 0:
+        return
+    if not data.dtype.kind in 'ui' and not (data.dtype.kind == 'f' and numpy.all(numpy.floor(data) == data)):
+        raise ValueError("Integer component is not a whole number")
+    if data.min() < min_value or data.max() > max_value:
+        raise ValueError("Integer component out of range")
+    return
+
+# Unsigned 11- and 10-bit floats (R11G11B10_FLOAT): 5 exponent bits (bias 15, as float16) and a 6- or 5-bit
+# mantissa, no sign.  Negative values are stored as 0, out of range values as infinity.  Rounding is to nearest
+# even, directly from the full precision value.
+def small_float_to_float(value, mantissa_bits):
+    exponent, mantissa = value >> mantissa_bits, value & ((1 << mantissa_bits) - 1)
+    if exponent == 31:
+        return(float('inf') if mantissa == 0 else float('nan'))
+    elif exponent == 0:
+        return(math.ldexp(mantissa, -14 - mantissa_bits))
+    return(math.ldexp(mantissa + (1 << mantissa_bits), exponent - 15 - mantissa_bits))
+
+def float_to_small_float(value, mantissa_bits):
+    infinity = 31 << mantissa_bits
+    if value != value:
+        return(infinity | (1 << (mantissa_bits - 1)))
+    elif not value > 0:
+        return(0)
+    elif value == float('inf'):
+        return(infinity)
+    mantissa, exponent = math.frexp(value)
+    if exponent + 14 < 1: # Denormal; rounding up to the smallest normal gives the right encoding as well
+        return(int(round(math.ldexp(value, 14 + mantissa_bits))))
+    return(min(((exponent + 14) << mantissa_bits) + int(round((mantissa * 2 - 1) * (1 << mantissa_bits))), infinity))
+
+def small_float_to_float_array(value, mantissa_bits):
+    exponent, mantissa = value >> mantissa_bits, (value & ((1 << mantissa_bits) - 1)).astype(numpy.float64)
+    decoded = numpy.where(exponent == 0, numpy.ldexp(mantissa, -14 - mantissa_bits),\
+        numpy.ldexp(mantissa + (1 << mantissa_bits), exponent.astype(numpy.int64) - 15 - mantissa_bits))
+    decoded[exponent == 31] = numpy.where(mantissa[exponent == 31] == 0, numpy.inf, numpy.nan)
+    return(decoded)
+
+def float_to_small_float_array(value, mantissa_bits):
+    infinity = 31 << mantissa_bits
+    value = numpy.asarray(value, dtype = numpy.float64)
+    with numpy.errstate(invalid = 'ignore', over = 'ignore'):
+        mantissa, exponent = numpy.frexp(numpy.where(numpy.isfinite(value), value, 0))
+        normal = ((exponent + 14).astype(numpy.int64) << mantissa_bits) + numpy.rint((mantissa * 2 - 1) * (1 << mantissa_bits))
+        denormal = numpy.rint(numpy.ldexp(numpy.where(numpy.isfinite(value), value, 0), 14 + mantissa_bits))
+        encoded = numpy.minimum(numpy.where(exponent + 14 < 1, denormal, normal), infinity)
+        encoded[~(value > 0)] = 0
+        encoded[value == numpy.inf] = infinity
+        encoded[numpy.isnan(value)] = infinity | (1 << (mantissa_bits - 1))
+    return(encoded.astype(numpy.uint32))
+
+dxgi_format_specs = {}
+
+def get_format_spec(dxgi_format):
+    if not dxgi_format in dxgi_format_specs:
+        dxgi_format_specs[dxgi_format] = FormatSpec(dxgi_format)
+    return(dxgi_format_specs[dxgi_format])
+
+# Simple formats (8-, 16-, and 32-bit) and packed 32-bit formats are supported.  Floats must be 16- or 32-bit,
+# or R11G11B10.  Attempting to read an unsupported format will return a raw bytes object.
+def unpack_dxgi_vector(f, stride, dxgi_format, e = '<'):
+    spec = get_format_spec(dxgi_format)
+    if spec.matches(stride):
+        read = spec.decode_values(spec.get_struct(e).unpack(f.read(stride)))
     else:
         read = f.read(stride)
     return (read)
 
 def pack_dxgi_vector(f, data, stride, dxgi_format, e = '<'):
-    dxgi_format = dxgi_format.split('DXGI_FORMAT_')[-1]
-    dxgi_format_split = dxgi_format.split('_')
-    if len(dxgi_format_split) == 2:
-        numtype = dxgi_format_split[1]
-        vec_format = re.findall("[0-9]+",dxgi_format_split[0])
-        if len(vec_format) > 0:
-            vec_bits = int(vec_format[0])
-            vec_elements = len(vec_format)
-        else:
-            vec_bits = 0
-            vec_elements = 0
-    else:
-        numtype = 'UNSUPPORTED'
-
-    if numtype == 'FLOAT' and (vec_elements * vec_bits / 8 == stride):
-        for i in range(vec_elements):
-            if vec_bits == 32:
-                f.write(struct.pack(e+"f", data[i]))
-            elif vec_bits == 16:
-                f.write(struct.pack(e+"e", data[i]))
-    elif numtype == 'UINT' and (vec_elements * vec_bits / 8 == stride):
-        for i in range(vec_elements):
-            if vec_bits == 32:
-                f.write(struct.pack(e+"I", data[i]))
-            elif vec_bits == 16:
-                f.write(struct.pack(e+"H", data[i]))
-            elif vec_bits == 8:
-                f.write(struct.pack(e+"B", data[i]))
-    elif numtype == "SINT" and (vec_elements * vec_bits / 8 == stride):
-        for i in range(vec_elements):
-            if vec_bits == 32:
-                f.write(struct.pack(e+"i", data[i]))
-            elif vec_bits == 16:
-                f.write(struct.pack(e+"h", data[i]))
-            elif vec_bits == 8:
-                f.write(struct.pack(e+"b", data[i]))
-    elif numtype == 'UNORM' and (vec_elements * vec_bits / 8 == stride):
-        converted_data = []
-        for i in range(vec_elements):
-            #First convert back to unsigned integers, then pack
-            float_max = ((2**vec_bits)-1)
-            converted_data.append(int(round(min(max(data[i],0), 1) * float_max)))
-            if vec_bits == 32:
-                f.write(struct.pack(e+"I", converted_data[i]))
-            elif vec_bits == 16:
-                f.write(struct.pack(e+"H", converted_data[i]))
-            elif vec_bits == 8:
-                f.write(struct.pack(e+"B", converted_data[i]))
-    elif numtype == 'SNORM' and (vec_elements * vec_bits / 8 == stride):
-        converted_data = []
-        for i in range(vec_elements):
-            #First convert back to unsigned integers, then pack
-            float_max = ((2**(vec_bits-1))-1)
-            converted_data.append(int(round(min(max(data[i],-1), 1) * float_max)))
-            if vec_bits == 32:
-                f.write(struct.pack(e+"i", converted_data[i]))
-            elif vec_bits == 16:
-                f.write(struct.pack(e+"h", converted_data[i]))
-            elif vec_bits == 8:
-                f.write(struct.pack(e+"b", converted_data[i]))
+    spec = get_format_spec(dxgi_format)
+    if spec.matches(stride):
+        f.write(spec.get_struct(e).pack(*spec.to_packable(data)))
     else:
-        write = f.write(data)
+        f.write(data)
     return
 
 def get_stride_from_dxgi_format(dxgi_format):
-    dxgi_format = dxgi_format.split('DXGI_FORMAT_')[-1]
-    dxgi_format_split = dxgi_format.split('_')
-    if len(dxgi_format_split) == 2:
-        numtype = dxgi_format_split[1]
-        vec_format = re.findall("[0-9]+",dxgi_format_split[0])
-        if len(vec_format) > 0:
-            return(int(len(vec_format) * int(vec_format[0]) / 8))
+    return(get_format_spec(dxgi_format).stride)
+
+# Compiled layout of a whole vertex.  Elements are expected in AlignedByteOffset order; each element's
+# stride is the distance to the next element.  One struct.Struct unpacks an entire vertex, and the
+# equivalent NumPy structured dtype decodes an entire buffer.
+class VertexLayout:
+    __slots__ = ('stride', 'specs', 'buffer_strides', 'raw', 'slices', 'struct_format', 'structs', 'dtypes')
+
+    def __init__(self, elements, stride):
+        self.stride = int(stride)
+        self.specs = [get_format_spec(x["Format"]) for x in elements]
+        self.buffer_strides = calc_buffer_strides(elements, stride)
+        self.raw = [not self.specs[i].matches(self.buffer_strides[i]) for i in range(len(elements))]
+        self.slices = []
+        self.struct_format = 'x' * int(elements[0]["AlignedByteOffset"])
+        value_count = 0
+        for i in range(len(elements)):
+            if self.raw[i]:
+                self.struct_format += '{0}s'.format(self.buffer_strides[i])
+                self.slices.append((value_count, value_count + 1))
+                value_count += 1
+            else:
+                self.struct_format += str(self.specs[i].struct_count) + self.specs[i].struct_char
+                self.slices.append((value_count, value_count + self.specs[i].struct_count))
+                value_count += self.specs[i].struct_count
+        self.structs = {}
+        self.dtypes = {}
+
+    def get_struct(self, e = '<'):
+        if not e in self.structs:
+            self.structs[e] = struct.Struct(e + self.struct_format)
+        return(self.structs[e])
+
+    def get_dtype(self, e = '<'):
+        if not e in self.dtypes:
+            names, formats, offsets = [], [], []
+            offset = self.stride - sum(self.buffer_strides)
+            for i in range(len(self.specs)):
+                names.append('e{0}'.format(i))
+                if self.raw[i]:
+                    formats.append('V{0}'.format(self.buffer_strides[i]))
+                else:
+                    formats.append((e + self.specs[i].numpy_char, (self.specs[i].struct_count,)))
+                offsets.append(offset)
+                offset += self.buffer_strides[i]
+            self.dtypes[e] = numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': self.stride})
+        return(self.dtypes[e])
+
+# Element strides are calculated from the distance to the next element (or the end of the vertex)
+def calc_buffer_strides(elements, stride):
+    buffer_strides = []
+    for i in range(len(elements)):
+        if i == len(elements) - 1:
+            buffer_strides.append(int(stride) - int(elements[i]["AlignedByteOffset"]))
         else:
-            return False
-    else:
-        return False
+            buffer_strides.append(int(elements[i+1]["AlignedByteOffset"]) - int(elements[i]["AlignedByteOffset"]))
+    return(buffer_strides)
+
+# Layouts are cached by (stride, formats, offsets) rather than stored in the fmt dictionary itself, so
+# fmt structures stay plain JSON-serializable dicts and a layout can never go stale if a fmt is edited.  Only the
+# most recently used layouts are kept, so batch runs over many different fmts do not grow the cache without limit.
+def get_vb_layout(elements, stride):
+    return(build_vb_layout(int(stride), tuple([(x["Format"], int(x["AlignedByteOffset"])) for x in elements])))
+
+@functools.lru_cache(maxsize = 256)
+def build_vb_layout(stride, formats):
+    elements = [{"Format": x[0], "AlignedByteOffset": x[1]} for x in formats]
+    if len(elements) == 0 or elements[0]["AlignedByteOffset"] < 0\
+            or any([x <= 0 for x in calc_buffer_strides(elements, stride)]):
+        return(False) # Unusual layout, leave it to the per-vertex code
+    return(VertexLayout(elements, stride))
+
+def compile_fmt_layouts(fmt_struct):
+    if 'stride' in fmt_struct:
+        get_vb_layout(fmt_struct['elements'], fmt_struct['stride'])
+    slot_elements = get_slot_elements(fmt_struct)
+    for input_slot in slot_elements:
+        get_vb_layout(slot_elements[input_slot], fmt_struct['vb{0} stride'.format(input_slot)])
+    return
+
+# Input slots of a multi-slot fmt, in the order of their 'vbN stride' keys
+def get_input_slots(fmt_struct):
+    return([x[2:-7] for x in fmt_struct if len(x.split(' stride')) > 1 and x[0:2] == 'vb'])
+
+# Groups the elements of a multi-slot fmt by input slot in a single pass, {input_slot: [elements]}
+def get_slot_elements(fmt_struct):
+    slot_elements = {x:[] for x in get_input_slots(fmt_struct)}
+    for element in fmt_struct['elements']:
+        if element.get('InputSlot') in slot_elements:
+            slot_elements[element['InputSlot']].append(element)
+    return(slot_elements)
 
 def read_fmt(fmt_filename):
     fmt_struct = {}
@@ -170,6 +371,8 @@ def read_fmt(fmt_filename):
                     break
                 fmt_struct[line.split(': ')[0]] = line.split(': ')[1]
         fmt_struct['elements'] = elements
+    # Compile the vertex layout(s) up front, every later read_vb / write_vb call with this fmt reuses them
+    compile_fmt_layouts(fmt_struct)
     return(fmt_struct)
 
 def write_fmt(fmt_struct, fmt_filename):
@@ -189,6 +392,14 @@ def write_fmt(fmt_struct, fmt_filename):
     return
 
 def read_ib_stream(ib_stream, fmt_struct, e = '<'):
+    ib_array = decode_ib_array(ib_stream, fmt_struct, e)
+    if not type(ib_array) == bool:
+        # Same grouping as below, a trailing partial triangle is kept as a short list
+        whole = len(ib_array) - len(ib_array) % 3
+        ib_data = ib_array[:whole].reshape(-1, 3).tolist()
+        if whole < len(ib_array):
+            ib_data.append(ib_array[whole:].tolist())
+        return(ib_data)
     ib_data = []
     # Cheating a bit here, since all index buffers I've seen are single numbers, but fmt doesn't have a stride for IB
     ib_stride = int(int(re.findall("[0-9]+", fmt_struct["format"])[0])/8)
@@ -205,21 +416,73 @@ def read_ib_stream(ib_stream, fmt_struct, e = '<'):
                 triangle = []
     return(ib_data)
 
-def read_ib(ib_filename, fmt_struct, e = '<'):
-    with open(ib_filename, 'rb') as f:
-        ib_stream = f.read()
+# NumPy index buffer codec, used for single-component integer formats (R16_UINT, R32_UINT, etc).
+# Returns False if NumPy is not available or the format is not supported, so callers can fall back.
+def get_ib_dtype(fmt_struct, e = '<'):
+    spec = get_format_spec(fmt_struct["format"])
+    if numpy == None or prefer_numpy == False or not spec.vec_elements == 1 or not spec.numtype == 'UINT'\
+            or not spec.matches(spec.stride):
+        return(False)
+    return(numpy.dtype(e + spec.numpy_char))
+
+# Flat array of indices in native byte order
+def decode_ib_array(ib_stream, fmt_struct, e = '<'):
+    ib_dtype = get_ib_dtype(fmt_struct, e)
+    if type(ib_dtype) == bool or not len(ib_stream) % ib_dtype.itemsize == 0:
+        return(False)
+    return(numpy.frombuffer(ib_stream, dtype = ib_dtype).astype(ib_dtype.newbyteorder('=')))
+
+# Index buffer (triangles, flat list or array) as bytes.  Indices that do not fit the format are left to
+# the struct codec, which raises the same error as before.
+def encode_ib_array(ib_data, fmt_struct, e = '<'):
+    ib_dtype = get_ib_dtype(fmt_struct, e)
+    if type(ib_dtype) == bool:
+        return(False)
+    ib_data = numpy.asarray(flatten_ib(ib_data))
+    if len(ib_data) == 0:
+        return(b'')
+    if not ib_data.dtype.kind in 'ui' or not ib_data.ndim == 1 or ib_data.min() < 0\
+            or ib_data.max() > numpy.iinfo(ib_dtype).max:
+        return(False)
+    return(ib_data.astype(ib_dtype).tobytes())
+
+# Index buffer as an (N,3) array of triangles viewing the raw (usually memory-mapped) data without a copy.
+# Returns False if NumPy is not available or the buffer is not made of whole triangles.
+def map_ib_stream(ib_stream, fmt_struct, e = '<'):
+    spec = get_format_spec(fmt_struct["format"])
+    if numpy == None or not spec.matches(spec.stride) or not spec.vec_elements == 1\
+            or not len(ib_stream) % (spec.stride * 3) == 0:
+        return(False)
+    return(numpy.frombuffer(ib_stream, dtype = e + spec.numpy_char).reshape(-1, 3))
+
+# With use_mmap, the file is memory-mapped and the triangles are returned as a read-only (N,3) array
+def read_ib(ib_filename, fmt_struct, e = '<', use_mmap = False):
+    if use_mmap == True:
+        ib_stream = map_file(ib_filename)
+        ib_data = map_ib_stream(ib_stream, fmt_struct, e)
+        if not type(ib_data) == bool:
+            return(ib_data)
+    else:
+        with open(ib_filename, 'rb') as f:
+            ib_stream = f.read()
     return(read_ib_stream(ib_stream, fmt_struct, e))
 
+# Index buffers may be lists of triangles, flat lists or arrays
+def flatten_ib(ib_data):
+    if not numpy == None and isinstance(ib_data, numpy.ndarray):
+        return(ib_data.reshape(-1))
+    if len(ib_data) > 0 and type(ib_data[0]) == list:
+        return([x for y in ib_data for x in y])
+    return(ib_data)
+
 def write_ib_stream(ib_data, ib_stream, fmt_struct, e = '<'):
     # See above about cheating
+    ib_bytes = encode_ib_array(ib_data, fmt_struct, e)
+    if not type(ib_bytes) == bool:
+        ib_stream.write(ib_bytes)
+        return
     ib_stride = int(int(re.findall("[0-9]+", fmt_struct["format"])[0])/8)
-    if len(ib_data) > 0:
-        if type(ib_data[0]) == list: # Flatten list for legacy code
-            new_ib_data = [x for y in ib_data for x in y]
-        else:
-            new_ib_data = ib_data
-    else:
-        new_ib_data = ib_data
+    new_ib_data = flatten_ib(ib_data) # Flatten list for legacy code
     for i in range(len(new_ib_data)):
         pack_dxgi_vector(ib_stream, [new_ib_data[i]], ib_stride, fmt_struct["format"], e)
     return
@@ -229,8 +492,335 @@ def write_ib(ib_data, ib_filename, fmt_struct, e = '<'):
         write_ib_stream(ib_data, f, fmt_struct, e)
     return
 
-def read_vb_stream(vb_stream, fmt_struct, e = '<'):
+# NumPy codec.  The layout's structured dtype describes a whole vertex (offsets, formats, stride and
+# endianness), so a buffer is decoded with one numpy.frombuffer() and encoded with one tobytes().  Elements
+# that unpack_dxgi_vector() cannot decode become raw void fields, which give the same bytes objects.
+# Same values as unpack_dxgi_vector(): UNORM / SNORM are divided out to floats, packed formats are split into
+# their components, everything else is passed through
+def decode_vb_field(field, spec, raw = False):
+    if not raw:
+        return(spec.decode_array(field))
+    return(field)
+
+# Same clamping and rounding as pack_dxgi_vector()
+def encode_vb_field(data, spec, stride, raw = False, e = '<'):
+    if isinstance(data, MappedBuffer):
+        data = data.decode()
+    if raw and isinstance(data, numpy.ndarray) and data.dtype.kind == 'V':
+        if not data.dtype.itemsize == stride:
+            raise ValueError("Raw element data does not match stride")
+        return(data)
+    elif raw:
+        if not all([len(x) == stride for x in data]):
+            raise ValueError("Raw element data does not match stride")
+        return(numpy.frombuffer(b''.join(data), dtype = 'V{0}'.format(stride)))
+    data = numpy.asarray(data)
+    if len(data) == 0:
+        data = data.reshape(0, spec.vec_elements)
+    if not (data.ndim == 2 and data.shape[1] >= spec.vec_elements):
+        raise ValueError("Element data does not match format")
+    return(spec.encode_array(data, e))
+
+# One element of a vertex buffer, viewing the raw (usually memory-mapped) data.  Nothing is copied or decoded
+# up front: indexing and iterating decode only the vertices requested, and numpy.asarray() decodes the whole
+# element.  The view keeps the underlying buffer (and any mapping) alive for as long as it is referenced.
+class MappedBuffer:
+    __slots__ = ('field', 'spec', 'raw')
+    chunk_size = 4096 # Vertices decoded at a time while iterating
+
+    def __init__(self, field, spec, raw = False):
+        self.field = field
+        self.spec = spec
+        self.raw = raw
+
+    def __len__(self):
+        return(len(self.field))
+
+    def __getitem__(self, index):
+        return(decode_vb_field(self.field[index], self.spec, self.raw).tolist())
+
+    def __iter__(self):
+        for i in range(0, len(self.field), self.chunk_size):
+            yield from self[i:i+self.chunk_size]
+
+    def __array__(self, dtype = None, copy = None):
+        decoded = self.decode()
+        if not dtype == None:
+            decoded = decoded.astype(dtype)
+        elif copy == True:
+            decoded = decoded.copy()
+        return(decoded)
+
+    def decode(self):
+        return(decode_vb_field(self.field, self.spec, self.raw))
+
+    def tolist(self):
+        return(self.decode().tolist())
+
+# Returns one MappedBuffer per element, or False if NumPy or the layout is not available
+def map_vb_buffers(vb_stream, elements, stride, e = '<'):
+    layout = get_vb_layout(elements, stride)
+    if numpy == None or layout == False:
+        return(False)
+    vb_array = numpy.frombuffer(vb_stream, dtype = layout.get_dtype(e), count = int(len(vb_stream) / layout.stride))
+    return([MappedBuffer(vb_array['e{0}'.format(i)], layout.specs[i], layout.raw[i]) for i in range(len(elements))])
+
+# Returns one decoded array per element, or False if NumPy or the layout is not available
+def decode_vb_arrays(vb_stream, elements, stride, e = '<'):
+    mapped = map_vb_buffers(vb_stream, elements, stride, e)
+    if mapped == False:
+        return(False)
+    return([x.decode() for x in mapped])
+
+# Returns the encoded buffer as bytes, or False if the data must go through the slow path
+def encode_vb_arrays(vb_data, elements, stride, e = '<', interleave = True):
+    layout = get_vb_layout(elements, stride)
+    if numpy == None or layout == False or len(vb_data) < len(elements):
+        return(False)
+    try:
+        fields = [encode_vb_field(vb_data[i]["Buffer"], layout.specs[i], layout.buffer_strides[i], layout.raw[i], e)\
+            for i in range(len(elements))]
+    except (ValueError, TypeError, OverflowError):
+        return(False)
+    num_vertex = len(fields[0])
+    if not all([len(x) == num_vertex for x in fields]):
+        return(False)
+    if interleave == True:
+        vb_array = numpy.zeros(num_vertex, dtype = layout.get_dtype(e))
+        for i in range(len(fields)):
+            vb_array['e{0}'.format(i)] = fields[i]
+        return(vb_array.tobytes())
+    else:
+        return(b''.join([x.tobytes() for x in fields]))
+
+# Pure-Python codec.  The layout's struct.Struct unpacks (or packs) a whole vertex per call.
+def decode_vb_struct(vb_stream, elements, stride, e = '<'):
+    layout = get_vb_layout(elements, stride)
+    if layout == False:
+        return(False)
+    num_vertex = int(len(vb_stream) / layout.stride)
+    vertices = list(layout.get_struct(e).iter_unpack(memoryview(vb_stream)[:num_vertex * layout.stride]))
+    buffers = []
+    for i in range(len(elements)):
+        start, end = layout.slices[i]
+        if layout.raw[i]:
+            buffers.append([x[start] for x in vertices])
+        elif not layout.specs[i].packed_bits == False:
+            buffers.append([layout.specs[i].unpack_word(x[start]) for x in vertices])
+        elif not layout.specs[i].float_max == False:
+            float_max = layout.specs[i].float_max
+            buffers.append([[y / float_max for y in x[start:end]] for x in vertices])
+        else:
+            buffers.append([list(x[start:end]) for x in vertices])
+    return(buffers)
+
+def encode_vb_struct(vb_data, elements, stride, e = '<', interleave = True):
+    layout = get_vb_layout(elements, stride)
+    if layout == False or len(vb_data) < len(elements):
+        return(False)
+    num_vertex = len(vb_data[0]["Buffer"])
+    try:
+        if interleave == True:
+            vertex_struct = layout.get_struct(e)
+            output = bytearray(num_vertex * layout.stride)
+            for j in range(num_vertex):
+                values = []
+                for i in range(len(elements)):
+                    if layout.raw[i]:
+                        if not len(vb_data[i]["Buffer"][j]) == layout.buffer_strides[i]:
+                            return(False)
+                        values.append(vb_data[i]["Buffer"][j])
+                    else:
+                        values.extend(layout.specs[i].to_packable(vb_data[i]["Buffer"][j]))
+                vertex_struct.pack_into(output, j * layout.stride, *values)
+            return(bytes(output))
+        else:
+            output = []
+            for i in range(len(elements)):
+                if layout.raw[i]:
+                    if not all([len(x) == layout.buffer_strides[i] for x in vb_data[i]["Buffer"][:num_vertex]]):
+                        return(False)
+                    output.extend(vb_data[i]["Buffer"][:num_vertex])
+                else:
+                    element_struct = layout.specs[i].get_struct(e)
+                    output.extend([element_struct.pack(*layout.specs[i].to_packable(x))\
+                        for x in vb_data[i]["Buffer"][:num_vertex]])
+            return(b''.join(output))
+    except (struct.error, TypeError, IndexError, ValueError, OverflowError):
+        return(False) # Let the per-vertex code raise the usual error
+
+# Decodes into per-element lists, using NumPy when available and the whole-vertex struct otherwise
+def decode_vb_buffers(vb_stream, elements, stride, e = '<'):
+    if prefer_numpy == True:
+        decoded = decode_vb_arrays(vb_stream, elements, stride, e)
+        if not decoded == False:
+            return([x.tolist() for x in decoded])
+    return(decode_vb_struct(vb_stream, elements, stride, e))
+
+def encode_vb_buffers(vb_data, elements, stride, e = '<', interleave = True):
+    if prefer_numpy == True:
+        encoded = encode_vb_arrays(vb_data, elements, stride, e, interleave)
+        if not encoded == False:
+            return(encoded)
+    return(encode_vb_struct(vb_data, elements, stride, e, interleave))
+
+# Converts a Buffer (list of lists, MappedBuffer or array) into an owned, writable NumPy array in native byte
+# order.  Raw (undecodable) elements become void arrays, which write back out as the same bytes.
+def to_buffer_array(buffer):
+    if numpy == None:
+        return(list(buffer))
+    if isinstance(buffer, MappedBuffer):
+        buffer = buffer.decode()
+    elif not isinstance(buffer, numpy.ndarray):
+        if len(buffer) > 0 and isinstance(buffer[0], bytes) and all([len(x) == len(buffer[0]) for x in buffer]):
+            buffer = numpy.frombuffer(b''.join(buffer), dtype = 'V{0}'.format(len(buffer[0])))
+        else:
+            buffer = numpy.asarray(buffer)
+    return(numpy.array(buffer, dtype = buffer.dtype.newbyteorder('=')))
+
+# Array-backed replacements for the {'SemanticName', 'SemanticIndex', ('InputSlot',) 'Buffer'} dictionaries.
+# They support the same dictionary-style access (element['Buffer'], 'InputSlot' in element, etc.) so existing
+# code keeps working, but each Buffer is one contiguous array per semantic instead of a list of lists.
+# Use tolist() / to_dict() to get the plain JSON-serializable structures back.
+class VertexElement:
+    __slots__ = ('SemanticName', 'SemanticIndex', 'InputSlot', 'Buffer')
+
+    def __init__(self, SemanticName, SemanticIndex, Buffer, InputSlot = None):
+        self.SemanticName = SemanticName
+        self.SemanticIndex = SemanticIndex
+        self.InputSlot = InputSlot
+        self.Buffer = Buffer
+
+    @classmethod
+    def from_dict(cls, element, decode = True):
+        if isinstance(element, cls):
+            if decode == True and isinstance(element.Buffer, MappedBuffer):
+                element.Buffer = to_buffer_array(element.Buffer)
+            return(element)
+        buffer = element['Buffer']
+        if decode == True or not isinstance(buffer, MappedBuffer):
+            buffer = to_buffer_array(buffer)
+        return(cls(element['SemanticName'], element['SemanticIndex'], buffer, element.get('InputSlot')))
+
+    def keys(self):
+        return([x for x in self.__slots__ if not getattr(self, x) is None])
+
+    def __contains__(self, key):
+        return(key in self.keys())
+
+    def __getitem__(self, key):
+        if not key in self.keys():
+            raise KeyError(key)
+        return(getattr(self, key))
+
+    def __setitem__(self, key, value):
+        if not key in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default = None):
+        return(getattr(self, key) if key in self.keys() else default)
+
+    def to_dict(self):
+        element = {x:getattr(self, x) for x in self.keys()}
+        element['Buffer'] = self.Buffer.tolist() if hasattr(self.Buffer, 'tolist') else list(self.Buffer)
+        return(element)
+
+# List of VertexElements.  With decode = False, memory-mapped buffers (read_vb(..., use_mmap = True)) are kept
+# lazy until decode() is called or they are written out.
+class VertexBuffer:
+    __slots__ = ('elements',)
+
+    def __init__(self, elements = [], decode = True):
+        self.elements = [VertexElement.from_dict(x, decode) for x in elements]
+
+    def __len__(self):
+        return(len(self.elements))
+
+    def __getitem__(self, index):
+        return(self.elements[index])
+
+    def __setitem__(self, index, element):
+        self.elements[index] = VertexElement.from_dict(element)
+
+    def __iter__(self):
+        return(iter(self.elements))
+
+    def append(self, element):
+        self.elements.append(VertexElement.from_dict(element))
+
+    def decode(self):
+        for element in self.elements:
+            VertexElement.from_dict(element)
+        return(self)
+
+    def tolist(self):
+        return([x.to_dict() for x in self.elements])
+
+# Replacement for the {'fmt', 'ib', 'vb', 'vgmap'} submesh dictionaries.  ib is an (N,3) index array for
+# triangle lists (N,1 for strips / points), vb is a VertexBuffer.  fmt and vgmap are the usual dictionaries.
+class Submesh:
+    __slots__ = ('fmt', 'ib', 'vb', 'vgmap')
+
+    def __init__(self, fmt, ib, vb, vgmap = False):
+        self.fmt = fmt
+        self.ib = ib
+        self.vb = vb if isinstance(vb, VertexBuffer) else VertexBuffer(vb)
+        self.vgmap = vgmap
+
+    @classmethod
+    def from_dict(cls, submesh):
+        if isinstance(submesh, cls):
+            return(submesh)
+        ib = submesh['ib']
+        if not numpy == None and not isinstance(ib, numpy.ndarray):
+            if len(ib) == 0:
+                ib = numpy.zeros((0,3), dtype = int)
+            elif all([len(x) == len(ib[0]) for x in ib]): # A trailing partial triangle stays a list
+                ib = numpy.array(ib).reshape(len(ib), -1)
+        return(cls(submesh['fmt'], ib, submesh['vb'], submesh.get('vgmap', False)))
+
+    def keys(self):
+        return(list(self.__slots__))
+
+    def __contains__(self, key):
+        return(key in self.__slots__)
+
+    def __getitem__(self, key):
+        if not key in self.__slots__:
+            raise KeyError(key)
+        return(getattr(self, key))
+
+    def __setitem__(self, key, value):
+        if not key in self.__slots__:
+            raise KeyError(key)
+        if key == 'vb' and not isinstance(value, VertexBuffer):
+            value = VertexBuffer(value)
+        setattr(self, key, value)
+
+    def get(self, key, default = None):
+        return(getattr(self, key) if key in self.__slots__ else default)
+
+    def to_dict(self):
+        return({'fmt': self.fmt, 'ib': self.ib.tolist() if hasattr(self.ib, 'tolist') else self.ib,\
+            'vb': self.vb.tolist(), 'vgmap': self.vgmap})
+
+# With lazy, each Buffer is a MappedBuffer over vb_stream instead of a list (when NumPy is available)
+def read_vb_stream(vb_stream, fmt_struct, e = '<', lazy = False):
     vb_data = []
+    decoded = False
+    if lazy == True:
+        decoded = map_vb_buffers(vb_stream, fmt_struct["elements"], fmt_struct["stride"], e)
+    if decoded == False:
+        decoded = decode_vb_buffers(vb_stream, fmt_struct["elements"], fmt_struct["stride"], e)
+    if not decoded == False:
+        for i in range(len(fmt_struct["elements"])):
+            element = {}
+            element["SemanticName"] = fmt_struct["elements"][i]["SemanticName"]
+            element["SemanticIndex"] = fmt_struct["elements"][i]["SemanticIndex"]
+            element["Buffer"] = decoded[i]
+            vb_data.append(element)
+        return(vb_data)
     with io.BytesIO(vb_stream) as f:
         length = f.seek(0,2)
         f.seek(0)
@@ -256,10 +846,25 @@ def read_vb_stream(vb_stream, fmt_struct, e = '<'):
             vb_data.append(element)
     return(vb_data)
 
-def read_seg_vb_stream(vb_stream, fmt_struct, input_slot, e = '<'):
+def read_seg_vb_stream(vb_stream, fmt_struct, input_slot, e = '<', lazy = False, seg_elements = None):
     seg_stride = "vb{} stride".format(input_slot)
-    seg_elements = [x for x in fmt_struct['elements'] if x['InputSlot'] == input_slot]
+    if seg_elements == None:
+        seg_elements = [x for x in fmt_struct['elements'] if x['InputSlot'] == input_slot]
     vb_data = []
+    decoded = False
+    if lazy == True:
+        decoded = map_vb_buffers(vb_stream, seg_elements, fmt_struct[seg_stride], e)
+    if decoded == False:
+        decoded = decode_vb_buffers(vb_stream, seg_elements, fmt_struct[seg_stride], e)
+    if not decoded == False:
+        for i in range(len(seg_elements)):
+            element = {}
+            element["SemanticName"] = seg_elements[i]["SemanticName"]
+            element["SemanticIndex"] = seg_elements[i]["SemanticIndex"]
+            element["InputSlot"] = seg_elements[i]["InputSlot"]
+            element["Buffer"] = decoded[i]
+            vb_data.append(element)
+        return(vb_data)
     with io.BytesIO(vb_stream) as f:
         length = f.seek(0,2)
         f.seek(0)
@@ -286,24 +891,62 @@ def read_seg_vb_stream(vb_stream, fmt_struct, input_slot, e = '<'):
             vb_data.append(element)
     return(vb_data)
 
-def read_vb(vb_filename, fmt_struct, e = '<'):
+# Memory-maps a file read-only.  Empty files cannot be mapped, and are returned as an empty bytes object.
+def map_file(filename):
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return(b'')
+        return(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+# With use_mmap, the file(s) are memory-mapped and every Buffer is a MappedBuffer (see read_vb_stream).
+# These buffers are read-only and not JSON serializable; use .tolist() or numpy.asarray() to decode them.
+def read_vb(vb_filename, fmt_struct, e = '<', use_mmap = False):
     if 'stride' in fmt_struct:
-        with open(vb_filename, 'rb') as f:
-            vb_stream = f.read()
-        return(read_vb_stream(vb_stream, fmt_struct, e))
-    elif 'vb0 stride' in fmt_struct:
-        vb = []
-        for input_slot in [x[2:-7] for x in fmt_struct if len(x.split('stride')) > 1]:
-            with open(vb_filename + input_slot, 'rb') as f:
+        if use_mmap == True:
+            vb_stream = map_file(vb_filename)
+        else:
+            with open(vb_filename, 'rb') as f:
                 vb_stream = f.read()
-            vb.extend(read_seg_vb_stream(vb_stream, fmt_struct, input_slot, e))
-        return(vb)
+        return(read_vb_stream(vb_stream, fmt_struct, e, lazy = use_mmap))
+    elif 'vb0 stride' in fmt_struct:
+        return(read_multislot_vb(vb_filename, fmt_struct, e, use_mmap))
     else:
         print("Decoding error when trying to interpret fmt file for {0}!\r\n".format(vb_filename))
         input("Press Enter to abort.")
         raise
 
+# Runs func(input_slot) for every slot, in a thread pool if there is more than one slot.  The bulk NumPy
+# decode / encode and the file I/O release the GIL, so the slots are processed concurrently.  Results are
+# returned in slot order, and the first exception raised by a slot is re-raised here.
+def map_input_slots(func, input_slots):
+    num_threads = min(vb_slot_threads, len(input_slots))
+    if num_threads <= 1:
+        return([func(x) for x in input_slots])
+    with ThreadPoolExecutor(max_workers = num_threads) as executor:
+        return(list(executor.map(func, input_slots)))
+
+# Reads vb_filename + '0', '1', ... for a multi-slot fmt.  Each slot file is read (or mapped) once and decoded
+# with its own elements, and the per-slot columns are merged, as-is, into a single vb_data list in slot order.
+def read_multislot_vb(vb_filename, fmt_struct, e = '<', use_mmap = False):
+    slot_elements = get_slot_elements(fmt_struct)
+    def read_slot(input_slot):
+        if use_mmap == True:
+            vb_stream = map_file(vb_filename + input_slot)
+        else:
+            with open(vb_filename + input_slot, 'rb') as f:
+                vb_stream = f.read()
+        return(read_seg_vb_stream(vb_stream, fmt_struct, input_slot, e, lazy = use_mmap,\
+            seg_elements = slot_elements[input_slot]))
+    vb = []
+    for slot_vb in map_input_slots(read_slot, list(slot_elements.keys())):
+        vb.extend(slot_vb)
+    return(vb)
+
 def write_vb_stream(vb_data, vb_stream, fmt_struct, e = '<', interleave = True):
+    encoded = encode_vb_buffers(vb_data, fmt_struct["elements"], fmt_struct["stride"], e, interleave)
+    if not encoded == False:
+        vb_stream.write(encoded)
+        return
     buffer_strides = []
     # Calculate individual buffer strides
     for i in range(len(fmt_struct["elements"])):
@@ -329,6 +972,10 @@ def write_seg_vb_stream(vb_data, vb_stream, fmt_struct, input_slot, e = '<', int
     seg_stride = fmt_struct["vb{} stride".format(input_slot)]
     seg_vb_data = [x for x in vb_data if x['InputSlot'] == input_slot]
     seg_elements = [x for x in fmt_struct['elements'] if x['InputSlot'] == input_slot]
+    encoded = encode_vb_buffers(seg_vb_data, seg_elements, seg_stride, e, interleave)
+    if not encoded == False:
+        vb_stream.write(encoded)
+        return
     # Calculate individual buffer strides
     for i in range(len(seg_elements)):
         if i == len(seg_elements) - 1:
@@ -348,20 +995,68 @@ def write_seg_vb_stream(vb_data, vb_stream, fmt_struct, input_slot, e = '<', int
                 pack_dxgi_vector(vb_stream, seg_vb_data[i]["Buffer"][j], buffer_strides[i], seg_elements[i]["Format"], e)
     return
 
+# Splits vb_data into batches of at most batch_size vertices.  Buffers are sliced (arrays and memory-mapped
+# buffers are not copied), and each batch is a plain vb_data list that write_vb_stream() accepts.
+def iter_vb_batches(vb_data, batch_size = None):
+    if batch_size == None:
+        batch_size = vb_batch_size
+    num_vertex = len(vb_data[0]["Buffer"]) if len(vb_data) > 0 else 0
+    for start in range(0, num_vertex, batch_size):
+        vb_batch = []
+        for element in vb_data:
+            batch_element = {x:element[x] for x in element.keys() if not x == "Buffer"}
+            if isinstance(element["Buffer"], MappedBuffer):
+                batch_element["Buffer"] = MappedBuffer(element["Buffer"].field[start:start+batch_size],\
+                    element["Buffer"].spec, element["Buffer"].raw)
+            else:
+                batch_element["Buffer"] = element["Buffer"][start:start+batch_size]
+            vb_batch.append(batch_element)
+        yield(vb_batch)
+
+# Streaming (interleaved) writer.  vb_batches is any iterable of vb_data lists, e.g. a generator or
+# iter_vb_batches(); each batch holds the next run of vertices and is encoded and written to vb_stream as it
+# arrives, so peak memory depends on the batch size instead of the total vertex count.  With input_slot, only
+# that slot's elements are written (as in write_seg_vb_stream).  Returns the number of vertices written.
+def write_vb_stream_batches(vb_batches, vb_stream, fmt_struct, e = '<', input_slot = None):
+    num_vertex = 0
+    for vb_batch in vb_batches:
+        if len(vb_batch) == 0 or len(vb_batch[0]["Buffer"]) == 0:
+            continue
+        if input_slot == None:
+            write_vb_stream(vb_batch, vb_stream, fmt_struct, e)
+        else:
+            write_seg_vb_stream(vb_batch, vb_stream, fmt_struct, input_slot, e)
+        num_vertex += len(vb_batch[0]["Buffer"])
+    return(num_vertex)
+
 def write_vb(vb_data, vb_filename, fmt_struct, e = '<', interleave = True):
     if 'stride' in fmt_struct:
         with open(vb_filename, 'wb') as f:
-            write_vb_stream(vb_data, f, fmt_struct, e=e, interleave=interleave)
+            if interleave == True:
+                write_vb_stream_batches(iter_vb_batches(vb_data), f, fmt_struct, e=e)
+            else:
+                write_vb_stream(vb_data, f, fmt_struct, e=e, interleave=interleave)
     elif 'vb0 stride' in fmt_struct:
-        for input_slot in [x[2:-7] for x in fmt_struct if len(x.split('stride')) > 1]:
-            with open(vb_filename + input_slot, 'wb') as f:
-                write_seg_vb_stream(vb_data, f, fmt_struct, input_slot, e=e, interleave=interleave)
+        write_multislot_vb(vb_data, vb_filename, fmt_struct, e, interleave)
     else:
         print("Decoding error when trying to interpret fmt file for {0}!\r\n".format(vb_filename))
         input("Press Enter to abort.")
         raise
     return
 
+# Writes each slot of a multi-slot fmt to vb_filename + input_slot, one slot per thread
+def write_multislot_vb(vb_data, vb_filename, fmt_struct, e = '<', interleave = True):
+    def write_slot(input_slot):
+        seg_vb_data = [x for x in vb_data if x['InputSlot'] == input_slot]
+        with open(vb_filename + input_slot, 'wb') as f:
+            if interleave == True:
+                write_vb_stream_batches(iter_vb_batches(seg_vb_data), f, fmt_struct, e=e, input_slot=input_slot)
+            else:
+                write_seg_vb_stream(seg_vb_data, f, fmt_struct, input_slot, e=e, interleave=interleave)
+        return
+    map_input_slots(write_slot, get_input_slots(fmt_struct))
+    return
+
 # The following two functions are purely for convenience
 def read_struct_from_json(filename, raise_on_fail = True):
     with open(filename, 'r') as f:
@@ -382,3 +1077,106 @@ def write_struct_to_json(struct, filename):
     with open(filename, "wb") as f:
         f.write(json.dumps(struct, indent=4).encode("utf-8"))
     return
+
+# Binary sidecar for large sectioned JSON files such as mesh_metadata.json.  The JSON file stays the editable
+# source of truth; the sidecar (same name, .bin) holds the top-level values and every entry of 'sections' as
+# separate marshal blobs behind a section table, so a reader can decode only the sections it needs.  The header
+# records the size, mtime and SHA-1 of the JSON it was built from, and a stale sidecar is rebuilt on read.
+#
+# Header: magic, sidecar version, marshal version, JSON size, JSON mtime (ns), JSON SHA-1, table offset, table size
+# Table: marshal'd list of (offset, size) for the top-level blob, then (section type, offset, size) per section
+metadata_sidecar_magic = b'JSMD'
+metadata_sidecar_version = 1
+metadata_sidecar_header = struct.Struct("<4s2I2Q20s2Q")
+
+def get_sidecar_filename(json_filename):
+    return(os.path.splitext(json_filename)[0] + '.bin')
+
+def write_metadata_sidecar(json_filename, sidecar_filename = None):
+    if sidecar_filename == None:
+        sidecar_filename = get_sidecar_filename(json_filename)
+    with open(json_filename, 'rb') as f:
+        json_bytes = f.read()
+        json_stat = os.fstat(f.fileno())
+    metadata = json.loads(json_bytes.decode("utf-8"))
+    sections = metadata['sections'] if 'sections' in metadata else []
+    # Stored as (key, value) pairs to keep the key order of the JSON; 'sections' is a placeholder
+    top_level = marshal.dumps([(x, None if x == 'sections' else metadata[x]) for x in metadata])
+    offset = metadata_sidecar_header.size
+    blobs = [top_level]
+    table = [(offset, len(top_level))]
+    offset += len(top_level)
+    for section in sections:
+        blobs.append(marshal.dumps(section))
+        table.append((section['type'] if 'type' in section else '', offset, len(blobs[-1])))
+        offset += len(blobs[-1])
+    table_blob = marshal.dumps(table)
+    # Written to a temporary file first, so that an interrupted write never leaves a truncated sidecar behind
+    with open(sidecar_filename + '.tmp', 'wb') as f:
+        f.write(metadata_sidecar_header.pack(metadata_sidecar_magic, metadata_sidecar_version, marshal.version,\
+            len(json_bytes), json_stat.st_mtime_ns, hashlib.sha1(json_bytes).digest(), offset, len(table_blob)))
+        for blob in blobs:
+            f.write(blob)
+        f.write(table_blob)
+    os.replace(sidecar_filename + '.tmp', sidecar_filename)
+    return
+
+# Returns the parsed header of the sidecar if it is current for the JSON file, or False if it must be rebuilt.
+# Matching size and mtime are trusted; otherwise the JSON is hashed, so touching the file does not force a rebuild.
+def check_metadata_sidecar(json_filename, sidecar_filename):
+    try:
+        with open(sidecar_filename, 'rb') as f:
+            header = metadata_sidecar_header.unpack(f.read(metadata_sidecar_header.size))
+    except (OSError, struct.error):
+        return(False)
+    magic, version, marshal_version, json_size, json_mtime, json_hash = header[0:6]
+    if not (magic == metadata_sidecar_magic and version == metadata_sidecar_version and marshal_version == marshal.version):
+        return(False)
+    json_stat = os.stat(json_filename)
+    if not json_stat.st_size == json_size:
+        return(False)
+    if not json_stat.st_mtime_ns == json_mtime:
+        with open(json_filename, 'rb') as f:
+            if not hashlib.sha1(f.read()).digest() == json_hash:
+                return(False)
+        # Same contents with a new mtime (copied, checked out...), record it so the next read need not hash again
+        header = header[0:4] + (json_stat.st_mtime_ns,) + header[5:]
+        try:
+            with open(sidecar_filename, 'r+b') as f:
+                f.write(metadata_sidecar_header.pack(*header))
+        except OSError:
+            pass
+    return(header)
+
+# Reads a sectioned JSON file through its sidecar, (re)building the sidecar first if it is missing or stale.
+# With section_types (a list of 'type' values), only those sections are decoded and the rest are left out of
+# 'sections'; section order is preserved either way.  If the sidecar cannot be written (e.g. a read-only folder)
+# or the JSON cannot be decoded, the JSON file is read directly, which also reports where any decoding error is.
+def read_metadata(json_filename, section_types = None):
+    sidecar_filename = get_sidecar_filename(json_filename)
+    header = check_metadata_sidecar(json_filename, sidecar_filename)
+    if header == False:
+        try:
+            write_metadata_sidecar(json_filename, sidecar_filename)
+            header = check_metadata_sidecar(json_filename, sidecar_filename)
+        except (OSError, ValueError):
+            header = False
+        if header == False:
+            metadata = read_struct_from_json(json_filename)
+            if not section_types == None and 'sections' in metadata:
+                metadata['sections'] = [x for x in metadata['sections'] if x.get('type', '') in section_types]
+            return(metadata)
+    table_offset, table_size = header[6], header[7]
+    with open(sidecar_filename, 'rb') as f:
+        f.seek(table_offset)
+        table = marshal.loads(f.read(table_size))
+        f.seek(table[0][0])
+        metadata = dict(marshal.loads(f.read(table[0][1])))
+        if 'sections' in metadata:
+            sections = []
+            for section_type, offset, size in table[1:]:
+                if section_types == None or section_type in section_types:
+                    f.seek(offset)
+                    sections.append(marshal.loads(f.read(size)))
+            metadata['sections'] = sections
+    return(metadata)
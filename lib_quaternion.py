@@ -0,0 +1,71 @@
+# A small library of batched quaternion and rigid transform functions for numpy arrays, used for skeletons
+# and cloth meshes in place of per-bone / per-vertex Quaternion objects.  Quaternions are w,x,y,z in the last
+# axis, so every function takes a single quaternion (4,) or any stack of them (N,4), with vectors as (3,) / (N,3).
+# Results match pyquaternion (normalisation rules included) to within floating point rounding.
+#
+# GitHub eArmada8/gust_stuff
+
+import numpy
+
+identity_quaternion = numpy.array([1.0, 0.0, 0.0, 0.0])
+
+# Hamilton product a * b
+def quat_multiply(a, b):
+    a, b = numpy.asarray(a, dtype = numpy.float64), numpy.asarray(b, dtype = numpy.float64)
+    return(numpy.stack([a[...,0]*b[...,0] - a[...,1]*b[...,1] - a[...,2]*b[...,2] - a[...,3]*b[...,3],\
+        a[...,1]*b[...,0] + a[...,0]*b[...,1] - a[...,3]*b[...,2] + a[...,2]*b[...,3],\
+        a[...,2]*b[...,0] + a[...,3]*b[...,1] + a[...,0]*b[...,2] - a[...,1]*b[...,3],\
+        a[...,3]*b[...,0] - a[...,2]*b[...,1] + a[...,1]*b[...,2] + a[...,0]*b[...,3]], axis = -1))
+
+# Quaternions already of unit length (within 1e-14 of the sum of squares) are left as they are, as in pyquaternion.
+# Zero quaternions are also left as they are.
+def quat_normalise(q):
+    q = numpy.array(q, dtype = numpy.float64)
+    sum_of_squares = (q * q).sum(axis = -1)
+    rescale = (numpy.abs(1.0 - sum_of_squares) >= 1e-14) & (sum_of_squares > 0)
+    q[rescale] = q[rescale] / numpy.sqrt(sum_of_squares[rescale])[...,None]
+    return(q)
+
+def quat_conjugate(q):
+    return(numpy.asarray(q, dtype = numpy.float64) * numpy.array([1.0, -1.0, -1.0, -1.0]))
+
+# Conjugate over the sum of squares, so q need not be of unit length (a zero quaternion gives nan)
+def quat_inverse(q):
+    q = numpy.asarray(q, dtype = numpy.float64)
+    return(quat_conjugate(q) / (q * q).sum(axis = -1)[...,None])
+
+# Rotates vectors v by the (normalised) rotations q, as q * v * q^-1.  Broadcasts one q over many v and vice versa.
+def quat_rotate(q, v):
+    q = quat_normalise(q)
+    v = numpy.asarray(v, dtype = numpy.float64)
+    v_q = numpy.concatenate([numpy.zeros(v.shape[:-1]+(1,)), v], axis = -1)
+    return(quat_multiply(quat_multiply(q, v_q), quat_conjugate(q))[...,1:])
+
+# (...,3,3) rotation matrices of the (normalised) rotations
+def quat_to_matrix(q):
+    w, x, y, z = numpy.moveaxis(quat_normalise(q), -1, 0)
+    return(numpy.stack([numpy.stack([w*w + x*x - y*y - z*z, 2*(x*y - w*z), 2*(x*z + w*y)], axis = -1),\
+        numpy.stack([2*(x*y + w*z), w*w - x*x + y*y - z*z, 2*(y*z - w*x)], axis = -1),\
+        numpy.stack([2*(x*z - w*y), 2*(y*z + w*x), w*w - x*x - y*y + z*z], axis = -1)], axis = -2))
+
+# (...,4,4) transformation matrices, rotation q and translation p in the last column (column vector convention)
+def transform_matrix(q, p):
+    rotation = quat_to_matrix(q)
+    matrix = numpy.zeros(rotation.shape[:-2]+(4,4))
+    matrix[...,0:3,0:3] = rotation
+    matrix[...,0:3,3] = p
+    matrix[...,3,3] = 1.0
+    return(matrix)
+
+# Inverse of transform_matrix(q, p), in closed form (transposed rotation, rotated and negated translation)
+def transform_inverse(q, p):
+    rotation_t = numpy.swapaxes(quat_to_matrix(q), -1, -2)
+    matrix = numpy.zeros(rotation_t.shape[:-2]+(4,4))
+    matrix[...,0:3,0:3] = rotation_t
+    matrix[...,0:3,3] = -numpy.einsum('...ij,...j->...i', rotation_t, numpy.asarray(p, dtype = numpy.float64))
+    matrix[...,3,3] = 1.0
+    return(matrix)
+
+# Batched inverse of any (...,4,4) matrices, for transforms that are not rigid
+def matrix_inverse(matrices):
+    return(numpy.linalg.inv(numpy.asarray(matrices, dtype = numpy.float64)))
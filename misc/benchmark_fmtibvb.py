@@ -0,0 +1,195 @@
+# Micro-benchmarks for the .fmt / .ib / .vb codecs in lib_fmtibvb.py.  Synthetic buffers are generated
+# using attribute sets modeled on G1M meshes, in both byte orders and at several vertex counts, and the
+# throughput of read/write_vb_stream, read/write_ib_stream and read/write_fmt is reported and saved as JSON.
+# Pass a previous results file with --compare to list every benchmark that has become slower.
+#
+# This script expects lib_fmtibvb.py to be in the parent folder (the repository root).
+#
+# For command line options:
+# /path/to/python3 benchmark_fmtibvb.py --help
+#
+# GitHub eArmada8/gust_stuff
+
+import os, sys, io, re, json, time, random, tempfile, platform
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+import lib_fmtibvb
+from lib_fmtibvb import *
+
+# (SemanticName, SemanticIndex, Format) for each element; offsets are packed in order
+benchmark_layouts = {
+    'static_float': [('POSITION', '0', 'R32G32B32_FLOAT'), ('NORMAL', '0', 'R32G32B32_FLOAT'),\
+        ('TEXCOORD', '0', 'R32G32_FLOAT')],
+    'skinned_float': [('POSITION', '0', 'R32G32B32_FLOAT'), ('BLENDWEIGHT', '0', 'R32G32B32_FLOAT'),\
+        ('BLENDINDICES', '0', 'R8G8B8A8_UINT'), ('NORMAL', '0', 'R32G32B32_FLOAT'),\
+        ('TANGENT', '0', 'R32G32B32A32_FLOAT'), ('TEXCOORD', '0', 'R32G32_FLOAT'), ('COLOR', '0', 'R8G8B8A8_UNORM')],
+    'skinned_half': [('POSITION', '0', 'R32G32B32_FLOAT'), ('BLENDWEIGHT', '0', 'R8G8B8A8_UNORM'),\
+        ('BLENDINDICES', '0', 'R16G16B16A16_UINT'), ('NORMAL', '0', 'R16G16B16A16_FLOAT'),\
+        ('TANGENT', '0', 'R16G16B16A16_FLOAT'), ('TEXCOORD', '0', 'R16G16_FLOAT'),\
+        ('TEXCOORD', '1', 'R16G16_FLOAT'), ('COLOR', '0', 'R8G8B8A8_UNORM')],
+}
+
+ib_formats = ['DXGI_FORMAT_R16_UINT', 'DXGI_FORMAT_R32_UINT']
+
+def make_fmt(layout_name, ib_format = 'DXGI_FORMAT_R16_UINT'):
+    elements = []
+    offset = 0
+    for i in range(len(benchmark_layouts[layout_name])):
+        semantic_name, semantic_index, dxgi_format = benchmark_layouts[layout_name][i]
+        elements.append({'id': str(i), 'SemanticName': semantic_name, 'SemanticIndex': semantic_index,\
+            'Format': dxgi_format, 'InputSlot': '0', 'AlignedByteOffset': str(offset),\
+            'InputSlotClass': 'per-vertex', 'InstanceDataStepRate': '0'})
+        offset += get_stride_from_dxgi_format(dxgi_format)
+    return({'stride': str(offset), 'topology': 'trianglelist', 'format': ib_format, 'elements': elements})
+
+# Random values in the range of each format, so that every buffer survives a write / read round trip
+def make_vb(fmt, num_vertex, rng):
+    vb = []
+    for element in fmt['elements']:
+        num_values = len(re.findall('[0-9]+', element['Format'].split('_')[0]))
+        numtype = element['Format'].split('_')[-1]
+        if numtype == 'UINT':
+            max_value = min(2 ** int(re.findall('[0-9]+', element['Format'])[0]) - 1, 255)
+            buffer = [[rng.randint(0, max_value) for j in range(num_values)] for i in range(num_vertex)]
+        elif numtype == 'UNORM':
+            buffer = [[rng.random() for j in range(num_values)] for i in range(num_vertex)]
+        else:
+            buffer = [[rng.uniform(-1.0, 1.0) for j in range(num_values)] for i in range(num_vertex)]
+        vb.append({'SemanticName': element['SemanticName'], 'SemanticIndex': element['SemanticIndex'], 'Buffer': buffer})
+    return(vb)
+
+def make_ib(num_vertex, num_triangles, rng):
+    return([[rng.randrange(num_vertex) for j in range(3)] for i in range(num_triangles)])
+
+# Best (lowest) wall time of several runs, in seconds
+def time_call(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return(best)
+
+def make_result(benchmark, layout, e, count, num_bytes, seconds):
+    result = {'benchmark': benchmark, 'layout': layout, 'endian': e, 'count': count, 'bytes': num_bytes,\
+        'seconds': seconds}
+    result['per_second'] = count / seconds if seconds > 0 else None
+    result['mb_per_second'] = num_bytes / seconds / 1000000 if seconds > 0 else None
+    return(result)
+
+def benchmark_vb(layout_name, num_vertex, e, repeat, rng):
+    fmt = make_fmt(layout_name)
+    vb = make_vb(fmt, num_vertex, rng)
+    with io.BytesIO() as f:
+        write_vb_stream(vb, f, fmt, e)
+        vb_stream = f.getvalue()
+    # Write with the buffers as read_vb_stream returns them, which is what the scripts pass back in
+    decoded_vb = read_vb_stream(vb_stream, fmt, e)
+    def write():
+        with io.BytesIO() as f:
+            write_vb_stream(decoded_vb, f, fmt, e)
+    return([make_result('read_vb_stream', layout_name, e, num_vertex, len(vb_stream),\
+            time_call(lambda: read_vb_stream(vb_stream, fmt, e), repeat)),\
+        make_result('write_vb_stream', layout_name, e, num_vertex, len(vb_stream), time_call(write, repeat))])
+
+def benchmark_ib(ib_format, num_vertex, e, repeat, rng):
+    fmt = make_fmt('static_float', ib_format)
+    ib = make_ib(min(num_vertex, 65535), num_vertex, rng)
+    with io.BytesIO() as f:
+        write_ib_stream(ib, f, fmt, e)
+        ib_stream = f.getvalue()
+    decoded_ib = read_ib_stream(ib_stream, fmt, e)
+    def write():
+        with io.BytesIO() as f:
+            write_ib_stream(decoded_ib, f, fmt, e)
+    num_indices = len(ib) * 3
+    return([make_result('read_ib_stream', ib_format, e, num_indices, len(ib_stream),\
+            time_call(lambda: read_ib_stream(ib_stream, fmt, e), repeat)),\
+        make_result('write_ib_stream', ib_format, e, num_indices, len(ib_stream), time_call(write, repeat))])
+
+# The fmt codecs work on files, so each benchmark is a loop of iterations calls on a temporary file
+def benchmark_fmt(layout_name, iterations, repeat, tmp_dir):
+    fmt = make_fmt(layout_name)
+    fmt_filename = os.path.join(tmp_dir, layout_name + '.fmt')
+    write_fmt(fmt, fmt_filename)
+    num_bytes = os.path.getsize(fmt_filename) * iterations
+    def read():
+        for i in range(iterations):
+            read_fmt(fmt_filename)
+    def write():
+        for i in range(iterations):
+            write_fmt(fmt, fmt_filename)
+    return([make_result('read_fmt', layout_name, '', iterations, num_bytes, time_call(read, repeat)),\
+        make_result('write_fmt', layout_name, '', iterations, num_bytes, time_call(write, repeat))])
+
+def run_benchmarks(vertex_counts, layouts, repeat = 3, fmt_iterations = 1000, seed = 0):
+    rng = random.Random(seed)
+    results = []
+    for num_vertex in vertex_counts:
+        for e in ['<', '>']:
+            for layout_name in layouts:
+                results.extend(benchmark_vb(layout_name, num_vertex, e, repeat, rng))
+            for ib_format in ib_formats:
+                results.extend(benchmark_ib(ib_format, num_vertex, e, repeat, rng))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for layout_name in layouts:
+            results.extend(benchmark_fmt(layout_name, fmt_iterations, repeat, tmp_dir))
+    return(results)
+
+def result_key(result):
+    return((result['benchmark'], result['layout'], result['endian'], result['count']))
+
+def print_results(results):
+    print("{0:<16} {1:<22} {2:<2} {3:>9} {4:>14} {5:>10}".format('benchmark', 'layout', 'e', 'count', 'count/s', 'MB/s'))
+    for result in results:
+        print("{0:<16} {1:<22} {2:<2} {3:>9} {4:>14,.0f} {5:>10.1f}".format(result['benchmark'], result['layout'],\
+            result['endian'], result['count'], result['per_second'] or 0, result['mb_per_second'] or 0))
+    return
+
+# Returns the benchmarks in results that run at less than threshold times the speed recorded in baseline
+def find_regressions(results, baseline, threshold = 0.8):
+    baseline_speeds = {result_key(x):x['per_second'] for x in baseline['results']}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key in baseline_speeds and not baseline_speeds[key] == None and not result['per_second'] == None\
+                and result['per_second'] < baseline_speeds[key] * threshold:
+            regressions.append({'benchmark': key, 'baseline': baseline_speeds[key], 'current': result['per_second'],\
+                'ratio': result['per_second'] / baseline_speeds[key]})
+    return(regressions)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--counts', help="Comma-separated vertex counts (default 1000,10000,100000)",\
+        default='1000,10000,100000')
+    parser.add_argument('-l', '--layouts', help="Comma-separated layouts (default: all of {0})".format(\
+        ','.join(benchmark_layouts.keys())), default=','.join(benchmark_layouts.keys()))
+    parser.add_argument('-r', '--repeat', help="Runs per benchmark, the best time is kept (default 3)", type=int, default=3)
+    parser.add_argument('-p', '--pure_python', help="Benchmark the pure-Python (struct) codec", action="store_true")
+    parser.add_argument('-o', '--output', help="Write results to this JSON file (default benchmark_results.json)",\
+        default='benchmark_results.json')
+    parser.add_argument('--compare', help="Previous results JSON file to check for regressions")
+    parser.add_argument('--threshold', help="Report benchmarks slower than this fraction of the previous speed (default 0.8)",\
+        type=float, default=0.8)
+    args = parser.parse_args()
+    if args.pure_python == True:
+        lib_fmtibvb.prefer_numpy = False
+    vertex_counts = [int(x) for x in args.counts.split(',')]
+    layouts = [x for x in args.layouts.split(',') if x in benchmark_layouts]
+    results = run_benchmarks(vertex_counts, layouts, repeat = args.repeat)
+    print_results(results)
+    report = {'python': platform.python_version(), 'platform': platform.platform(),\
+        'numpy': lib_fmtibvb.numpy.__version__ if not lib_fmtibvb.numpy == None else None,\
+        'prefer_numpy': lib_fmtibvb.prefer_numpy, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    with open(args.output, 'wb') as f:
+        f.write(json.dumps(report, indent=4).encode("utf-8"))
+    if not args.compare == None:
+        regressions = find_regressions(results, read_struct_from_json(args.compare), args.threshold)
+        for regression in regressions:
+            print("Regression: {0} {1:.0%} of previous speed".format(' '.join([str(x) for x in regression['benchmark']]),\
+                regression['ratio']))
+        if len(regressions) > 0:
+            sys.exit(1)